@@ -0,0 +1,193 @@
+"""
+Synthetic source folders for the benchmarks.
+
+Builds a shoot-like tree of product images: file-ID groups of several
+shots each, named with the 13-digit and 12-character ID patterns that
+splitimg.common.extract_file_id recognises, spread over shoot folders,
+in a weighted mix of formats and resolutions, on white or coloured
+backgrounds. Each (format, resolution, background) image is encoded once
+and its bytes reused, so 100k files are written in seconds.
+
+A finished folder carries a manifest (dataset.json) with its parameters
+and the number of white-background files, and is reused when the same
+parameters are asked for again. A dataset with other parameters, or one
+that was interrupted, is deleted and written again; folders without a
+manifest are never touched.
+
+    python benchmarks/dataset.py /tmp/splitimg-data --count 10000
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import string
+import sys
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from splitimg.common import SUPPORTED_FORMATS, extract_file_id  # noqa: E402
+
+MANIFEST = 'dataset.json'
+DEFAULT_FORMATS = {'.jpg': 75, '.png': 15, '.tiff': 8, '.bmp': 1, '.gif': 1}
+DEFAULT_RESOLUTIONS = [(600, 750), (1000, 1250)]
+# Backgrounds that must not count as white, including near-white studio greys
+NON_WHITE_BACKGROUNDS = [(254, 254, 254), (240, 240, 240), (200, 200, 200), (128, 128, 128), (30, 30, 30),
+                         (230, 220, 200), (180, 200, 230)]
+PIL_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.gif': 'GIF', '.tiff': 'TIFF'}
+
+
+def parse_formats(text):
+    """Parse '.jpg=70,.png=30' (or 'jpg,png' for equal weights) into {extension: weight}."""
+    formats = {}
+    for item in text.split(','):
+        ext, _, weight = item.partition('=')
+        ext = '.' + ext.strip().lstrip('.').lower()
+        if ext not in SUPPORTED_FORMATS:
+            raise argparse.ArgumentTypeError(f"unsupported format: {ext}")
+        formats[ext] = float(weight or 1)
+    return formats
+
+
+def parse_resolutions(text):
+    """Parse '800x1000,1200x1600' into [(800, 1000), (1200, 1600)]."""
+    try:
+        return [tuple(int(side) for side in item.lower().split('x')) for item in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid resolutions: {text}")
+
+
+def render(ext, size, background):
+    """Encode one product shot: a shape with a shadow on a flat background."""
+    width, height = size
+    img = Image.new('RGB', size, background)
+    draw = ImageDraw.Draw(img)
+    box = (width // 4, height // 5, width * 3 // 4, height * 4 // 5)
+    draw.ellipse((box[0] + 10, box[3] - height // 20, box[2] + 10, box[3] + height // 40), fill=(170, 170, 170))
+    draw.rounded_rectangle(box, radius=width // 20, fill=(150, 40, 60), outline=(60, 20, 30), width=6)
+    draw.rectangle((box[0] + width // 10, box[1] + height // 10, box[2] - width // 10, box[1] + height // 5),
+                   fill=(240, 200, 80))
+    if ext == '.gif':
+        img = img.convert('P', palette=Image.Palette.ADAPTIVE)
+    buffer = io.BytesIO()
+    options = {'JPEG': {'quality': 90}, 'TIFF': {'compression': 'tiff_lzw'}}.get(PIL_FORMATS[ext], {})
+    img.save(buffer, PIL_FORMATS[ext], **options)
+    return buffer.getvalue()
+
+
+def file_ids(rng, count, id_mix):
+    """Yield `count` unique file IDs, a share `id_mix` of them 12-character alphanumeric."""
+    seen = set()
+    alphabet = string.ascii_uppercase + string.digits
+    while len(seen) < count:
+        if rng.random() < id_mix:
+            file_id = rng.choice(string.ascii_uppercase) + ''.join(rng.choice(alphabet) for _ in range(11))
+        else:
+            file_id = str(rng.randrange(10 ** 12, 10 ** 13))
+        if file_id not in seen:
+            seen.add(file_id)
+            yield file_id
+
+
+def parameters(count, formats=None, resolutions=None, white_ratio=0.7, group_sizes=(1, 6), id_mix=0.3,
+               per_folder=1000, seed=1):
+    return {'count': count, 'formats': formats or DEFAULT_FORMATS,
+            'resolutions': [list(size) for size in resolutions or DEFAULT_RESOLUTIONS],
+            'white_ratio': white_ratio, 'group_sizes': list(group_sizes), 'id_mix': id_mix,
+            'per_folder': per_folder, 'seed': seed}
+
+
+def fingerprint(params):
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=6).hexdigest()
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(root, manifest):
+    with open(os.path.join(root, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def generate(root, **kwargs):
+    """
+    Write a dataset into `root` (see parameters() for the options) and return
+    its manifest. An existing dataset with the same parameters is reused.
+    """
+    params = parameters(**kwargs)
+    manifest = load_manifest(root)
+    if manifest is not None and manifest['params'] == params and manifest.get('complete'):
+        return manifest
+    if manifest is not None:
+        shutil.rmtree(root)
+    elif os.path.isdir(root) and os.listdir(root):
+        raise ValueError(f"{root} is not empty and is not a benchmark dataset")
+
+    rng = random.Random(params['seed'])
+    extensions = list(params['formats'])
+    weights = [params['formats'][ext] for ext in extensions]
+    resolutions = [tuple(size) for size in params['resolutions']]
+    templates = {}
+    files = groups = white = 0
+    os.makedirs(root, exist_ok=True)
+    write_manifest(root, {'params': params, 'complete': False})
+    ids = file_ids(rng, params['count'], params['id_mix'])
+    while files < params['count']:
+        file_id = next(ids)
+        assert extract_file_id(file_id + '_1.jpg') == file_id
+        groups += 1
+        # A group is one product: same background and resolution for every shot
+        is_white = rng.random() < params['white_ratio']
+        background = (255, 255, 255) if is_white else rng.choice(NON_WHITE_BACKGROUNDS)
+        size = rng.choice(resolutions)
+        for shot in range(1, min(rng.randint(*params['group_sizes']), params['count'] - files) + 1):
+            ext = rng.choices(extensions, weights)[0]
+            key = (ext, size, background)
+            if key not in templates:
+                templates[key] = render(ext, size, background)
+            folder = os.path.join(root, f'shoot_{files // params["per_folder"]:04d}')
+            if files % params['per_folder'] == 0:
+                os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f'{file_id}_{shot}{ext}'), 'wb') as f:
+                f.write(templates[key])
+            files += 1
+            white += is_white
+
+    manifest = {'params': params, 'complete': True, 'fingerprint': fingerprint(params), 'files': files,
+                'groups': groups, 'white_background': white}
+    write_manifest(root, manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='Folder to create the dataset in')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--formats', type=parse_formats, default=None,
+                        help='Weighted formats, e.g. jpg=70,png=30 (default: mostly JPEG, some of each)')
+    parser.add_argument('--resolutions', type=parse_resolutions, default=None,
+                        help='Comma separated WIDTHxHEIGHT choices (default: 600x750,1000x1250)')
+    parser.add_argument('--white-ratio', type=float, default=0.7, help='Share of white-background groups')
+    parser.add_argument('--group-sizes', type=int, nargs=2, default=(1, 6), metavar=('MIN', 'MAX'),
+                        help='Shots per file ID')
+    parser.add_argument('--id-mix', type=float, default=0.3, help='Share of 12-character alphanumeric IDs')
+    parser.add_argument('--per-folder', type=int, default=1000, help='Files per shoot folder')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    manifest = generate(args.root, count=args.count, formats=args.formats, resolutions=args.resolutions,
+                        white_ratio=args.white_ratio, group_sizes=tuple(args.group_sizes), id_mix=args.id_mix,
+                        per_folder=args.per_folder, seed=args.seed)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Network latency benchmark for the move and tag stage.
+
+Stands in for an SMB/NFS share without one: every metadata call under the
+benchmark folder (stat, rename, mkdir, unlink, getxattr, setxattr) sleeps
+for --latency-ms first, the way a call waits for its network round-trip.
+The SplitEngine move and tag stage then runs on the folder once per I/O
+limit. A limit of 1 makes one call at a time.
+
+    python benchmarks/latency_benchmark.py --files 2000 --latency-ms 2 --limits 1 8 32 64
+"""
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from splitimg.engine import SplitEngine  # noqa: E402
+from splitimg.journal import MoveJournal  # noqa: E402
+
+PATCHED_CALLS = ('stat', 'lstat', 'rename', 'replace', 'mkdir', 'unlink', 'getxattr', 'setxattr')
+
+
+class LatencyFS:
+    """Adds `latency` seconds to the os calls in PATCHED_CALLS for paths under `root`."""
+
+    def __init__(self, root, latency):
+        self.root = os.fsencode(os.path.abspath(root))
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.originals = {}
+
+    def __enter__(self):
+        for name in PATCHED_CALLS:
+            original = self.originals[name] = getattr(os, name)
+            setattr(os, name, self.wrap(original))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, original in self.originals.items():
+            setattr(os, name, original)
+
+    def wrap(self, original):
+        def call(path, *args, **kwargs):
+            if isinstance(path, (str, bytes)) and os.fsencode(path).startswith(self.root):
+                with self.lock:
+                    self.calls += 1
+                time.sleep(self.latency)
+            return original(path, *args, **kwargs)
+        return call
+
+
+class Precomputed:
+    """Stands in for ClassificationStage so only moves and tags are measured."""
+
+    def result(self, image_path):
+        return hash(image_path) % 2 == 0
+
+
+def build_files(source, files):
+    shutil.rmtree(source, ignore_errors=True)
+    os.makedirs(source)
+    paths = []
+    for n in range(files):
+        path = os.path.join(source, f'{4000000000000 + n // 4:013d}_{n % 4}.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'\xff\xd8\xff\xd9')
+        paths.append(path)
+    return paths
+
+
+def run(args, limit):
+    """Move and tag every file with `limit` calls in flight, return (seconds, calls)."""
+    source = os.path.join(args.root, 'source')
+    paths = build_files(source, args.files)
+    engine = SplitEngine(source, args.designers, tagger=args.tagger, io_limits={None: limit},
+                         report_format='csv', metrics_format=None)
+    journal = MoveJournal(source)
+    plan = [(index % args.designers, path) for index, path in enumerate(paths)]
+    journal.start(args.designers, plan)
+    with LatencyFS(source, args.latency_ms / 1000) as fs:
+        start = time.perf_counter()
+        engine.open_io()
+        try:
+            engine.create_designer_folders()
+            engine.process(plan, Precomputed(), journal)
+        finally:
+            engine.close_io()
+        elapsed = time.perf_counter() - start
+    engine.close_report(time.time())
+    return elapsed, fs.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--designers', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='Delay added to each metadata call')
+    parser.add_argument('--limits', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--tagger', default='linux-xattr' if sys.platform != 'darwin' else 'finder-xattr')
+    parser.add_argument('--root', default='/tmp/splitimg-latency')
+    args = parser.parse_args()
+
+    baseline = None
+    for limit in args.limits:
+        elapsed, calls = run(args, limit)
+        baseline = baseline or elapsed
+        print(f'I/O limit {limit:>3}  {args.files:>6} files {elapsed:7.2f} s {args.files / elapsed:>9,.0f} files/s'
+              f'  {calls:>7} calls  x{baseline / elapsed:5.1f}')
+    shutil.rmtree(args.root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
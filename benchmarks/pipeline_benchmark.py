@@ -0,0 +1,215 @@
+"""
+Per-stage pipeline benchmark.
+
+Generates (or reuses) a synthetic dataset for each size (see dataset.py),
+hard-links it into a scratch folder and runs the SplitEngine stages one
+after another on it, timing scan, the header prepass, grouping, assignment,
+classification, move, tagging and report separately. The memory per file
+of the tables a run keeps from the scan to the moves (see splitimg.paths)
+is measured with tracemalloc in a separate pass. Results are written
+to a JSON baseline. With --compare, each stage is checked against an earlier
+baseline and the run exits with status 1 when one is slower by more than
+--tolerance.
+
+    python benchmarks/pipeline_benchmark.py --sizes 1000 10000 100000 --output baseline.json
+    python benchmarks/pipeline_benchmark.py --sizes 1000 10000 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import tracemalloc
+
+import PIL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import generate  # noqa: E402
+from splitimg import __version__  # noqa: E402
+from splitimg.assign import BALANCE_MODES  # noqa: E402
+from splitimg.common import designer_name  # noqa: E402
+from splitimg.engine import SplitEngine  # noqa: E402
+from splitimg.headers import read_header  # noqa: E402
+from splitimg.pipeline import ClassificationStage  # noqa: E402
+from splitimg.report import REPORT_FORMATS, open_report  # noqa: E402
+from splitimg.tagging import TAGGERS  # noqa: E402
+from splitimg.transfer import TransferPool  # noqa: E402
+
+STAGES = ('scan', 'header', 'group', 'assign', 'classify', 'move', 'tag', 'report')
+
+
+def link_tree(source, target):
+    """
+    Mirror the dataset with hard links so moves do not consume it. Tags land
+    on the shared inodes, which does not change what later runs measure.
+    """
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.copytree(source, target, copy_function=os.link)
+    os.unlink(os.path.join(target, 'dataset.json'))
+
+
+def run_stages(folder, args):
+    """Run every stage once on `folder` and return {stage: seconds} and the white count."""
+    engine = SplitEngine(folder, args.designers, tagger=args.tagger, workers=args.workers,
+                         balance=args.balance, stable=args.stable)
+    timings = {}
+
+    def timed(stage, fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    image_files = timed('scan', engine.scan)
+    timed('header', lambda: [read_header(image_path) for image_path in image_files])
+    image_groups = timed('group', engine.group, image_files)
+    plan = timed('assign', lambda: engine.plan(engine.assign(image_groups), image_files))
+
+    def classify():
+        with ClassificationStage(engine.workers) as classifier:
+            for image_path in image_files:
+                classifier.submit(image_path)
+            return {image_path: classifier.result(image_path) for image_path in image_files}
+    results = timed('classify', classify)
+
+    def move():
+        engine.create_designer_folders()
+        with TransferPool(engine.transfer_workers) as transfers:
+            moves = [(designer, image_path, transfers.submit(engine.move, image_path, designer))
+                     for designer, image_path in plan]
+            return [(designer, image_path, transfer.result()) for designer, image_path, transfer in moves]
+    moved = timed('move', move)
+
+    def tag():
+        with engine.tagger:
+            for _, image_path, dest_path in moved:
+                engine.tagger.tag(dest_path, engine.count_background(results[image_path]))
+    timed('tag', tag)
+
+    def report():
+        writer = open_report(folder, args.report_format)
+        for designer, image_path, _ in moved:
+            writer.add_file(designer_name(designer), os.path.basename(image_path), results[image_path])
+        writer.close(engine.stats, engine.start_time or time.time())
+    timed('report', report)
+    return timings, engine.stats['white_background']
+
+
+def measure_memory(folder, args):
+    """
+    Scan, group and assign `folder` under tracemalloc and return the bytes
+    per file still held by the plan and its path table, and the peak.
+    Nothing is moved.
+    """
+    engine = SplitEngine(folder, args.designers, balance=args.balance, stable=args.stable,
+                         spill_folder=args.spill_dir)
+    tracemalloc.start()
+    try:
+        image_files = engine.scan()
+        plan = engine.plan(engine.assign(engine.group(image_files)), image_files)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    files = max(len(plan), 1)
+    return {'bytes_per_file': round(retained / files, 1), 'peak_bytes_per_file': round(peak / files, 1)}
+
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'cpus': os.cpu_count(), 'pillow': PIL.__version__, 'splitimg': __version__}
+
+
+def compare(results, baseline, tolerance):
+    """Print each stage against the baseline and return the regressions."""
+    regressions = []
+    for size, result in results.items():
+        base = baseline['results'].get(size)
+        if base is None:
+            print(f'{size:>7}: not in baseline')
+            continue
+        for stage in STAGES:
+            before, after = base['stages'].get(stage), result['stages'][stage]
+            if not before:
+                continue
+            ratio = after['seconds'] / before['seconds']
+            slower = ratio > 1 + tolerance and after['seconds'] - before['seconds'] > 0.05
+            print(f'{size:>7} {stage:9} {before["seconds"]:9.3f} s -> {after["seconds"]:9.3f} s  x{ratio:5.2f}'
+                  f'{"  REGRESSION" if slower else ""}')
+            if slower:
+                regressions.append((size, stage, ratio))
+        before, after = base.get('memory'), result['memory']
+        if before:
+            ratio = after['bytes_per_file'] / before['bytes_per_file']
+            larger = ratio > 1 + tolerance
+            print(f'{size:>7} {"memory":9} {before["bytes_per_file"]:7.0f} B/file -> '
+                  f'{after["bytes_per_file"]:7.0f} B/file  x{ratio:5.2f}{"  REGRESSION" if larger else ""}')
+            if larger:
+                regressions.append((size, 'memory', ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--root', default='/tmp/splitimg-bench', help='Datasets and scratch folders go here')
+    parser.add_argument('--designers', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None, help='Classification processes (default: CPUs)')
+    parser.add_argument('--tagger', choices=sorted(TAGGERS), default=None,
+                        help='Tagging backend (default: the platform default)')
+    parser.add_argument('--balance', choices=BALANCE_MODES, default='groups')
+    parser.add_argument('--stable', action='store_true')
+    parser.add_argument('--report-format', choices=REPORT_FORMATS, default='xlsx')
+    parser.add_argument('--spill-dir', default=None, help='Measure memory with the tables spilled to this folder')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='Baseline JSON file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown per stage before it counts as a regression (default: 0.25)')
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        dataset = os.path.join(args.root, f'dataset-{size}')
+        print(f'{size:>7}: preparing dataset in {dataset}', file=sys.stderr)
+        manifest = generate(dataset, count=size)
+        scratch = os.path.join(args.root, 'scratch')
+        link_tree(dataset, scratch)
+        try:
+            memory = measure_memory(scratch, args)
+            timings, white = run_stages(scratch, args)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        results[str(size)] = {
+            'files': manifest['files'],
+            'groups': manifest['groups'],
+            'dataset': manifest['fingerprint'],
+            'white_expected': manifest['white_background'],
+            'white_classified': white,
+            'stages': {stage: {'seconds': round(seconds, 4),
+                               'files_per_second': round(manifest['files'] / seconds, 1) if seconds else None}
+                       for stage, seconds in timings.items()},
+            'memory': memory,
+        }
+        print(f'{size:>7}: ' + '  '.join(f'{stage} {timings[stage]:.3f}s' for stage in STAGES)
+              + f'  memory {memory["bytes_per_file"]:.0f} B/file (peak {memory["peak_bytes_per_file"]:.0f})')
+
+    baseline = {'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'environment': environment(),
+                'settings': {'designers': args.designers, 'workers': args.workers, 'tagger': args.tagger,
+                             'balance': args.balance, 'stable': args.stable, 'report_format': args.report_format,
+                             'spill_dir': args.spill_dir},
+                'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
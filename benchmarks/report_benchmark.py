@@ -0,0 +1,91 @@
+"""
+Report writer benchmark.
+
+Times the streamed report formats against the previous pandas DataFrame
+report for the same number of files. With --trace-memory the peak Python
+memory of each is measured with tracemalloc, which slows the runs down, so
+time and memory are best measured in separate runs.
+
+    python benchmarks/report_benchmark.py --files 1000000 --designers 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from splitimg.common import designer_name  # noqa: E402
+from splitimg.report import REPORT_FORMATS, open_report, summary_rows  # noqa: E402
+
+
+def make_stats(files, designers):
+    return {'total_images': files, 'white_background': files // 2, 'non_white_background': files - files // 2,
+            'extensions': {'.jpg': files}, 'balance_mode': 'groups',
+            'workloads': {designer_name(i): {'groups': files // designers, 'images': files // designers,
+                                             'weight': files // designers} for i in range(designers)}}
+
+
+def rows(files, designers):
+    for n in range(files):
+        yield designer_name(n % designers), f'{4000000000000 + n // 4:013d}_{n % 4}.jpg', n % 2 == 0
+
+
+def run_streamed(folder, report_format, files, designers):
+    report = open_report(folder, report_format)
+    for designer, image_file, is_white in rows(files, designers):
+        report.add_file(designer, image_file, is_white)
+    start = time.perf_counter()
+    report.close(make_stats(files, designers), time.time())
+    return time.perf_counter() - start
+
+
+def run_pandas(folder, report_format, files, designers):
+    """The previous report: padded per-designer columns built into DataFrames at the end."""
+    import pandas as pd
+
+    designer_files = {designer_name(i): [] for i in range(designers)}
+    for designer, image_file, _ in rows(files, designers):
+        designer_files[designer].append(image_file)
+    start = time.perf_counter()
+    max_files = max(len(files) for files in designer_files.values())
+    data = {designer: files + [''] * (max_files - len(files)) for designer, files in designer_files.items()}
+    with pd.ExcelWriter(os.path.join(folder, 'pandas.xlsx')) as writer:
+        pd.DataFrame(data).to_excel(writer, sheet_name='Designer Files', index=False)
+        summary = summary_rows(make_stats(files, designers), time.time())
+        pd.DataFrame(summary, columns=['Metric', 'Value']).to_excel(writer, sheet_name='Summary', index=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=100_000)
+    parser.add_argument('--designers', type=int, default=8)
+    parser.add_argument('--formats', nargs='+', default=list(REPORT_FORMATS) + ['pandas'])
+    parser.add_argument('--trace-memory', action='store_true')
+    args = parser.parse_args()
+
+    for report_format in args.formats:
+        with tempfile.TemporaryDirectory() as folder:
+            run = run_pandas if report_format == 'pandas' else run_streamed
+            if args.trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                final = run(folder, report_format, args.files, args.designers)
+            except ImportError as e:
+                tracemalloc.stop()
+                print(f'{report_format:8} skipped ({e})')
+                continue
+            total = time.perf_counter() - start
+            line = f'{report_format:8} {args.files:>9} rows  total {total:7.2f} s  final step {final:6.2f} s'
+            if args.trace_memory:
+                line += f'  peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:8.1f} MiB'
+                tracemalloc.stop()
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Scan throughput benchmark.
+
+Builds a tree of empty image-named files and times the old os.walk loop
+against splitimg.scanner with one and several threads.
+
+    python benchmarks/scan_benchmark.py --entries 1000000 --root /tmp/splitimg-scan
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from splitimg.common import SUPPORTED_FORMATS, extract_file_id  # noqa: E402
+from splitimg.scanner import scan_images  # noqa: E402
+
+
+def build_tree(root, entries, per_dir):
+    marker = os.path.join(root, f'.tree-{entries}-{per_dir}')
+    if os.path.exists(marker):
+        return
+    exts = sorted(SUPPORTED_FORMATS)
+    for d in range(-(-entries // per_dir)):
+        folder = os.path.join(root, f'shoot_{d // 100:03d}', f'set_{d:05d}')
+        os.makedirs(folder, exist_ok=True)
+        for i in range(min(per_dir, entries - d * per_dir)):
+            n = d * per_dir + i
+            open(os.path.join(folder, f'{4000000000000 + n // 4:013d}_{n % 4}{exts[n % len(exts)]}'), 'wb').close()
+    open(marker, 'wb').close()
+
+
+def walk_legacy(root):
+    count = 0
+    for folder, _, files in os.walk(root):
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext in SUPPORTED_FORMATS and extract_file_id(file):
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--per-dir', type=int, default=1000)
+    parser.add_argument('--root', default='/tmp/splitimg-scan-bench')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    build_tree(args.root, args.entries, args.per_dir)
+    runs = [('os.walk (previous scan)', lambda: walk_legacy(args.root)),
+            ('scandir, 1 thread', lambda: sum(1 for _ in scan_images(args.root))),
+            (f'scandir, {args.threads} threads', lambda: sum(1 for _ in scan_images(args.root, threads=args.threads)))]
+    for name, run in runs:
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        print(f'{name:28} {count:>9} files {elapsed:7.2f} s {count / elapsed:>12,.0f} files/s')
+
+
+if __name__ == '__main__':
+    main()
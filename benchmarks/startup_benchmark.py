@@ -0,0 +1,73 @@
+"""
+Startup import benchmark.
+
+Imports each module in a fresh interpreter with `python -X importtime`,
+takes the best of several runs and compares the cumulative import time
+with its budget. Modules that must stay light are also checked for heavy
+imports that should only load on first use. Exits with status 1 when a
+budget is exceeded or a heavy module is imported, so it can run in CI.
+
+    python benchmarks/startup_benchmark.py --runs 7
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> cumulative import budget in milliseconds
+BUDGETS = {
+    'splitimg': 15,
+    'splitimg.cli': 80,
+    'splitimg.engine': 250,
+    'main': 600,
+}
+
+# Modules that only the engine needs, kept out of startup
+HEAVY = ('PIL', 'concurrent.futures.process', 'sqlite3', 'openpyxl', 'pandas', 'pyarrow')
+LIGHT = ('splitimg', 'splitimg.cli', 'main')
+
+
+def import_times(module):
+    """Return {module: cumulative microseconds} for one import of `module`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every budget, for slower machines')
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS.items():
+        if module == 'main' and importlib.util.find_spec('PyQt6') is None:
+            print(f'{module:18} skipped (PyQt6 not installed)')
+            continue
+        runs = [import_times(module) for _ in range(args.runs)]
+        best = min(times[module] for times in runs) / 1000
+        limit = budget * args.scale
+        status = 'ok' if best <= limit else 'OVER BUDGET'
+        line = f'{module:18} {best:8.1f} ms  budget {limit:6.0f} ms  {status}'
+        if module in LIGHT:
+            heavy = sorted(name for name in runs[0] if name.split('.')[0] in HEAVY or name in HEAVY)
+            if heavy:
+                status = 'HEAVY IMPORTS'
+                line += f'  imports {", ".join(heavy)}'
+        failed = failed or status != 'ok'
+        print(line)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
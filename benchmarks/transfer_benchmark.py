@@ -0,0 +1,74 @@
+"""
+Cross-volume move benchmark.
+
+Writes a set of files into a source folder and moves them into a target
+folder on another file system, first one by one with shutil.move (what a
+plain rename fallback would do) and then with splitimg.transfer on
+several workers. Point --target at a network mount to measure NAS copies.
+
+    python benchmarks/transfer_benchmark.py --source /tmp/splitimg-src --target /dev/shm/splitimg-dst
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from splitimg.transfer import TransferPool, move_file  # noqa: E402
+
+
+def build_files(root, files, size):
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    data = os.urandom(size)
+    paths = []
+    for n in range(files):
+        path = os.path.join(root, f'{4000000000000 + n:013d}_0.jpg')
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def move_serial(paths, target):
+    for path in paths:
+        shutil.move(path, os.path.join(target, os.path.basename(path)))
+
+
+def move_pool(paths, target, workers):
+    with TransferPool(workers) as pool:
+        futures = [pool.submit(move_file, path, os.path.join(target, os.path.basename(path))) for path in paths]
+        for future in futures:
+            future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--source', default='/tmp/splitimg-transfer-src')
+    parser.add_argument('--target', default='/dev/shm/splitimg-transfer-dst')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    runs = [('shutil.move, serial', lambda paths: move_serial(paths, args.target))]
+    runs += [(f'transfer, {workers} workers', lambda paths, workers=workers: move_pool(paths, args.target, workers))
+             for workers in args.workers]
+    for name, run in runs:
+        paths = build_files(args.source, args.files, size)
+        shutil.rmtree(args.target, ignore_errors=True)
+        os.makedirs(args.target)
+        start = time.perf_counter()
+        run(paths)
+        elapsed = time.perf_counter() - start
+        total = args.files * size / (1024 * 1024)
+        print(f'{name:24} {args.files:>6} files {elapsed:7.2f} s {total / elapsed:>9,.0f} MB/s')
+    shutil.rmtree(args.source, ignore_errors=True)
+    shutil.rmtree(args.target, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
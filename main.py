@@ -1,218 +1,44 @@
 import sys
 import os
-import time
-import pandas as pd
-from datetime import datetime
-from pathlib import Path
+import importlib
+import multiprocessing
+import threading
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                           QPushButton, QLabel, QLineEdit, QFileDialog, QProgressBar, QGroupBox, QScrollArea, QMessageBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
+                           QPushButton, QLabel, QLineEdit, QFileDialog, QProgressBar, QGroupBox, QScrollArea, QMessageBox,
+                           QCheckBox)
+from PyQt6.QtCore import Qt, QObject, pyqtSignal, QTimer
 from PyQt6.QtGui import QIntValidator, QAction, QIcon
-from PIL import Image
-import subprocess
 
-class ImageProcessor(QThread):
-    progress_updated = pyqtSignal(int, str, dict)
-    processing_complete = pyqtSignal(dict)
-    scan_progress = pyqtSignal(int)
-
-    def __init__(self, source_folder, num_designers):
-        super().__init__()
-        self.source_folder = source_folder
-        self.num_designers = num_designers
-        self.supported_formats = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
-        self.stats = {
-            'total_images': 0,
-            'white_background': 0,
-            'non_white_background': 0,
-            'extensions': {},
-            'designer_files': {}
-        }
-
-    def run(self):
+def preload_engine():
+    """Import the processing engine (Pillow, multiprocessing) in the background once the window is up."""
+    def load():
         try:
-            start_time = time.time()
-            
-            # Create designer folders
-            for i in range(self.num_designers):
-                folder_path = os.path.join(self.source_folder, f'Designer_{i+1}')
-                os.makedirs(folder_path, exist_ok=True)
-                self.stats['designer_files'][f'Designer_{i+1}'] = []
-
-            # First scan to count files and group by file ID
-            image_groups = {}  # Dictionary to store groups of images by file ID
-            image_files = []
-            for root, _, files in os.walk(self.source_folder):
-                for file in files:
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in self.supported_formats:
-                        # Extract file ID from filename
-                        file_id = self.extract_file_id(file)
-                        if file_id:
-                            if file_id not in image_groups:
-                                image_groups[file_id] = []
-                            image_groups[file_id].append(os.path.join(root, file))
-                            image_files.append(os.path.join(root, file))
-                            self.stats['extensions'][ext] = self.stats['extensions'].get(ext, 0) + 1
-                            self.scan_progress.emit(len(image_files))
-
-            self.stats['total_images'] = len(image_files)
-            processed = 0
-
-            # Sort groups by ID to ensure consistent distribution
-            sorted_groups = sorted(image_groups.items())
-            total_groups = len(sorted_groups)
-            
-            # Calculate how many groups each designer should get
-            groups_per_designer = total_groups // self.num_designers
-            extra_groups = total_groups % self.num_designers
-
-            # Distribute groups to designers
-            current_designer = 0
-            for i, (file_id, group_files) in enumerate(sorted_groups):
-                # Determine which designer gets this group
-                if i < (groups_per_designer + 1) * extra_groups:
-                    current_designer = i // (groups_per_designer + 1)
-                else:
-                    current_designer = (i - extra_groups) // groups_per_designer
-
-                designer_folder = os.path.join(self.source_folder, f'Designer_{current_designer + 1}')
-                
-                # Process all files in this group
-                for image_path in group_files:
-                    image_file = os.path.basename(image_path)
-                    dest_path = os.path.join(designer_folder, image_file)
-                    self.stats['designer_files'][f'Designer_{current_designer + 1}'].append(image_file)
-
-                    try:
-                        # Move file first
-                        os.rename(image_path, dest_path)
-                        
-                        # Then apply tag based on background
-                        if self.is_white_background(dest_path):
-                            self.stats['white_background'] += 1
-                            self.apply_mac_tag(dest_path, 6)  # Green tag for white background
-                        else:
-                            self.stats['non_white_background'] += 1
-                            self.apply_mac_tag(dest_path, 4)  # Blue tag for non-white background
-                        
-                        processed += 1
-                        elapsed_time = time.time() - start_time
-                        self.progress_updated.emit(processed, self.format_time(elapsed_time), self.stats)
-
-                    except Exception as e:
-                        print(f"Error processing {image_file}: {str(e)}")
-
-            # Create Excel report
-            self.create_excel_report(start_time)
-            self.processing_complete.emit(self.stats)
-
+            importlib.import_module('splitimg.engine')
         except Exception as e:
-            print(f"Error in processing thread: {str(e)}")
+            print(f"Error preloading engine: {str(e)}")
 
-    def format_time(self, seconds):
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    threading.Thread(target=load, name='splitimg-preload', daemon=True).start()
 
-    def apply_mac_tag(self, file_path, tag_index):
-        try:
-            # Convert the file path to a format that AppleScript can understand
-            file_path = file_path.replace('"', '\\"')
-            script = f"""osascript -e 'tell application "Finder" to set label index of (POSIX file "{file_path}" as alias) to {tag_index}'"""
-            os.system(script)  # Changed from subprocess.run to os.system
-        except Exception as e:
-            print(f"Error applying tag: {str(e)}")
+class JobRunner(QObject):
+    """Splits queued folders on a shared splitimg.jobs.JobQueue and relays its callbacks as signals."""
+    progress_updated = pyqtSignal(int, int, str, dict)
+    scan_progress = pyqtSignal(int, int)
+    job_changed = pyqtSignal(int, dict)
 
-    def is_white_background(self, image_path):
-        """
-        Check if either top-left or top-right corner of the image has a white background.
-        """
-        try:
-            with Image.open(image_path) as img:
-                width, height = img.size
-                pixels = img.load()
-                
-                # Check top-left corner (5x5 pixels)
-                is_left_white = True
-                for x in range(5):
-                    for y in range(5):
-                        if pixels[x, y][:3] != (255, 255, 255):  # Compare RGB only
-                            is_left_white = False
-                            break
-                    if not is_left_white:
-                        break
-                
-                # Check top-right corner (5x5 pixels)
-                is_right_white = True
-                for x in range(width-5, width):
-                    for y in range(5):
-                        if pixels[x, y][:3] != (255, 255, 255):  # Compare RGB only
-                            is_right_white = False
-                            break
-                    if not is_right_white:
-                        break
-                
-                return is_left_white or is_right_white
-        except Exception as e:
-            print(f"Error checking white background: {e}")
-            return False
+    def __init__(self):
+        super().__init__()
+        from splitimg.jobs import JobQueue
 
-    def extract_file_id(self, filename):
-        """
-        Extract the file ID from the filename.
-        Returns the first 13 characters if it's a digit, or the first 12 characters if it's alphanumeric.
-        """
-        # Check for 13-digit number
-        if len(filename) >= 13 and filename[:13].isdigit():
-            return filename[:13]
-        # Check for 12-character alphanumeric
-        elif len(filename) >= 12:
-            return filename[:12]
-        return None
-
-    def create_excel_report(self, start_time):
-        try:
-            max_files = max(len(files) for files in self.stats['designer_files'].values())
-            data = {designer: files + [''] * (max_files - len(files)) 
-                   for designer, files in self.stats['designer_files'].items()}
-            
-            df = pd.DataFrame(data)
-            excel_path = os.path.join(self.source_folder, 'SplitImg_Report.xlsx')
-            
-            with pd.ExcelWriter(excel_path) as writer:
-                df.to_excel(writer, sheet_name='Designer Files', index=False)
-                
-                # Format extensions count for display
-                extensions_text = ', '.join(f"{ext} ({count})" for ext, count in self.stats['extensions'].items())
-                
-                # Calculate total processing time
-                total_time = time.time() - start_time
-                hours = int(total_time // 3600)
-                minutes = int((total_time % 3600) // 60)
-                seconds = int(total_time % 60)
-                processing_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                
-                summary_data = {
-                    'Metric': [
-                        'Total Images Processed',
-                        'White Background Images',
-                        'Non-White Background Images',
-                        'Supported Extensions',
-                        'Total Processing Time'
-                    ],
-                    'Value': [
-                        self.stats['total_images'],
-                        self.stats['white_background'],
-                        self.stats['non_white_background'],
-                        extensions_text,
-                        processing_time
-                    ]
-                }
-                pd.DataFrame(summary_data).to_excel(writer, sheet_name='Summary', index=False)
-        except Exception as e:
-            print(f"Error creating Excel report: {str(e)}")
+        # Callbacks arrive on job threads, the signals queue them to the window
+        self.queue = JobQueue(
+            progress_callback=lambda job, processed, elapsed, stats: self.progress_updated.emit(
+                job.id, processed, elapsed, stats),
+            scan_callback=lambda job, count: self.scan_progress.emit(job.id, count),
+            job_callback=lambda job: self.job_changed.emit(job.id, job.summary()))
+        self.queue.start()
+
+    def submit(self, folder, num_designers, priority=0):
+        return self.queue.submit(folder, num_designers, priority, use_cache=True)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -386,6 +212,22 @@ class MainWindow(QMainWindow):
         layout.addWidget(progress_group)
         layout.addSpacing(20)
 
+        # Queued folders, each with its own progress line
+        jobs_group = QGroupBox("Jobs")
+        self.jobs_layout = QVBoxLayout()
+        self.jobs_layout.setSpacing(5)
+        self.no_jobs_label = QLabel("No folders queued. Click Run to add one.")
+        self.jobs_layout.addWidget(self.no_jobs_label)
+        # Folders added with this ticked start before the ones already waiting
+        self.run_next_checkbox = QCheckBox("Run next")
+        self.run_next_checkbox.setStyleSheet("color: white;")
+        self.jobs_layout.addWidget(self.run_next_checkbox)
+        jobs_group.setLayout(self.jobs_layout)
+        layout.addWidget(jobs_group)
+        layout.addSpacing(20)
+        self.job_runner = None
+        self.jobs = {}
+
         # Statistics
         stats_group = QGroupBox("Statistics")
         stats_layout = QVBoxLayout()
@@ -560,6 +402,7 @@ class MainWindow(QMainWindow):
             <li>Enter the number of designers (1-60)</li>
             <li>Click the 'Run' button</li>
             <li>Select the folder containing your images</li>
+            <li>Click 'Run' again to queue more folders, they are split side by side</li>
             <li>Wait for the process to complete</li>
             <li>Check the generated Excel report for details</li>
         </ol>
@@ -576,7 +419,7 @@ class MainWindow(QMainWindow):
             <li>Python 3.x</li>
             <li>PyQt6 for the user interface</li>
             <li>Pillow for image processing</li>
-            <li>pandas for Excel report generation</li>
+            <li>openpyxl for Excel report generation</li>
         </ul>
         <p>For source code access, please contact the development team.</p>
         """
@@ -611,18 +454,43 @@ class MainWindow(QMainWindow):
                     QTimer.singleShot(3000, error_label.deleteLater)
                     return
                 if 1 <= num_designers <= 60:
-                    self.processor = ImageProcessor(folder, num_designers)
-                    self.processor.progress_updated.connect(self.update_progress)
-                    self.processor.processing_complete.connect(self.processing_complete)
-                    self.processor.scan_progress.connect(self.update_scan_progress)
-                    self.processor.start()
-                    self.run_button.setEnabled(False)
-                    self.reset_progress()
+                    self.queue_folder(folder, num_designers)
                 else:
                     print("Please enter a number between 1 and 60")
             except ValueError:
                 print("Please enter a valid number")
 
+    def queue_folder(self, folder, num_designers):
+        """Add a folder to the job queue, it runs next to the folders already queued."""
+        if self.job_runner is None:
+            self.job_runner = JobRunner()
+            self.job_runner.progress_updated.connect(self.update_progress)
+            self.job_runner.scan_progress.connect(self.update_scan_progress)
+            self.job_runner.job_changed.connect(self.update_job)
+        if not any(job['state'] in ('queued', 'running') for job in self.jobs.values()):
+            self.reset_progress()
+        self.no_jobs_label.hide()
+        job = self.job_runner.submit(folder, num_designers, 1 if self.run_next_checkbox.isChecked() else 0)
+        label = QLabel()
+        label.setStyleSheet("color: white; padding: 5px;")
+        self.jobs_layout.addWidget(label)
+        self.jobs[job.id] = {'name': job.name, 'label': label, 'state': 'queued', 'scanned': 0,
+                             'processed': 0, 'stats': None}
+        self.refresh_job(job.id)
+
+    def refresh_job(self, job_id):
+        job = self.jobs[job_id]
+        if job['state'] == 'queued':
+            status = "Queued"
+        elif job['state'] == 'failed':
+            status = "Failed"
+        elif job['stats'] is None:
+            status = f"Scanning ({job['scanned']} files found)"
+        else:
+            verb = 'Done' if job['state'] == 'done' else 'Processing'
+            status = f"{verb} ({job['processed']}/{job['stats']['total_images']})"
+        job['label'].setText(f"{job['name']}: {status}")
+
     def reset_progress(self):
         self.scan_progress_bar.setValue(0)
         self.process_progress_bar.setValue(0)
@@ -630,23 +498,48 @@ class MainWindow(QMainWindow):
         self.white_bg_label.setText("White Background Images: 0")
         self.non_white_bg_label.setText("Non-White Background Images: 0")
         self.time_label.setText("Time Taken: 00:00:00")
-
-    def update_scan_progress(self, count):
+        # Finished jobs make room for the new batch
+        for job_id in [job_id for job_id, job in self.jobs.items() if job['state'] in ('done', 'failed')]:
+            self.jobs.pop(job_id)['label'].deleteLater()
+
+    def update_scan_progress(self, job_id, count):
+        self.jobs[job_id]['scanned'] = count
+        self.refresh_job(job_id)
+        count = sum(job['scanned'] for job in self.jobs.values())
         self.scan_progress_bar.setValue(count)
         self.scan_progress_label.setText(f"Scanning Images... ({count} files found)")
 
-    def update_progress(self, processed, time_taken, stats):
+    def update_progress(self, job_id, processed, time_taken, stats):
+        self.jobs[job_id]['processed'] = processed
+        self.jobs[job_id]['stats'] = stats
+        self.refresh_job(job_id)
+
+        # The bars and statistics add up every job in the queue
+        running = [job for job in self.jobs.values() if job['stats'] is not None]
+        processed = sum(job['processed'] for job in running)
+        total_images = sum(job['stats']['total_images'] for job in running)
+        extensions = {}
+        for job in running:
+            for ext, count in job['stats']['extensions'].items():
+                extensions[ext] = extensions.get(ext, 0) + count
         self.process_progress_bar.setValue(processed)
-        self.process_progress_label.setText(f"Processing Images... ({processed}/{stats['total_images']})")
-        self.total_images_label.setText(f"Total Images Processed: {stats['total_images']}")
-        self.white_bg_label.setText(f"White Background Images: {stats['white_background']}")
-        self.non_white_bg_label.setText(f"Non-White Background Images: {stats['non_white_background']}")
+        self.process_progress_label.setText(f"Processing Images... ({processed}/{total_images})")
+        self.total_images_label.setText(f"Total Images Processed: {total_images}")
+        white = sum(job['stats']['white_background'] for job in running)
+        non_white = sum(job['stats']['non_white_background'] for job in running)
+        self.white_bg_label.setText(f"White Background Images: {white}")
+        self.non_white_bg_label.setText(f"Non-White Background Images: {non_white}")
         self.time_label.setText(f"Time Taken: {time_taken}")
-        self.extensions_label.setText(f"Supported Extensions: {', '.join(f'{ext} ({count})' for ext, count in stats['extensions'].items())}")
+        found = ', '.join(f'{ext} ({count})' for ext, count in extensions.items())
+        self.extensions_label.setText(f"Supported Extensions: {found}")
 
-    def processing_complete(self, stats):
-        self.run_button.setEnabled(True)
-        self.process_progress_bar.setValue(stats['total_images'])
+    def update_job(self, job_id, summary):
+        if job_id not in self.jobs:
+            return
+        self.jobs[job_id]['state'] = summary['state']
+        self.refresh_job(job_id)
+        if summary['state'] == 'failed':
+            QMessageBox.warning(self, "Error", f"Could not split {self.jobs[job_id]['name']}: {summary['error']}")
 
     def validate_designer_input(self):
         """Validate the designer input and enable/disable the run button accordingly"""
@@ -657,7 +550,10 @@ class MainWindow(QMainWindow):
             self.run_button.setEnabled(False)
 
 if __name__ == '__main__':
+    # Classification worker processes re-enter the frozen app bundle
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    QTimer.singleShot(0, preload_engine)
     sys.exit(app.exec())
@@ -12,7 +12,7 @@ OPTIONS = {
         'NSHumanReadableCopyright': '© 2023 SaksGlobal',
         'CFBundleDocumentTypes': [],
     },
-    'packages': ['PyQt6', 'PIL', 'pandas'],
+    'packages': ['PyQt6', 'PIL', 'openpyxl', 'splitimg'],
     'excludes': ['PyInstaller', '_webp'],
     'includes': ['PIL'],
 }
@@ -22,5 +22,7 @@ setup(
     data_files=DATA_FILES,
     options={'py2app': OPTIONS},
     setup_requires=['py2app'],
-    name='SplitImg Pro'
+    name='SplitImg Pro',
+    packages=['splitimg'],
+    entry_points={'console_scripts': ['splitimg = splitimg.cli:main']},
 ) 
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""
+Headless core of SplitImg Pro.
+
+Nothing in this package imports Qt, so it can run on servers and from scripts.
+SplitEngine is imported on first use, since the engine pulls in Pillow and
+multiprocessing and a GUI wants to show its window before paying for them.
+"""
+from .common import SUPPORTED_FORMATS, extract_file_id, format_time
+
+__version__ = '3.0.0'
+
+__all__ = ['SplitEngine', 'SUPPORTED_FORMATS', 'extract_file_id', 'format_time']
+
+
+def __getattr__(name):
+    if name == 'SplitEngine':
+        from .engine import SplitEngine
+        return SplitEngine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
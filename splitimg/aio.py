@@ -0,0 +1,215 @@
+"""
+Concurrent file system calls for high-latency storage.
+
+On SMB/NFS every rename, mkdir, stat and xattr write is a network
+round-trip, so a run is bound by latency rather than bandwidth. AsyncIO runs
+an asyncio event loop on a background thread and offloads blocking calls
+to worker threads under a semaphore, keeping up to `limit` of them in flight
+at once. It has the submit() of an executor, so TransferPool and the job
+queue can use it in place of a thread pool.
+
+The limit is chosen per mount: network file systems get DEFAULT_NETWORK_LIMIT
+calls in flight, local disks DEFAULT_LOCAL_LIMIT. Either can be overridden
+for a path, see io_limit_for(). The job queue shares one AsyncIO between
+its runs, each through an IOView holding the limit of its mounts.
+"""
+import asyncio
+import functools
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LOCAL_LIMIT = 4
+DEFAULT_NETWORK_LIMIT = 32
+
+# File system types where each call is a network round-trip
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afpfs', 'webdav', 'davfs', '9p', 'ceph',
+                       'glusterfs', 'fuse.sshfs', 'fuse.rclone', 'lustre'}
+
+
+class _Calls:
+    """submit() and starmap() over the call() coroutine of an AsyncIO or an IOView."""
+
+    async def gather(self, fn, items):
+        return await asyncio.gather(*(self.call(fn, *item) for item in items), return_exceptions=True)
+
+    def submit(self, fn, *args):
+        """Start `fn(*args)` and return a concurrent.futures.Future for its result."""
+        return asyncio.run_coroutine_threadsafe(self.call(fn, *args), self.loop)
+
+    def starmap(self, fn, items):
+        """
+        Run `fn(*item)` for every item concurrently and wait for all of them.
+        Returns the results in order, with the exception in place of the
+        result for calls that raised.
+        """
+        items = list(items)
+        if not items:
+            return []
+        return asyncio.run_coroutine_threadsafe(self.gather(fn, items), self.loop).result()
+
+
+class AsyncIO(_Calls):
+    """
+    Runs blocking calls with at most `limit` in flight. Use as a context
+    manager, or call start() and close().
+
+    One AsyncIO can be shared by several runs, see view(): each gets the
+    limit of the mounts it touches, and runs on the same mounts share it.
+    """
+
+    def __init__(self, limit=DEFAULT_LOCAL_LIMIT, io_limits=None):
+        self.limit = max(1, limit)
+        # Overrides of the per-mount limits of views, see io_limit_for()
+        self.io_limits = io_limits
+        # (mount points, limit) -> IOView
+        self.views = {}
+        self.views_lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.semaphore = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix='splitimg-io')
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            # Created on the loop's thread, asyncio primitives belong to their loop
+            self.semaphore = asyncio.Semaphore(self.limit)
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run_loop, name='splitimg-io-loop', daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def close(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        # Calls still waiting when a run is aborted are cancelled, not left pending
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+        self.executor.shutdown(wait=True)
+        self.loop = None
+        self.thread = None
+        self.views = {}
+
+    def view(self, paths):
+        """
+        The IOView for a run touching `paths`, limited to io_limit_for()
+        calls in flight. Runs on the same mounts get the same view, so
+        together they stay within the limit of those mounts.
+        """
+        limit = io_limit_for(paths, self.io_limits)
+        key = (tuple(sorted({mount_point(path) for path in paths})), limit)
+        with self.views_lock:
+            view = self.views.get(key)
+            if view is None:
+                view = self.views[key] = IOView(self, limit)
+            return view
+
+    async def call(self, fn, *args):
+        """Run `fn(*args)` on a worker thread once a slot is free."""
+        async with self.semaphore:
+            return await self.loop.run_in_executor(self.executor, functools.partial(fn, *args))
+
+
+class IOView(_Calls):
+    """Calls of the runs sharing an AsyncIO on the same mounts, at most `limit` of them in flight."""
+
+    def __init__(self, io, limit):
+        self.io = io
+        self.limit = max(1, min(limit, io.limit))
+        self.semaphore = None
+
+    @property
+    def loop(self):
+        return self.io.loop
+
+    async def call(self, fn, *args):
+        if self.semaphore is None:
+            # Made on the loop's thread the first time it is needed
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            return await self.io.call(fn, *args)
+
+
+def mount_point(path):
+    """The mount point holding `path`, or the nearest existing parent."""
+    path = os.path.realpath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _mount_types():
+    """Map of mount point -> file system type."""
+    mounts = {}
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/mounts', encoding='utf-8') as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3:
+                        # Spaces in mount points are escaped as \040
+                        mounts[fields[1].replace('\\040', ' ')] = fields[2]
+        else:
+            # "//user@nas/share on /Volumes/share (smbfs, nodev, nosuid, mounted by user)"
+            output = subprocess.run(['mount'], capture_output=True, text=True).stdout
+            for line in output.splitlines():
+                _, _, rest = line.partition(' on ')
+                point, _, options = rest.rpartition(' (')
+                if point:
+                    mounts[point] = options.split(',')[0].strip()
+    except Exception as e:
+        print(f"Error reading mounts: {str(e)}", file=sys.stderr)
+    return mounts
+
+
+def filesystem_type(path):
+    return _mount_types().get(mount_point(path))
+
+
+def io_limit_for(paths, io_limits=None):
+    """
+    Calls to keep in flight for a run touching `paths`, the highest limit of
+    their mounts. `io_limits` overrides the defaults: a path key applies to
+    everything under it (the longest match wins) and a None key to every
+    path without one.
+    """
+    io_limits = io_limits or {}
+    mounts = _mount_types()
+    limits = []
+    for path in paths:
+        real_path = os.path.realpath(path)
+        matches = [prefix for prefix in io_limits
+                   if prefix is not None and (real_path + os.sep).startswith(os.path.realpath(prefix).rstrip(os.sep) + os.sep)]
+        if matches:
+            limits.append(io_limits[max(matches, key=len)])
+        elif None in io_limits:
+            limits.append(io_limits[None])
+        elif mounts.get(mount_point(path)) in NETWORK_FILESYSTEMS:
+            limits.append(DEFAULT_NETWORK_LIMIT)
+        else:
+            limits.append(DEFAULT_LOCAL_LIMIT)
+    return max(limits, default=DEFAULT_LOCAL_LIMIT)
@@ -0,0 +1,140 @@
+"""
+Strategies for distributing file-ID groups across designers.
+
+Every strategy returns a list of (designer index, file ID, group files)
+sorted by file ID, so the move order stays the same whichever is used.
+"""
+import hashlib
+import heapq
+import math
+import os
+import sys
+
+from .common import designer_name
+from .headers import read_header
+
+BALANCE_MODES = ('groups', 'images', 'bytes', 'pixels')
+
+
+def assign_contiguous(image_groups, num_designers):
+    """
+    Give each designer a contiguous block of sorted file IDs, balanced by
+    group count only. This is how SplitImg has always split folders.
+    """
+    # Sort groups by ID to ensure consistent distribution
+    sorted_groups = sorted(image_groups.items())
+    total_groups = len(sorted_groups)
+
+    # Calculate how many groups each designer should get
+    groups_per_designer = total_groups // num_designers
+    extra_groups = total_groups % num_designers
+
+    assignments = []
+    for i, (file_id, group_files) in enumerate(sorted_groups):
+        if i < (groups_per_designer + 1) * extra_groups:
+            designer = i // (groups_per_designer + 1)
+        else:
+            designer = (i - extra_groups) // groups_per_designer
+        assignments.append((designer, file_id, group_files))
+    return assignments
+
+
+def assign_weighted(image_groups, num_designers, group_weights):
+    """
+    Greedy longest-processing-time assignment: the heaviest groups go first,
+    each to the designer with the least work so far. Ties are broken by
+    file ID and designer number so the result is deterministic.
+    """
+    loads = [(0, designer) for designer in range(num_designers)]
+    heapq.heapify(loads)
+    chosen = {}
+    for file_id in sorted(image_groups, key=lambda file_id: (-group_weights[file_id], file_id)):
+        load, designer = heapq.heappop(loads)
+        chosen[file_id] = designer
+        heapq.heappush(loads, (load + group_weights[file_id], designer))
+    return [(chosen[file_id], file_id, group_files) for file_id, group_files in sorted(image_groups.items())]
+
+
+def rendezvous_score(file_id, designer, weight=1.0):
+    """
+    Weighted rendezvous (highest random weight) score of a group for a designer.
+    The hash is turned into a uniform number in (0, 1) and scaled with
+    -weight / ln(u), so a designer with twice the weight wins twice as often.
+    """
+    digest = hashlib.blake2b(f'{file_id}/{designer_name(designer)}'.encode(), digest_size=8).digest()
+    u = (int.from_bytes(digest, 'big') + 0.5) / 2 ** 64
+    return -weight / math.log(u)
+
+
+def route_group(file_id, num_designers, designer_weights=None):
+    """
+    Pick the designer for one file ID without looking at any other group.
+
+    Adding or removing a designer only moves the groups that designer wins
+    or loses, about 1/N of them, so new arrivals can be routed on their own.
+    """
+    weights = designer_weights or [1.0] * num_designers
+    return max(range(num_designers), key=lambda designer: (rendezvous_score(file_id, designer, weights[designer]),
+                                                           -designer))
+
+
+def assign_stable(image_groups, num_designers, designer_weights=None):
+    """Assign every group with route_group, see there."""
+    if designer_weights is not None and len(designer_weights) != num_designers:
+        raise ValueError("Expected one weight per designer")
+    return [(route_group(file_id, num_designers, designer_weights), file_id, group_files)
+            for file_id, group_files in sorted(image_groups.items())]
+
+
+def file_weight(image_path, mode, sizes=None, pixels=None):
+    """
+    Work estimate for one file: 1 image, its size in bytes, or its pixel
+    count. `sizes` and `pixels` hold values the header prepass already read.
+    """
+    if mode == 'images':
+        return 1
+    if mode == 'bytes':
+        if sizes is not None and image_path in sizes:
+            return sizes[image_path]
+        try:
+            return os.path.getsize(image_path)
+        except OSError:
+            return 0
+    if mode == 'pixels':
+        if pixels is not None and image_path in pixels:
+            return pixels[image_path]
+        header = read_header(image_path)
+        if not header.ok:
+            print(f"Error reading image size: {header.error}", file=sys.stderr)
+        return header.pixels
+    raise ValueError(f"Unknown balance mode: {mode}")
+
+
+def group_weights(image_groups, mode, sizes=None, pixels=None):
+    """Return the work estimate of every group for a balance mode other than 'groups'."""
+    return {file_id: sum(file_weight(image_path, mode, sizes, pixels) for image_path in group_files)
+            for file_id, group_files in image_groups.items()}
+
+
+def assign_groups(image_groups, num_designers, mode='groups', weights=None):
+    """Assign groups with the given balance mode, see BALANCE_MODES."""
+    if mode == 'groups':
+        return assign_contiguous(image_groups, num_designers)
+    return assign_weighted(image_groups, num_designers, weights)
+
+
+def designer_workloads(assignments, num_designers, weights=None):
+    """
+    Return per-designer totals (groups, images and the balanced weight) and
+    the imbalance ratio, the heaviest designer's weight over the mean.
+    Without `weights` every group weighs one.
+    """
+    totals = [{'groups': 0, 'images': 0, 'weight': 0} for _ in range(num_designers)]
+    for designer, file_id, group_files in assignments:
+        total = totals[designer]
+        total['groups'] += 1
+        total['images'] += len(group_files)
+        total['weight'] += weights[file_id] if weights is not None else 1
+    mean = sum(total['weight'] for total in totals) / num_designers if num_designers else 0
+    imbalance = max(total['weight'] for total in totals) / mean if mean else 1.0
+    return totals, round(imbalance, 3)
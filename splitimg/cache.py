@@ -0,0 +1,131 @@
+"""
+On-disk cache of background classification results.
+
+Entries are keyed by file identity (device, inode, size, mtime), which a
+rename keeps, so results survive the move into the Designer folders. With
+`hash_content` enabled a content digest is stored too, and files that were
+copied rather than renamed are found by digest.
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+from .classify import CLASSIFIER_VERSION
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_MAX_AGE_DAYS = 90
+
+
+def default_cache_path():
+    if sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches/SplitImg')
+    else:
+        base = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'splitimg')
+    return os.path.join(base, 'classification.sqlite')
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ClassificationCache:
+    def __init__(self, path=None, hash_content=False, classifier=CLASSIFIER_VERSION,
+                 max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path or default_cache_path()
+        self.hash_content = hash_content
+        self.classifier = classifier
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.pending = []
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS classifications (
+                classifier TEXT NOT NULL,
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT,
+                result INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (classifier, device, inode, size, mtime_ns)
+            )""")
+        self.db.execute('CREATE INDEX IF NOT EXISTS by_digest ON classifications (classifier, digest, size)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS by_last_used ON classifications (last_used)')
+
+    def key(self, file_path, stat_result=None):
+        """Return the identity key for a file, or None if it cannot be read."""
+        try:
+            st = stat_result or os.stat(file_path)
+            digest = file_digest(file_path) if self.hash_content else None
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, digest)
+
+    def get(self, key):
+        """Return the cached result for `key`, or None on a miss."""
+        if key is None:
+            self.misses += 1
+            return None
+        device, inode, size, mtime_ns, digest = key
+        row = self.db.execute(
+            'SELECT result FROM classifications WHERE classifier=? AND device=? AND inode=? AND size=? AND mtime_ns=?',
+            (self.classifier, device, inode, size, mtime_ns)).fetchone()
+        if row is None and digest is not None:
+            row = self.db.execute(
+                'SELECT result FROM classifications WHERE classifier=? AND digest=? AND size=?',
+                (self.classifier, digest, size)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Refresh last_used so eviction by age keeps files still in use
+        self.pending.append((*key, row[0]))
+        return row[0]
+
+    def put(self, key, result):
+        if key is not None:
+            self.pending.append((*key, int(result)))
+            if len(self.pending) >= 1000:
+                self.commit()
+
+    def commit(self):
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(self.classifier, *row, now) for row in rows])
+
+    def evict(self):
+        """Drop entries older than max_age_days, then the least recently used beyond max_entries."""
+        with self.db:
+            if self.max_age_days:
+                self.db.execute('DELETE FROM classifications WHERE last_used < ?',
+                                (time.time() - self.max_age_days * 86400,))
+            if self.max_entries:
+                self.db.execute("""
+                    DELETE FROM classifications WHERE rowid IN (
+                        SELECT rowid FROM classifications ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                                (self.max_entries,))
+
+    def close(self):
+        try:
+            self.commit()
+            self.evict()
+        finally:
+            self.db.close()
@@ -0,0 +1,754 @@
+import io
+import struct
+import sys
+import time
+from PIL import Image, ImageChops, TiffImagePlugin, TiffTags
+
+from .common import BACKGROUND_GRAY, BACKGROUND_OTHER, BACKGROUND_WHITE
+from .headers import (TIFF_NEW_SUBFILE_TYPE, HeaderFile, exif_thumbnail, read_jpeg_frame,
+                      read_tiff_directories, sniff_format)
+
+CORNER_SIZE = 5
+REGIONS = ('corners', 'top')
+GRAY_LEVEL = 128
+DEFAULT_GRAY_TOLERANCE = 16
+# Decoded bytes one file may take, see MemoryLimitError
+DEFAULT_MEMORY_LIMIT = 512 * 2 ** 20
+# Decoded bytes above which an embedded preview is used instead, when there is one
+DEFAULT_PREVIEW_THRESHOLD = 32 * 2 ** 20
+# How far a preview's aspect ratio may be off, EXIF thumbnails are often letterboxed
+PREVIEW_ASPECT_TOLERANCE = 0.02
+
+# Bump when the classifier changes so older cached results are not reused
+CLASSIFIER_VERSION = 'corners-5px-v3'
+
+# TIFF tags copied into the reduced file built by _open_tiff_top_rows
+TIFF_LAYOUT_TAGS = (256, 258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 530, 532)
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_COMPRESSION = 259
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_PLANAR_CONFIGURATION = 284
+TIFF_ROWS_PER_STRIP = 278
+TIFF_STRIP_OFFSETS = 273
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_TILE_WIDTH = 322
+TIFF_TILE_LENGTH = 323
+TIFF_TILE_OFFSETS = 324
+TIFF_TILE_BYTE_COUNTS = 325
+# Tags read from the file's own directories, everything _build_tiff needs
+TIFF_SAMPLE_TAGS = {*TIFF_LAYOUT_TAGS, TIFF_IMAGE_LENGTH, TIFF_ROWS_PER_STRIP, TIFF_STRIP_OFFSETS,
+                    TIFF_STRIP_BYTE_COUNTS, TIFF_TILE_WIDTH, TIFF_TILE_LENGTH, TIFF_TILE_OFFSETS,
+                    TIFF_TILE_BYTE_COUNTS, TIFF_NEW_SUBFILE_TYPE}
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class BackgroundClassifier:
+    """
+    Decides the background class of an image from the top-left and
+    top-right `size` x `size` corner patches, or from the whole top strip
+    `size` rows high with region='top'.
+
+    A pixel is white when every channel is at least 255 - `tolerance`, and
+    gray when every channel is within `gray_tolerance` of 128. A region is
+    white (or gray) when at least `coverage` of its pixels are, and the image
+    is white when any of its regions is. Gray is only reported with `gray`
+    set. The defaults are the classic rule: white when either corner is pure
+    white.
+
+    Pixels are evaluated by Pillow's C operations: the channel extremes of
+    each region when every pixel has to pass, otherwise pixel counts on one
+    strip made of the regions of many images, see classify_many().
+
+    Decoding a file may take at most `memory_limit` bytes. With `previews`,
+    files whose top rows would decode to more than `preview_threshold`
+    bytes are sampled from an embedded preview instead, see open_sample().
+    """
+
+    def __init__(self, region='corners', size=CORNER_SIZE, tolerance=0, coverage=1.0, gray=False,
+                 gray_tolerance=DEFAULT_GRAY_TOLERANCE, previews=True, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 preview_threshold=DEFAULT_PREVIEW_THRESHOLD):
+        if region not in REGIONS:
+            raise ValueError(f"Unknown background region: {region}")
+        if size < 1:
+            raise ValueError("The patch size must be at least 1 pixel")
+        if not 0 <= tolerance <= 255 or not 0 <= gray_tolerance <= 127:
+            raise ValueError("Tolerances must be between 0 and 255 (127 for gray)")
+        if not 0 < coverage <= 1:
+            raise ValueError("Coverage must be above 0 and at most 1")
+        self.region = region
+        self.size = size
+        self.tolerance = tolerance
+        self.coverage = coverage
+        self.gray = gray
+        self.gray_tolerance = gray_tolerance
+        self.previews = previews
+        self.memory_limit = memory_limit
+        self.preview_threshold = min(preview_threshold, memory_limit)
+        self.white_table = [255 if value >= 255 - tolerance else 0 for value in range(256)]
+        self.gray_table = [255 if abs(value - GRAY_LEVEL) <= gray_tolerance else 0 for value in range(256)]
+
+    @property
+    def version(self):
+        """Cache key of the classifier and its settings."""
+        if ((self.region, self.size, self.tolerance, self.coverage, self.gray, self.previews, self.memory_limit)
+                == ('corners', CORNER_SIZE, 0, 1.0, False, True, DEFAULT_MEMORY_LIMIT)):
+            return CLASSIFIER_VERSION
+        version = f'{self.region}-{self.size}px-t{self.tolerance}-c{self.coverage:g}'
+        if self.gray:
+            version += f'-gray{self.gray_tolerance}'
+        if not self.previews:
+            version += '-full'
+        if self.memory_limit != DEFAULT_MEMORY_LIMIT:
+            version += f'-m{self.memory_limit >> 20}'
+        return version + '-v3'
+
+    @property
+    def rows(self):
+        """Rows from the top of the image that the regions cover."""
+        return self.size
+
+    def crop(self, img, scale=1.0):
+        """
+        Copy the regions out of a loaded image, as RGB. `scale` is the size of
+        a preview relative to the image, patches shrink with it.
+        """
+        width, height = img.size
+        patch = max(1, round(self.size * scale))
+        rows = min(patch, height)
+        if self.region == 'top':
+            boxes = [(0, 0, width, rows)]
+        else:
+            size = min(patch, width)
+            boxes = [(0, 0, size, rows), (width - size, 0, width, rows)]
+        if img.mode == 'RGB':
+            return [img.crop(box) for box in boxes]
+        # Palette, grayscale, CMYK and 16-bit images are compared in RGB too
+        return [img.crop(box).convert('RGB') for box in boxes]
+
+    def classify(self, img):
+        """Background class of one loaded image."""
+        return self.classify_many([self.crop(img)])[0]
+
+    def classify_many(self, cropped):
+        """
+        Background classes for many images, given as the crop() of each. All
+        regions are pasted side by side into one strip so that the channel
+        tests run once for the whole batch.
+        """
+        if self.coverage == 1:
+            # Every pixel has to pass, so the channel extremes of each region decide
+            return [self.classify_extrema(regions) for regions in cropped]
+
+        boxes = []
+        x = 0
+        for regions in cropped:
+            image_boxes = []
+            for region in regions:
+                width, height = region.size
+                image_boxes.append((x, 0, x + width, height))
+                x += width
+            boxes.append(image_boxes)
+        if not x:
+            return [BACKGROUND_OTHER] * len(cropped)
+
+        strip = Image.new('RGB', (x, self.size))
+        for regions, image_boxes in zip(cropped, boxes):
+            for region, box in zip(regions, image_boxes):
+                strip.paste(region, box[:2])
+        red, green, blue = strip.split()
+        # A pixel is as white as its darkest channel
+        white_mask = ImageChops.darker(ImageChops.darker(red, green), blue).point(self.white_table)
+        if self.gray:
+            gray_mask = ImageChops.darker(ImageChops.darker(red.point(self.gray_table), green.point(self.gray_table)),
+                                     blue.point(self.gray_table))
+
+        flat = [box for image_boxes in boxes for box in image_boxes]
+        white = iter(self.covered(white_mask, flat))
+        gray = iter(self.covered(gray_mask, flat)) if self.gray else None
+        results = []
+        for image_boxes in boxes:
+            is_white = [next(white) for _ in image_boxes]
+            is_gray = [next(gray) for _ in image_boxes] if gray is not None else []
+            if any(is_white):
+                results.append(BACKGROUND_WHITE)
+            elif any(is_gray):
+                results.append(BACKGROUND_GRAY)
+            else:
+                results.append(BACKGROUND_OTHER)
+        return results
+
+    def classify_extrema(self, regions):
+        white = 255 - self.tolerance
+        low, high = GRAY_LEVEL - self.gray_tolerance, GRAY_LEVEL + self.gray_tolerance
+        extrema = [region.getextrema() for region in regions]
+        if any(all(band[0] >= white for band in bands) for bands in extrema):
+            return BACKGROUND_WHITE
+        if self.gray and any(all(band[0] >= low and band[1] <= high for band in bands) for bands in extrema):
+            return BACKGROUND_GRAY
+        return BACKGROUND_OTHER
+
+    def covered(self, mask, boxes):
+        """For each box, whether at least `coverage` of it is set in a 0/255 mask."""
+        size = self.size
+        if size * size <= 127 and all(box[2] - box[0] == size and box[3] == size for box in boxes):
+            # All boxes are size x size cells side by side: one box-filter
+            # reduce gives every cell's mean, close enough to recover its count
+            means = mask.reduce(size).getdata()
+            counts = [round(means[box[0] // size] * size * size / 255) for box in boxes]
+        else:
+            counts = [mask.crop(box).histogram()[255] for box in boxes]
+        return [count > 0 and count >= self.coverage * (box[2] - box[0]) * (box[3] - box[1])
+                for count, box in zip(counts, boxes)]
+
+
+DEFAULT_CLASSIFIER = BackgroundClassifier()
+
+
+def is_white_background(image_path):
+    """
+    Check if either top-left or top-right corner of the image has a white background.
+
+    Only the rows holding the corners are decoded when the format allows it.
+    """
+    return classify_timed(image_path)[0] == BACKGROUND_WHITE
+
+
+def classify_timed(image_path, classifier=DEFAULT_CLASSIFIER):
+    """
+    Classify an image and measure it.
+
+    Returns (background class, decode seconds, classify seconds, bytes read),
+    where bytes read counts what the decoders asked for, not whole files.
+    """
+    start = time.perf_counter()
+    regions, bytes_read = decode_regions(image_path, classifier)
+    decoded = time.perf_counter()
+    result = classifier.classify_many([regions])[0] if regions else BACKGROUND_OTHER
+    return result, decoded - start, time.perf_counter() - decoded, bytes_read
+
+
+def decode_regions(image_path, classifier=DEFAULT_CLASSIFIER):
+    """
+    Decode the top rows of an image and return (its crop() regions, bytes
+    read). Regions are None when the image cannot be read.
+    """
+    source = None
+    try:
+        with open(image_path, 'rb') as f:
+            source = _CountingFile(f)
+            img, scale = open_sample(source, classifier)
+            with img:
+                img.load()
+                regions = classifier.crop(img, scale)
+    except Exception as e:
+        print(f"Error checking white background: {e}", file=sys.stderr)
+        regions = None
+    return regions, source.bytes_read if source else 0
+
+
+class MemoryLimitError(Exception):
+    """Decoding a file would take more memory than allowed."""
+
+    def __init__(self, needed, limit):
+        super().__init__(f"decoding needs {needed / 2 ** 20:.0f} MB, over the {limit / 2 ** 20:.0f} MB limit")
+
+
+def open_sample(source, classifier=DEFAULT_CLASSIFIER):
+    """
+    Open the pixels `classifier` samples from a binary file object: its top
+    rows, or for huge files an embedded preview. Returns (image, scale),
+    the scale being the preview's width over the image's.
+
+    TIFF directories are read by splitimg.headers, which skips large private
+    tags such as Photoshop layers that Pillow would load in full. A TIFF
+    whose top strips would decode to more than the preview threshold uses
+    its largest reduced-resolution image (a SubIFD or a later page marked
+    as reduced) that fits; a progressive JPEG uses its EXIF thumbnail, or
+    libjpeg's 1/8 scale decode. Previews are only taken when their aspect
+    ratio matches the image. MemoryLimitError is raised when what would be
+    decoded is over the classifier's memory limit.
+    """
+    header_file = HeaderFile(source)
+    file_format = sniff_format(header_file.head)
+    try:
+        if file_format == 'TIFF':
+            sample = _open_tiff_sample(source, header_file, classifier)
+        elif file_format == 'JPEG':
+            sample = _open_jpeg_sample(source, header_file, classifier)
+        else:
+            sample = None
+    except MemoryLimitError:
+        raise
+    except Exception:
+        # Anything the header readers do not follow is left to Pillow
+        sample = None
+    if sample is not None:
+        return sample
+    source.seek(0)
+    return open_top_rows(source, classifier.rows, classifier.memory_limit), 1.0
+
+
+def _open_tiff_sample(source, header_file, classifier):
+    directories = list(read_tiff_directories(header_file, TIFF_SAMPLE_TAGS))
+    main = next((directory for directory in directories if not directory.reduced), directories[0])
+    cost = _tiff_decoded_bytes(main, classifier.rows)
+    if classifier.previews and cost > classifier.preview_threshold:
+        preview = _pick_preview(main.width, main.height, [
+            (directory, directory.width, directory.height, _tiff_decoded_bytes(directory, directory.height))
+            for directory in directories if directory is not main and 0 < directory.width < main.width], classifier)
+        if preview is not None:
+            img = _build_tiff(preview, source, preview.height)
+            if img is not None:
+                return img, preview.width / main.width
+    _check_memory(cost, classifier.memory_limit)
+    img = _build_tiff(main, source, classifier.rows)
+    return (img, 1.0) if img is not None else None
+
+
+def _open_jpeg_sample(source, header_file, classifier):
+    frame = read_jpeg_frame(header_file)
+    if not frame.progressive:
+        # Sequential JPEGs stop decoding after the top rows, see _open_jpeg_top_rows
+        return None
+    # Progressive scans keep every DCT coefficient (2 bytes a sample) until the last one
+    coefficients = frame.width * frame.height * frame.components * 2
+    cost = coefficients + frame.width * frame.height * 4
+    if not classifier.previews or cost <= classifier.preview_threshold:
+        _check_memory(cost, classifier.memory_limit)
+        return None
+    data = exif_thumbnail(header_file, frame)
+    if data is not None:
+        thumbnail = Image.open(io.BytesIO(data))
+        if _pick_preview(frame.width, frame.height, [(thumbnail, *thumbnail.size, 0)], classifier) is not None:
+            thumbnail.load()
+            return thumbnail, thumbnail.size[0] / frame.width
+        thumbnail.close()
+    # DCT scaling: libjpeg decodes straight to 1/8 of the size
+    _check_memory(coefficients, classifier.memory_limit)
+    source.seek(0)
+    img = Image.open(source)
+    img.draft(img.mode, (-(-frame.width // 8), -(-frame.height // 8)))
+    return img, img.size[0] / frame.width
+
+
+def open_preview(source, size, classifier=DEFAULT_CLASSIFIER):
+    """
+    Open all of an image from a binary file object at the smallest
+    resolution that is still at least `size` where the format allows it:
+    a JPEG is set up for libjpeg's scaled decode, and a TIFF with
+    `classifier.previews` uses its smallest reduced-resolution image with
+    the image's aspect ratio. Anything else is opened in full. The
+    classifier's memory limit applies to what will be decoded, including
+    the coefficients of a progressive JPEG. The image is not loaded yet.
+    """
+    header_file = HeaderFile(source)
+    file_format = sniff_format(header_file.head)
+    img = None
+    try:
+        if file_format == 'TIFF' and classifier.previews:
+            img = _open_tiff_preview(source, header_file, size, classifier)
+        elif file_format == 'JPEG':
+            frame = read_jpeg_frame(header_file)
+            if frame.progressive:
+                _check_memory(frame.width * frame.height * frame.components * 2, classifier.memory_limit)
+    except MemoryLimitError:
+        raise
+    except Exception:
+        # Anything the header readers do not follow is left to Pillow
+        img = None
+    if img is not None:
+        return img
+    source.seek(0)
+    img = Image.open(source)
+    img.draft('RGB', size)
+    check_decode_memory(img, classifier.memory_limit)
+    return img
+
+
+def _open_tiff_preview(source, header_file, size, classifier):
+    directories = list(read_tiff_directories(header_file, TIFF_SAMPLE_TAGS))
+    main = next((directory for directory in directories if not directory.reduced), directories[0])
+    previews = sorted((directory for directory in directories
+                       if directory is not main and size[0] <= directory.width < main.width
+                       and size[1] <= directory.height
+                       and _same_aspect(main.width, main.height, directory.width, directory.height)),
+                      key=lambda directory: directory.width)
+    for preview in previews:
+        limit = classifier.memory_limit
+        if not limit or _tiff_decoded_bytes(preview, preview.height) <= limit:
+            img = _build_tiff(preview, source, preview.height)
+            if img is not None:
+                return img
+    return None
+
+
+def _same_aspect(width, height, preview_width, preview_height):
+    aspect = width / height
+    return bool(preview_height) and abs(preview_width / preview_height - aspect) <= aspect * PREVIEW_ASPECT_TOLERANCE
+
+
+def _pick_preview(width, height, candidates, classifier):
+    """
+    From (preview, width, height, decoded bytes) candidates with the image's
+    aspect ratio, the largest within the preview threshold, else the smallest
+    within the memory limit. None when there is no such preview.
+    """
+    candidates = sorted((candidate for candidate in candidates if _same_aspect(width, height, *candidate[1:3])),
+                        key=lambda candidate: candidate[3])
+    within = [candidate for candidate in candidates if candidate[3] <= classifier.preview_threshold]
+    if within:
+        return within[-1][0]
+    if candidates and candidates[0][3] <= classifier.memory_limit:
+        return candidates[0][0]
+    return None
+
+
+def _tiff_decoded_bytes(directory, rows):
+    """Bytes the strips or tiles covering the top `rows` rows of a TIFF directory decode to."""
+    width = directory.width
+    if TIFF_TILE_WIDTH in directory:
+        tile_width = directory[TIFF_TILE_WIDTH][0]
+        width = -(-width // tile_width) * tile_width
+    bits = directory.get(TIFF_BITS_PER_SAMPLE, (1,))
+    samples = directory.get(TIFF_SAMPLES_PER_PIXEL, (1,))[0]
+    bits_per_pixel = sum(bits) if len(bits) > 1 else bits[0] * samples
+    if _tiff_uncompressed_strips(directory):
+        rows = min(rows, directory.height)
+    else:
+        rows = _tiff_block_rows(directory, rows)
+    return -(-width * bits_per_pixel // 8) * rows
+
+
+def _tiff_uncompressed_strips(tags):
+    """Whether the image is stored as uncompressed, interleaved strips, which can be cut at any row."""
+    return (_scalar(tags.get(TIFF_COMPRESSION, 1)) == 1 and TIFF_TILE_OFFSETS not in tags
+            and _scalar(tags.get(TIFF_PLANAR_CONFIGURATION, 1)) == 1)
+
+
+def _check_memory(needed, limit):
+    if limit and needed > limit:
+        raise MemoryLimitError(needed, limit)
+
+
+def check_decode_memory(img, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Raise MemoryLimitError when decoding all of an opened image would take more than `memory_limit` bytes."""
+    _check_memory(_decoded_bytes(img), memory_limit)
+
+
+def _decoded_bytes(img):
+    """Memory Pillow takes for the pixels of an opened image."""
+    width, height = img.size
+    pixel_bytes = 1 if img.mode in ('1', 'L', 'P') else 2 if img.mode.startswith('I;16') else 4
+    return width * height * pixel_bytes
+
+
+def open_top_rows(image_path, rows, memory_limit=None):
+    """
+    Open an image with at least its top `rows` rows decoded. `image_path`
+    may also be a binary file object, which is left open. MemoryLimitError
+    is raised when a full decode would take more than `memory_limit` bytes.
+
+    Row-ordered formats (PNG, BMP, uncompressed TIFF) have their decoder tiles
+    clipped to the top rows. Compressed TIFFs are rebuilt in memory from their
+    first strips or tiles, and JPEGs get a frame header that declares only the
+    top MCU rows. Anything else is decoded in full, so the pixels returned are
+    always the same as a full decode.
+    """
+    img = Image.open(image_path)
+    width, height = img.size
+    if height <= rows:
+        return img
+    try:
+        if img.format == 'JPEG':
+            reduced = _open_jpeg_top_rows(img, rows)
+        elif img.format == 'TIFF' and img.tile and img.tile[0].codec_name == 'libtiff':
+            reduced = _open_tiff_top_rows(img, rows)
+        else:
+            reduced = img if _clip_tiles(img, rows) else None
+    except Exception:
+        reduced = None
+    if reduced is None:
+        needed = _decoded_bytes(img)
+        img.close()
+        _check_memory(needed, memory_limit)
+        return Image.open(image_path)
+    if reduced is not img:
+        img.close()
+    source = reduced.fp
+    reduced.load()
+    if isinstance(source, _PatchedFile):
+        source.close()
+    return reduced
+
+
+def _clip_tiles(img, rows):
+    """Restrict the decoder tiles of a row-ordered image to its top rows."""
+    if img.format == 'PNG' and img.info.get('interlace'):
+        return False
+    tiles = []
+    for tile in img.tile:
+        if tile.codec_name not in ('raw', 'zip'):
+            return False
+        x0, y0, x1, y1 = tile.extents
+        if y0 >= rows:
+            continue
+        offset = tile.offset
+        if tile.codec_name == 'raw' and isinstance(tile.args, tuple) and len(tile.args) >= 3 and tile.args[2] < 0:
+            if not tile.args[1] or y0 != 0:
+                return False
+            # Bottom-up rows: skip to the data for the top rows
+            offset += (y1 - rows) * tile.args[1]
+        tiles.append(tile._replace(extents=(x0, y0, x1, min(y1, rows)), offset=offset))
+    img.tile = tiles
+    img._size = (img.size[0], rows)
+    return True
+
+
+def _open_tiff_top_rows(img, rows):
+    """Build an in-memory TIFF from the strips or tiles of an opened TIFF that cover the top rows."""
+    if _tiff_block_rows(img.tag_v2, rows) >= img.size[1]:
+        return None
+    reduced = _build_tiff(img.tag_v2, img.fp, rows)
+    if reduced is not None and (reduced.mode != img.mode or reduced.size[0] != img.size[0]):
+        reduced.close()
+        return None
+    return reduced
+
+
+def _tiff_block_rows(tags, rows):
+    """Rows of the strips or tiles of a TIFF needed to decode its top `rows` rows."""
+    height = _scalar(tags[TIFF_IMAGE_LENGTH])
+    if TIFF_TILE_OFFSETS in tags:
+        block_rows = _scalar(tags[TIFF_TILE_LENGTH])
+    else:
+        block_rows = _scalar(tags.get(TIFF_ROWS_PER_STRIP, height))
+    block_rows = max(1, min(block_rows, height))
+    return min(height, -(-rows // block_rows) * block_rows)
+
+
+def _build_tiff(tags, fp, rows):
+    """
+    Build an in-memory TIFF from the strips or tiles covering the top `rows`
+    rows. `tags` is a Pillow ImageFileDirectory or a headers.TiffDirectory.
+    """
+    width, height = _scalar(tags[TIFF_IMAGE_WIDTH]), _scalar(tags[TIFF_IMAGE_LENGTH])
+    tiled = TIFF_TILE_OFFSETS in tags
+    if tiled:
+        block_rows = _scalar(tags[TIFF_TILE_LENGTH])
+        per_row = -(-width // _scalar(tags[TIFF_TILE_WIDTH]))
+        offsets, counts = tags[TIFF_TILE_OFFSETS], tags[TIFF_TILE_BYTE_COUNTS]
+    else:
+        block_rows = _scalar(tags.get(TIFF_ROWS_PER_STRIP, height))
+        per_row = 1
+        offsets, counts = tags[TIFF_STRIP_OFFSETS], tags[TIFF_STRIP_BYTE_COUNTS]
+    offsets, counts = _values(offsets), _values(counts)
+    block_rows = max(1, min(block_rows, height))
+    blocks_down = -(-height // block_rows)
+    keep_down = min(blocks_down, -(-rows // block_rows))
+    # Uncompressed strips are cut at the row itself, so a single-strip file is not read in full
+    row_bytes = None
+    if _tiff_uncompressed_strips(tags) and rows < height:
+        bits = _values(tags.get(TIFF_BITS_PER_SAMPLE, 1))
+        samples = _scalar(tags.get(TIFF_SAMPLES_PER_PIXEL, 1))
+        row_bytes = -(-width * (sum(bits) if len(bits) > 1 else bits[0] * samples) // 8)
+
+    # Separate planes store every plane's blocks one after another
+    per_plane = blocks_down * per_row
+    planes = len(offsets) // per_plane
+    if planes < 1 or len(offsets) != per_plane * planes or len(counts) != len(offsets):
+        return None
+    keep = [plane * per_plane + i for plane in range(planes) for i in range(keep_down * per_row)]
+
+    data = []
+    remaining = rows * row_bytes if row_bytes is not None else None
+    for i in keep:
+        fp.seek(offsets[i])
+        if remaining is None:
+            data.append(fp.read(counts[i]))
+        elif remaining > 0:
+            data.append(fp.read(min(counts[i], remaining)))
+            remaining -= len(data[-1])
+    if row_bytes is not None:
+        data = [b''.join(data)]
+        block_rows, keep_down = rows, 1
+
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=b'II')
+    for tag in TIFF_LAYOUT_TAGS:
+        if tag in tags:
+            ifd[tag] = tags[tag]
+            ifd.tagtype[tag] = tags.tagtype[tag]
+    ifd[TIFF_IMAGE_LENGTH] = min(height, keep_down * block_rows)
+    if tiled:
+        ifd[TIFF_TILE_WIDTH] = _scalar(tags[TIFF_TILE_WIDTH])
+        ifd[TIFF_TILE_LENGTH] = block_rows
+        offsets_tag, counts_tag = TIFF_TILE_OFFSETS, TIFF_TILE_BYTE_COUNTS
+    else:
+        ifd[TIFF_ROWS_PER_STRIP] = block_rows
+        offsets_tag, counts_tag = TIFF_STRIP_OFFSETS, TIFF_STRIP_BYTE_COUNTS
+    for tag in (offsets_tag, counts_tag):
+        ifd.tagtype[tag] = TiffTags.LONG
+
+    # Block data follows the header and the directory. Pillow relocates
+    # strip offsets past the directory itself, tile offsets are absolute.
+    ifd[counts_tag] = tuple(len(block) for block in data)
+    positions = []
+    position = 0
+    for block in data:
+        positions.append(position)
+        position += len(block)
+    ifd[offsets_tag] = tuple(positions)
+    if tiled:
+        data_start = 8 + len(ifd.tobytes(8))
+        ifd[offsets_tag] = tuple(position + data_start for position in positions)
+    directory = ifd.tobytes(8)
+
+    buffer = io.BytesIO(b'II*\x00' + struct.pack('<I', 8) + directory + b''.join(data))
+    reduced = Image.open(buffer)
+    if reduced.size[0] != width:
+        reduced.close()
+        return None
+    return reduced
+
+
+def _scalar(value):
+    return value[0] if isinstance(value, tuple) else value
+
+
+def _values(value):
+    return value if isinstance(value, tuple) else (value,)
+
+
+def _open_jpeg_top_rows(img, rows):
+    """
+    Reopen a sequential JPEG with a frame header that declares only the top
+    MCU rows, so libjpeg stops decoding after them. One extra MCU row is kept
+    so chroma upsampling of the last requested row matches a full decode.
+    """
+    if img.info.get('progressive') or img.info.get('progression'):
+        return None
+    fp = img.fp
+    position = 2
+    fp.seek(position)
+    while True:
+        marker = fp.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        length = struct.unpack('>H', marker[2:4])[0]
+        if marker[1] in JPEG_SOF_MARKERS:
+            frame = fp.read(length - 2)
+            sampling = [frame[7 + 3 * i] & 0x0F for i in range(frame[5])]
+            mcu_rows = 8 * max(sampling)
+            break
+        if marker[1] == 0xDA:
+            return None
+        position += 2 + length
+        fp.seek(position)
+
+    new_height = (-(-rows // mcu_rows) + 1) * mcu_rows
+    if new_height >= img.size[1]:
+        return None
+    fp.seek(0)
+    header = bytearray(fp.read(position + 10))
+    header[position + 5:position + 7] = struct.pack('>H', new_height)
+    reduced = Image.open(_PatchedFile(img.filename or img.fp, bytes(header)))
+    if reduced.mode != img.mode or reduced.size != (img.size[0], new_height):
+        reduced.close()
+        return None
+    return reduced
+
+
+class _PatchedFile(io.RawIOBase):
+    """
+    Read-only file whose leading bytes are replaced by `header`. `source` is
+    a path, or an open file that is shared and not closed.
+    """
+
+    def __init__(self, source, header):
+        super().__init__()
+        self._owned = isinstance(source, str)
+        self._file = open(source, 'rb') if self._owned else source
+        self._header = header
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._file.seek(0, io.SEEK_END)
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        self._file.seek(self._position)
+        count = self._file.readinto(buffer)
+        if self._position < len(self._header):
+            end = min(len(self._header), self._position + count)
+            buffer[:end - self._position] = self._header[self._position:end]
+        self._position += count
+        return count
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+        super().close()
+
+
+class _CountingFile:
+    """Binary file wrapper that counts the bytes read through it."""
+
+    def __init__(self, file):
+        self._file = file
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._file.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+
+def classify_batch(image_paths, classifier=DEFAULT_CLASSIFIER):
+    """Background classes of a list of images, used as one unit of work by worker processes."""
+    return [measured[0] for measured in measure_batch(image_paths, classifier)]
+
+
+def measure_batch(image_paths, classifier=DEFAULT_CLASSIFIER):
+    """
+    Like classify_batch, with the classify_timed() measurements of each
+    image. The batch is classified in one classify_many() call and each
+    image is charged an equal share of its time.
+    """
+    decoded = []
+    for image_path in image_paths:
+        start = time.perf_counter()
+        regions, bytes_read = decode_regions(image_path, classifier)
+        decoded.append((regions, time.perf_counter() - start, bytes_read))
+    start = time.perf_counter()
+    readable = [regions for regions, _, _ in decoded if regions]
+    results = iter(classifier.classify_many(readable))
+    classify_time = (time.perf_counter() - start) / max(1, len(readable))
+    return [(next(results), decode_time, classify_time, bytes_read) if regions else
+            (BACKGROUND_OTHER, decode_time, 0.0, bytes_read)
+            for regions, decode_time, bytes_read in decoded]
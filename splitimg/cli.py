@@ -0,0 +1,275 @@
+"""
+Command line entry point for running SplitImg without the GUI.
+
+Progress is written to stdout as JSON lines so other tools can follow a run.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import signal
+import sys
+import threading
+
+from .tagging import TAGGERS, default_tagger_name
+from .assign import BALANCE_MODES
+from .dedup import DEDUP_MODES, DEFAULT_MAX_DISTANCE
+from .report import REPORT_FORMATS, background_name
+from .metrics import METRICS_FORMATS
+from .plan import check_plan_source, read_plan_header
+
+
+# Jobs emit from their own threads, one event must not cut into another's line
+_emit_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    line = json.dumps({'event': event, **fields})
+    with _emit_lock:
+        print(line, flush=True)
+
+
+def parse_weights(text):
+    try:
+        weights = [float(weight) for weight in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid weights: {text}")
+    if any(weight <= 0 for weight in weights):
+        raise argparse.ArgumentTypeError("weights must be positive")
+    return weights
+
+
+def parse_priorities(text):
+    try:
+        return [int(priority) for priority in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid priorities: {text}")
+
+
+def parse_io_limit(text):
+    path, _, limit = text.rpartition('=')
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid I/O limit: {text}")
+    if limit < 1:
+        raise argparse.ArgumentTypeError("I/O limits must be positive")
+    return path or None, limit
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='splitimg', description='Split images across designer folders.')
+    parser.add_argument('sources', nargs='+', metavar='source',
+                        help='Folder containing the images to split, several are queued as separate jobs')
+    parser.add_argument('designers', type=int, help='Number of designers (1-60)')
+    parser.add_argument('--no-tags', dest='apply_tags', action='store_false', default=sys.platform == 'darwin',
+                        help='Do not apply Finder tags (the default outside macOS)')
+    parser.add_argument('--tags', dest='apply_tags', action='store_true', help='Apply Finder tags')
+    parser.add_argument('--tagger', choices=sorted(TAGGERS), default=None,
+                        help=f'Tagging backend (default: {default_tagger_name()})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Classification processes (default: one per CPU, 1 disables the pool)')
+    parser.add_argument('--scan-threads', type=int, default=1,
+                        help='Threads listing directories, raise this for network shares')
+    parser.add_argument('--balance', choices=BALANCE_MODES, default='groups',
+                        help='Balance designers by group count (default), image count, bytes or pixels')
+    parser.add_argument('--stable', action='store_true',
+                        help='Route each file ID by consistent hashing so assignments stay put across runs')
+    parser.add_argument('--designer-weights', type=parse_weights, default=None,
+                        help='Comma separated share of work per designer for --stable, e.g. 1,1,2')
+    parser.add_argument('--dedup', choices=DEDUP_MODES, default=None,
+                        help='Find duplicate images and give them to the same designer, or move them '
+                             'to a Duplicates folder')
+    parser.add_argument('--dedup-distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                        help=f'Bits two perceptual hashes may differ in and still count as duplicates, '
+                             f'-1 only matches identical files (default: {DEFAULT_MAX_DISTANCE})')
+    parser.add_argument('--output', dest='output_folder', default=None,
+                        help='Create the Designer folders and report here instead of in the source folder')
+    parser.add_argument('--transfer-workers', type=int, default=None,
+                        help='Concurrent moves, copies when --output is on another volume (default: the I/O limit)')
+    parser.add_argument('--io-limit', dest='io_limits', type=parse_io_limit, action='append', default=None,
+                        metavar='[PATH=]N',
+                        help='File system calls in flight, for every mount or for the mount at PATH. '
+                             'Defaults to 32 on network shares and 4 on local disks; may be repeated')
+    parser.add_argument('--report-format', choices=REPORT_FORMATS, default='xlsx',
+                        help='Report file format, parquet needs pyarrow (default: xlsx)')
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS + ('none',), default='json',
+                        help='Write run metrics next to the report as JSON or a Prometheus textfile (default: json)')
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help='Ignore the journal of an interrupted run and split from scratch')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Do not read or update the classification cache')
+    parser.add_argument('--cache', dest='cache_path', default=None, help='Classification cache file')
+    parser.add_argument('--hash-content', action='store_true',
+                        help='Also key the cache by file content so copied files are recognised')
+    parser.add_argument('--region', choices=('corners', 'top'), default='corners',
+                        help='Where the background is sampled: the two top corners or the whole top strip')
+    parser.add_argument('--patch-size', type=int, default=5,
+                        help='Corner patch size, or strip height for --region top, in pixels (default: 5)')
+    parser.add_argument('--white-tolerance', type=int, default=0,
+                        help='How far below 255 a channel may be and still count as white (default: 0)')
+    parser.add_argument('--coverage', type=float, default=1.0,
+                        help='Share of a corner patch that must be background, 0-1 (default: 1)')
+    parser.add_argument('--gray', action='store_true',
+                        help='Also detect mid-gray backgrounds and give them the Gray tag')
+    parser.add_argument('--gray-tolerance', type=int, default=16,
+                        help='How far from 128 a channel may be and still count as gray (default: 16)')
+    parser.add_argument('--no-previews', dest='previews', action='store_false',
+                        help='Always decode the main image, never an embedded preview or thumbnail')
+    parser.add_argument('--memory-limit', type=int, default=512, metavar='MB',
+                        help='Most memory one file may take to decode, files that need more are tagged '
+                             'as other backgrounds (default: 512)')
+    parser.add_argument('--spill-dir', dest='spill_folder', metavar='DIR', default=None,
+                        help='Keep the per-file tables in temporary files in DIR instead of in memory, '
+                             'for folders with more files than fit in memory')
+    parser.add_argument('--plan', metavar='FILE', default=None,
+                        help='Dry run: write how the folder would be split to FILE without moving anything')
+    parser.add_argument('--apply', metavar='FILE', default=None,
+                        help='Make the moves of a plan written by --plan, without scanning or classifying again')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='Folders split at the same time when several are given (default: 2)')
+    parser.add_argument('--priority', dest='priorities', type=parse_priorities, default=None,
+                        help='Comma separated priority per source folder, higher ones start first (default: 0)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and distribute new files as they land in the source folder')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds a new file must stay unchanged before it is moved (default: 2)')
+    parser.add_argument('--watch-backend', choices=('auto', 'inotify', 'poll'), default='auto',
+                        help='How changes are noticed, auto uses inotify on Linux and polls elsewhere')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help='Seconds between folder listings when polling (default: 2)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not 1 <= args.designers <= 60:
+        print("Please enter a number between 1 and 60", file=sys.stderr)
+        return 2
+    if args.designer_weights is not None and len(args.designer_weights) != args.designers:
+        print("Please give one weight per designer", file=sys.stderr)
+        return 2
+    if args.report_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        print("Parquet reports need pyarrow (pip install pyarrow)", file=sys.stderr)
+        return 2
+
+    if args.priorities is not None and len(args.priorities) != len(args.sources):
+        print("Please give one priority per source folder", file=sys.stderr)
+        return 2
+    if len(args.sources) > 1 and (args.watch or args.output_folder is not None):
+        # Jobs would share one set of Designer folders and one report
+        print("--watch and --output take a single source folder", file=sys.stderr)
+        return 2
+    if (args.plan or args.apply) and (len(args.sources) > 1 or args.watch or (args.plan and args.apply)):
+        print("--plan and --apply take a single source folder and cannot be combined with each other or --watch",
+              file=sys.stderr)
+        return 2
+    if args.apply:
+        try:
+            check_plan_source(read_plan_header(args.apply), args.sources[0])
+        except (OSError, ValueError) as e:
+            print(f"Cannot apply {args.apply}: {str(e)}", file=sys.stderr)
+            return 2
+
+    if args.spill_folder is not None and not os.path.isdir(args.spill_folder):
+        print(f"--spill-dir {args.spill_folder} is not a folder", file=sys.stderr)
+        return 2
+
+    try:
+        classifier = build_classifier(args)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    options = dict(
+        apply_tags=args.apply_tags or args.tagger is not None, tagger=args.tagger,
+        use_cache=args.use_cache, cache_path=args.cache_path,
+        hash_content=args.hash_content, scan_threads=args.scan_threads, resume=args.resume,
+        balance=args.balance, stable=args.stable, designer_weights=args.designer_weights,
+        dedup=args.dedup, dedup_distance=args.dedup_distance,
+        spill_folder=args.spill_folder,
+        output_folder=args.output_folder, report_format=args.report_format,
+        io_limits=dict(args.io_limits) if args.io_limits else None, classifier=classifier,
+        metrics_format=None if args.metrics_format == 'none' else args.metrics_format)
+    if len(args.sources) > 1:
+        return run_jobs(args, options)
+
+    # Imported here so --help and argument errors do not load Pillow
+    from .engine import SplitEngine
+
+    engine = SplitEngine(
+        args.sources[0], args.designers, workers=args.workers, transfer_workers=args.transfer_workers,
+        progress_callback=lambda processed, elapsed, stats: emit(
+            'progress', processed=processed, total=stats['total_images'], elapsed=elapsed,
+            white_background=stats['white_background'], non_white_background=stats['non_white_background']),
+        scan_callback=lambda count: emit('scan', count=count),
+        plan_file=args.apply, **options)
+    if args.watch:
+        return watch(engine, args)
+    if args.plan:
+        stats = engine.write_plan(args.plan)
+        emit('planned', stats=stats, plan=args.plan)
+        return 0
+    stats = engine.run()
+    emit('complete', stats=stats, report=engine.report_path, metrics=engine.metrics_path)
+    return 0
+
+
+def build_classifier(args):
+    """The BackgroundClassifier for the --region, --patch-size, tolerance, --gray and decoding options."""
+    # Imported here, it loads Pillow
+    from .classify import BackgroundClassifier
+
+    return BackgroundClassifier(
+        args.region, args.patch_size, tolerance=args.white_tolerance, coverage=args.coverage,
+        gray=args.gray, gray_tolerance=args.gray_tolerance, previews=args.previews,
+        memory_limit=args.memory_limit * 2 ** 20)
+
+
+def run_jobs(args, options):
+    """Split every source folder as its own job on shared pools, events carry the job ID."""
+    from .jobs import JobQueue
+
+    def job_changed(job):
+        emit('job', **job.summary())
+        if job.state == 'done':
+            emit('complete', job=job.id, stats=job.stats, report=job.engine.report_path,
+                 metrics=job.engine.metrics_path)
+
+    # The queue holds every job to the I/O limits of its mounts
+    io_limits = options.pop('io_limits')
+    priorities = args.priorities or [0] * len(args.sources)
+    with JobQueue(
+            args.jobs, workers=args.workers, transfer_workers=args.transfer_workers, io_limits=io_limits,
+            progress_callback=lambda job, processed, elapsed, stats: emit(
+                'progress', job=job.id, processed=processed, total=stats['total_images'], elapsed=elapsed,
+                white_background=stats['white_background'],
+                non_white_background=stats['non_white_background']),
+            scan_callback=lambda job, count: emit('scan', job=job.id, count=count),
+            job_callback=job_changed) as jobs:
+        queued = [jobs.submit(source, args.designers, priority, **options)
+                  for source, priority in zip(args.sources, priorities)]
+        jobs.join()
+    return 1 if any(job.state == 'failed' for job in queued) else 0
+
+
+def watch(engine, args):
+    """Run until interrupted, emitting one event per distributed file."""
+    from .watch import FolderWatch
+
+    folder_watch = FolderWatch(
+        engine, settle=args.settle, backend=args.watch_backend, poll_interval=args.poll_interval,
+        file_callback=lambda path, designer, background: emit('routed', path=path, designer=designer,
+                                                               background=background_name(background)))
+    signal.signal(signal.SIGTERM, lambda signum, frame: folder_watch.stop())
+    emit('watching', source=engine.source_folder)
+    try:
+        stats = folder_watch.run()
+    except KeyboardInterrupt:
+        stats = engine.stats
+    emit('stopped', stats=stats, metrics=engine.metrics_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+
+SUPPORTED_FORMATS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
+DESIGNER_PREFIX = 'Designer_'
+DUPLICATES_FOLDER = 'Duplicates'
+REPORT_NAME = 'SplitImg_Report.xlsx'
+
+# Background classes. 0 and 1 are the False and True of the white-only classifier
+BACKGROUND_OTHER = 0
+BACKGROUND_WHITE = 1
+BACKGROUND_GRAY = 2
+
+# Finder label indices used for tagging
+WHITE_TAG = 6      # Green tag for white background
+NON_WHITE_TAG = 4  # Blue tag for non-white background
+GRAY_TAG = 7       # Gray tag for gray background
+
+# Designer index that stands for the Duplicates folder in plans and journals
+DUPLICATES = -1
+
+
+def designer_name(index):
+    """Return the folder name for the zero-based designer index, or the Duplicates folder for DUPLICATES."""
+    if index == DUPLICATES:
+        return DUPLICATES_FOLDER
+    return f'{DESIGNER_PREFIX}{index + 1}'
+
+
+def designer_folder(source_folder, index):
+    return os.path.join(source_folder, designer_name(index))
+
+
+def extract_file_id(filename):
+    """
+    Extract the file ID from the filename.
+    Returns the first 13 characters if it's a digit, or the first 12 characters if it's alphanumeric.
+    """
+    # Check for 13-digit number
+    if len(filename) >= 13 and filename[:13].isdigit():
+        return filename[:13]
+    # Check for 12-character alphanumeric
+    elif len(filename) >= 12:
+        return filename[:12]
+    return None
+
+
+def format_time(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
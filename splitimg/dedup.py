@@ -0,0 +1,215 @@
+"""
+Duplicate and near-duplicate detection.
+
+Every image gets a content digest, a 64-bit difference hash (dHash) of a
+small grayscale decode and its mean colour. Equal digests are
+byte-for-byte copies. dHashes that differ in at most `max_distance` bits
+are the same picture saved again, resized or re-exported under another
+file ID, as long as the mean colours are close too: a dHash only sees
+brightness edges, so the same product shot in red and in blue would
+otherwise match. Near matches are looked up in a BK-tree, which skips
+every subtree the triangle inequality rules out instead of comparing each
+image with all the others.
+
+The first image of each set of duplicates, in file ID order, is kept as
+the original. Shots of one file ID are never duplicates of each other:
+they are one group already, and angles of the same product can hash
+alike. The engine either hands the duplicates' groups to the
+original's designer or moves the duplicates to a Duplicates folder, see
+DEDUP_MODES.
+"""
+import os
+import sys
+import time
+
+from .common import extract_file_id
+
+# 'designer' routes a duplicate's group to its original's designer,
+# 'folder' moves the duplicate itself into the Duplicates folder
+DEDUP_MODES = ('designer', 'folder')
+# Bits two dHashes may differ in and still be the same picture
+DEFAULT_MAX_DISTANCE = 4
+# dHash grid, HASH_SIZE x HASH_SIZE brightness comparisons
+HASH_SIZE = 8
+# Thumbnail the dHash is taken from, one column wider than the grid
+HASH_GRID = (HASH_SIZE + 1, HASH_SIZE)
+# Modes a box filter can average without converting the image first
+RESIZABLE_MODES = {'L', 'LA', 'La', 'RGB', 'RGBA', 'RGBa', 'RGBX', 'CMYK', 'YCbCr', 'I', 'F'}
+# Largest difference of a mean colour channel between near-duplicates
+MAX_COLOUR_DIFFERENCE = 10
+
+
+def image_hashes(image_path, classifier=None):
+    """
+    Return (content digest, dHash, mean RGB colour) of an image. The dHash
+    and colour are None when the image cannot be decoded or would take more
+    than the memory limit of `classifier`, a BackgroundClassifier whose
+    preview settings also apply, see splitimg.classify.open_preview().
+    """
+    # Imported here, they load Pillow and SQLite
+    from .cache import file_digest
+    from .classify import DEFAULT_CLASSIFIER, open_preview
+
+    digest = file_digest(image_path)
+    try:
+        with open(image_path, 'rb') as f, open_preview(f, HASH_GRID, classifier or DEFAULT_CLASSIFIER) as img:
+            small = hash_thumbnail(img)
+    except Exception as e:
+        print(f"Error hashing {image_path}: {e}", file=sys.stderr)
+        return digest, None, None
+    # A box average over the whole thumbnail
+    colour = small.reduce(HASH_GRID).getpixel((0, 0))
+    return digest, difference_hash(small.convert('L').tobytes()), colour
+
+
+def hash_thumbnail(img):
+    """
+    The HASH_GRID RGB thumbnail of an opened image. The image is scaled
+    down in its own mode and only the thumbnail is converted, so the
+    full-size pixels are never copied.
+    """
+    # Imported here, it loads Pillow
+    from PIL import Image
+
+    if img.mode.startswith('I;16'):
+        img = img.point(lambda value: value / 256, 'L')
+    elif img.mode not in RESIZABLE_MODES:
+        # Palette indexes and bilevel pixels cannot be averaged
+        img = img.convert('RGB')
+    return img.resize(HASH_GRID, Image.Resampling.BOX).convert('RGB')
+
+
+def difference_hash(pixels):
+    """
+    dHash of a (HASH_SIZE + 1) x HASH_SIZE grayscale thumbnail given as
+    bytes: one bit per pixel that is brighter than its right neighbour.
+    """
+    value = 0
+    width = HASH_SIZE + 1
+    for row in range(0, len(pixels), width):
+        for x in range(row, row + HASH_SIZE):
+            value = (value << 1) | (pixels[x] > pixels[x + 1])
+    return value
+
+
+def hash_batch(image_paths, classifier=None):
+    """(digest, dHash, colour, seconds) of each image, used as one unit of work by worker processes."""
+    hashed = []
+    for image_path in image_paths:
+        start = time.perf_counter()
+        try:
+            digest, dhash, colour = image_hashes(image_path, classifier)
+        except OSError as e:
+            print(f"Error hashing {image_path}: {e}", file=sys.stderr)
+            digest, dhash, colour = None, None, None
+        hashed.append((digest, dhash, colour, time.perf_counter() - start))
+    return hashed
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes under the Hamming distance. Each node
+    keeps its children by their distance to it, so a search within
+    `max_distance` of a hash only descends into children whose distance is
+    within `max_distance` of the hash's own distance to the node.
+    """
+
+    def __init__(self):
+        # (hash, item, {distance: child node})
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return (distance, item) for every hash within `max_distance` of `value`, nearest first."""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                matches.append((distance, item))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+def find_duplicates(hashes, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Find the duplicates among `hashes`, (path, digest, dHash, colour) in the
+    order originals are preferred. Returns (path, original path, match,
+    distance) for every duplicate, match being 'Identical' for equal digests
+    and 'Similar' for dHashes within `max_distance` whose colours are within
+    MAX_COLOUR_DIFFERENCE. Only originals are indexed, so every duplicate
+    points at an original rather than at another copy. Images with the
+    same file ID are not compared.
+    """
+    by_digest = {}
+    tree = BKTree()
+    duplicates = []
+    for image_path, digest, dhash, colour in hashes:
+        file_id = extract_file_id(os.path.basename(image_path))
+        original = by_digest.get(digest) if digest is not None else None
+        if original is not None and original[1] != file_id:
+            duplicates.append((image_path, original[0], 'Identical', 0))
+            continue
+        if dhash is not None and max_distance >= 0:
+            match = next(((distance, original) for distance, (original, original_id, original_colour)
+                          in tree.search(dhash, max_distance)
+                          if original_id != file_id and colours_match(colour, original_colour)), None)
+            if match is not None:
+                distance, original = match
+                duplicates.append((image_path, original, 'Similar', distance))
+                continue
+            tree.add(dhash, (image_path, file_id, colour))
+        if digest is not None:
+            by_digest.setdefault(digest, (image_path, file_id))
+    return duplicates
+
+
+def colours_match(a, b):
+    return max(abs(x - y) for x, y in zip(a, b)) <= MAX_COLOUR_DIFFERENCE
+
+
+def linked_groups(duplicates, file_id):
+    """
+    Return {file ID: root file ID} for every file ID that duplicates link
+    to another, `file_id` giving the ID of a path. The root is the lowest
+    ID of each linked set, so it sorts where the set's first group did.
+    """
+    parents = {}
+
+    def find(key):
+        parents.setdefault(key, key)
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    for image_path, original, _, _ in duplicates:
+        a, b = find(file_id(image_path)), find(file_id(original))
+        if a != b:
+            parents[max(a, b)] = min(a, b)
+    return {key: find(key) for key in parents}
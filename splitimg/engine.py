@@ -0,0 +1,782 @@
+import os
+import sys
+import time
+from collections import deque
+
+from .common import (SUPPORTED_FORMATS, BACKGROUND_GRAY, BACKGROUND_WHITE, WHITE_TAG, NON_WHITE_TAG, GRAY_TAG, DUPLICATES,
+                     designer_name, designer_folder, extract_file_id, format_time)
+from .cache import ClassificationCache
+from .classify import DEFAULT_CLASSIFIER
+from .headers import read_header
+from .dedup import DEDUP_MODES, DEFAULT_MAX_DISTANCE, find_duplicates, linked_groups
+from .pipeline import ClassificationStage, HashStage, stream
+from .progress import DEFAULT_INTERVAL, ProgressChannel, snapshot_stats
+from .scanner import scan_images
+from .journal import MoveJournal
+from .paths import GroupIndex, MovePlan, PathTable, RowResults
+from .plan import PlannedResults, check_plan_source, load_plan, save_plan
+from .transfer import TransferPool, move_file
+from .aio import AsyncIO, io_limit_for
+from .assign import BALANCE_MODES, assign_groups, assign_stable, designer_workloads, group_weights
+from .tagging import BatchedTagger, Tagger, NullTagger, get_tagger
+from .report import REPORT_FORMATS, open_report
+from .metrics import METRICS_FORMATS, RunMetrics, write_metrics
+
+
+class SplitEngine:
+    """
+    Plain-Python implementation of the SplitImg pipeline.
+
+    The run is split into scan, group, assign, classify, move and report
+    stages. Progress is reported through optional callbacks so the same
+    engine can drive the Qt window, the command line or a benchmark.
+    """
+
+    def __init__(self, source_folder, num_designers, apply_tags=True, workers=None, tagger=None,
+                 use_cache=False, cache_path=None, hash_content=False, queue_size=1024, scan_threads=1,
+                 resume=True, balance='groups', stable=False, designer_weights=None,
+                 output_folder=None, transfer_workers=None, io_limits=None, report_format='xlsx', metrics_format='json',
+                 classify_executor=None, transfer_executor=None, shared_io=None, classifier=None, dedup=None,
+                 dedup_distance=DEFAULT_MAX_DISTANCE, plan_file=None, spill_folder=None,
+                 progress_callback=None, scan_callback=None, progress_interval=DEFAULT_INTERVAL):
+        # Normalized once, so 'shoot/' and 'shoot' prune and route the same
+        self.source_folder = os.path.abspath(os.path.normpath(source_folder))
+        # Where the Designer folders and the report go, may be another volume
+        self.output_folder = os.path.abspath(os.path.normpath(output_folder)) if output_folder else self.source_folder
+        self.num_designers = num_designers
+        # Concurrent moves, which matters when they become copies across volumes.
+        # None moves as many files at once as the I/O limit allows
+        self.transfer_workers = transfer_workers
+        # File system calls kept in flight per mount, see splitimg.aio.io_limit_for
+        self.io_limits = io_limits
+        self.io = None
+        # Pools shared with other jobs by splitimg.jobs.JobQueue, None starts the engine's own.
+        # shared_io is the queue's splitimg.aio.IOView for this run's mounts
+        self.classify_executor = classify_executor
+        self.transfer_executor = transfer_executor
+        self.shared_io = shared_io
+        # Tagging backend name or Tagger instance, see splitimg.tagging
+        if not apply_tags:
+            self.tagger = NullTagger()
+        elif isinstance(tagger, Tagger):
+            self.tagger = tagger
+        else:
+            self.tagger = get_tagger(tagger)
+        # Background rule, a splitimg.classify.BackgroundClassifier
+        self.classifier = classifier or DEFAULT_CLASSIFIER
+        # Number of classification processes, 1 classifies in this process
+        self.workers = workers or os.cpu_count() or 1
+        # Paths buffered between the scanner thread and classification
+        self.queue_size = queue_size
+        # Threads listing directories, more than one helps on SMB/NFS mounts
+        self.scan_threads = scan_threads
+        # How groups are weighted when balancing, see splitimg.assign.BALANCE_MODES
+        if balance not in BALANCE_MODES:
+            raise ValueError(f"Unknown balance mode: {balance}")
+        self.balance = balance
+        # Route each group by rendezvous hashing of its file ID instead, so
+        # assignments survive new files and designer count changes
+        self.stable = stable
+        self.designer_weights = designer_weights
+        # Find duplicate images and route them, see splitimg.dedup.DEDUP_MODES (None does not look)
+        if dedup is not None and dedup not in DEDUP_MODES:
+            raise ValueError(f"Unknown duplicate mode: {dedup}")
+        self.dedup = dedup
+        self.dedup_distance = dedup_distance
+        # Folder for the file tables of runs too large for memory, see splitimg.paths (None keeps them in memory)
+        self.spill_folder = spill_folder
+        # Finish an interrupted run recorded in the source folder's journal
+        self.resume = resume
+        # A plan file written by write_plan() to carry out instead of scanning and classifying
+        self.plan_file = plan_file
+        self.use_cache = use_cache
+        self.cache_path = cache_path
+        self.hash_content = hash_content
+        self.cache = None
+        self.progress_callback = progress_callback
+        self.scan_callback = scan_callback
+        # Callbacks get coalesced snapshots, at most one per progress_interval
+        self.scan_channel = ProgressChannel(self.emit_scan, progress_interval)
+        self.progress_channel = ProgressChannel(self.emit_progress, progress_interval)
+        self.start_time = None
+        self.scanned = 0
+        self.processed = 0
+        self.supported_formats = SUPPORTED_FORMATS
+        # Report rows are streamed while files are moved, see splitimg.report
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {report_format}")
+        self.report_format = report_format
+        self.report = None
+        self.report_path = None
+        # Stage times and per-file latencies, written next to the report
+        # as JSON or a Prometheus textfile (None writes no file)
+        if metrics_format is not None and metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format: {metrics_format}")
+        self.metrics_format = metrics_format
+        self.metrics = RunMetrics()
+        self.metrics_path = None
+        # (file, format, problem, action) for every file whose header had a problem
+        self.problems = []
+        # (file, original, match, distance, destination) for every duplicate found
+        self.duplicates = []
+        self.stats = {
+            'total_images': 0,
+            'white_background': 0,
+            'non_white_background': 0,
+            'gray_background': 0,
+            'extensions': {},
+            'designer_files': {},
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'progress': {},
+            'balance_mode': balance,
+            'workloads': {},
+            'imbalance_ratio': 1.0,
+            'unreadable_files': 0,
+            'header_warnings': 0,
+            'duplicates': 0,
+            'plan_conflicts': 0
+        }
+
+    def run(self):
+        start_time = self.start_time = time.time()
+        self.metrics = RunMetrics()
+
+        # The cache is opened here because SQLite connections stay on their thread
+        self.open_cache()
+        self.open_io()
+        try:
+            journal = MoveJournal(self.source_folder)
+            state = journal.load() if self.resume else None
+            if state is not None:
+                self.resume_run(journal, state)
+            elif self.plan_file is not None:
+                self.apply(journal)
+            else:
+                self.split(journal)
+        except BaseException:
+            self.abort_report()
+            raise
+        finally:
+            self.close_io()
+            self.close_cache()
+        self.stats['progress'] = {'scan': self.scan_channel.summary(),
+                                  'process': self.progress_channel.summary()}
+        self.metrics.finish(self.processed)
+        self.stats['metrics'] = self.metrics.summary()
+        with self.metrics.stage('report'):
+            self.close_report(start_time)
+        self.save_metrics()
+        return self.stats
+
+    def split(self, journal):
+        with ClassificationStage(self.workers, self.cache, metrics=self.metrics, executor=self.classify_executor,
+                                 classifier=self.classifier, results=RowResults()) as classifier:
+            plan = self.prepare(classifier)
+            self.create_designer_folders(duplicates=self.dedup == 'folder')
+            with self.metrics.stage('journal'):
+                journal.start(self.num_designers, plan, self.journal_settings())
+            self.process(plan, classifier, journal)
+
+    def prepare(self, classifier):
+        """
+        Scan the folder, start classifying on `classifier`, find duplicates
+        and assign the groups. Returns the plan, a MovePlan of the ordered
+        (designer index, path) moves whose results `classifier` keeps by
+        row. Nothing is written.
+        """
+        # Duplicate hashes share the classification pool
+        hashes = None
+        if self.dedup is not None:
+            hashes = HashStage(classifier.executor, metrics=self.metrics, classifier=self.classifier)
+        # Classification starts on each file as soon as the scan finds it
+        # and its header checks out
+        # Paths are kept as rows of a table, with the header's size or pixel
+        # count when groups are balanced by them
+        files = PathTable(self.spill_folder, weights=self.balance in ('bytes', 'pixels'))
+        with self.metrics.stage('scan'):
+            for entry, ext, header in stream(self.probe(self.iter_images()), self.queue_size):
+                if header.problem:
+                    self.record_problem(entry.path, header)
+                if not header.ok:
+                    continue
+                row = files.add(entry.path, header.size if self.balance == 'bytes' else header.pixels)
+                self.record_scanned(ext, len(files))
+                classifier.submit(entry.path, entry, row)
+                if hashes is not None:
+                    hashes.submit(entry.path)
+        self.scan_channel.close()
+
+        # The plan needs every group, so it is made once the scan is done
+        with self.metrics.stage('group'):
+            image_groups = self.group(files)
+        duplicates = []
+        if hashes is not None:
+            with self.metrics.stage('dedup'):
+                duplicates = self.find_duplicates(hashes.results())
+        self.stats['total_images'] = len(files)
+        with self.metrics.stage('assign'):
+            plan = self.plan(self.assign(image_groups, duplicates), files)
+            if self.dedup == 'folder' and duplicates:
+                rows = files.find(image_path for image_path, _, _, _ in duplicates)
+                for image_path, _, _, _ in duplicates:
+                    plan.append(DUPLICATES, rows[image_path])
+            self.record_duplicates(duplicates, plan)
+        return plan
+
+    def write_plan(self, plan_path):
+        """
+        Dry run: scan, classify and assign the folder as run() would and
+        write the moves to `plan_path` (see splitimg.plan) without making
+        them. No file in the source or output folder is created, moved or
+        tagged. Returns the stats the run would have.
+        """
+        self.start_time = time.time()
+        self.metrics = RunMetrics()
+        if self.resume and MoveJournal(self.source_folder).load() is not None:
+            print("The folder has an unfinished split, the plan does not include the files it already moved",
+                  file=sys.stderr)
+        self.open_cache()
+        self.open_io()
+        try:
+            with ClassificationStage(self.workers, self.cache, metrics=self.metrics, executor=self.classify_executor,
+                                     classifier=self.classifier, results=RowResults()) as classifier:
+                plan = self.prepare(classifier)
+                with self.metrics.stage('classify'):
+                    backgrounds = [classifier.result(image_path, row) for (_, image_path), row in zip(plan, plan.rows)]
+            with self.metrics.stage('plan'):
+                # Kept so applying the plan can tell which files changed since
+                stats = self.starmap(os.stat, [(image_path,) for _, image_path in plan])
+                entries = []
+                designers = list(range(self.num_designers)) + ([DUPLICATES] if self.dedup == 'folder' else [])
+                self.stats['designer_files'] = {designer_name(designer): 0 for designer in designers}
+                for (designer, image_path), background, stat in zip(plan, backgrounds, stats):
+                    image_file = os.path.relpath(image_path, self.source_folder)
+                    if isinstance(stat, Exception):
+                        print(f"Skipping {image_file}: {stat}", file=sys.stderr)
+                        self.problems.append((image_file, '', str(stat), 'Left in place'))
+                        continue
+                    entries.append((designer, image_file, background, stat.st_size, stat.st_mtime_ns))
+                    self.stats['designer_files'][designer_name(designer)] += 1
+                    self.count_background(background)
+                save_plan(plan_path, {
+                    'source': os.path.abspath(self.source_folder),
+                    'output': os.path.abspath(self.output_folder) if self.output_folder != self.source_folder else None,
+                    'num_designers': self.num_designers, 'classifier': self.classifier.version,
+                    'balance': self.balance, 'stable': self.stable, 'dedup': self.dedup,
+                    'designer_files': self.stats['designer_files'], 'workloads': self.stats['workloads'],
+                }, entries, self.problems, self.duplicates)
+        finally:
+            self.close_io()
+            self.close_cache()
+        self.stats['total_images'] = len(entries)
+        self.metrics.finish(0)
+        self.stats['metrics'] = self.metrics.summary()
+        return self.stats
+
+    def starmap(self, fn, items, chunk_size=4096):
+        """
+        AsyncIO.starmap() over `items` a chunk at a time, so a million files
+        do not become a million coroutines at once.
+        """
+        results = []
+        for start in range(0, len(items), chunk_size):
+            results.extend(self.io.starmap(fn, items[start:start + chunk_size]))
+        return results
+
+    def apply(self, journal):
+        """
+        Carry out the moves of `plan_file` (see write_plan) without scanning
+        or classifying. Every planned file is checked first, many at a time,
+        and one that is gone, changed since the plan or whose destination is
+        taken is left in place and listed in the Errors table. Moves are
+        made per source directory and Designer folder, and journaled like a
+        split, so an interrupted apply resumes on the next run. A plan made
+        for another source folder raises ValueError before anything moves.
+        """
+        plan_file = load_plan(self.plan_file)
+        # Relative paths of another folder's plan could name files here; nothing is moved
+        check_plan_source(plan_file.header, self.source_folder)
+        if plan_file.num_designers != self.num_designers:
+            print(f"Applying the plan for {plan_file.num_designers} designers", file=sys.stderr)
+        self.num_designers = plan_file.num_designers
+        # Workloads are reported the way the plan balanced them
+        self.balance = plan_file.header.get('balance', self.balance)
+        if plan_file.output_folder is not None and self.output_folder == self.source_folder:
+            self.output_folder = plan_file.output_folder
+        self.problems.extend(plan_file.problems)
+        self.duplicates.extend(plan_file.duplicates)
+        self.stats['duplicates'] = len(plan_file.duplicates)
+
+        with self.metrics.stage('check'):
+            entries = []
+            for entry, problem in zip(plan_file.entries, self.starmap(self.check_planned, plan_file.entries)):
+                if isinstance(problem, Exception):
+                    problem = str(problem)
+                if problem is None:
+                    entries.append(entry)
+                    continue
+                print(f"Skipping {entry[1]}: {problem}", file=sys.stderr)
+                self.stats['plan_conflicts'] += 1
+                self.problems.append((entry[1], '', problem, 'Left in place'))
+        # Renames out of one directory into one Designer folder run back to back
+        entries.sort(key=lambda entry: (os.path.dirname(entry[1]), entry[0], entry[1]))
+        plan = [(designer, os.path.join(self.source_folder, image_file)) for designer, image_file, _, _, _ in entries]
+        backgrounds = {image_path: entry[2] for (_, image_path), entry in zip(plan, entries)}
+        for index, (_, image_path) in enumerate(plan):
+            self.record_scanned(os.path.splitext(image_path)[1].lower(), index + 1)
+        self.scan_channel.close()
+        self.stats['total_images'] = len(plan)
+        self.record_plan_workloads(plan)
+
+        self.create_designer_folders(duplicates=any(designer == DUPLICATES for designer, _ in plan))
+        with self.metrics.stage('journal'):
+            journal.start(self.num_designers, plan, self.journal_settings())
+        self.process(plan, PlannedResults(backgrounds), journal)
+
+    def check_planned(self, designer, image_file, background, size, mtime_ns):
+        """Return what stops a planned move from being made, None when nothing does."""
+        image_path = os.path.join(self.source_folder, image_file)
+        try:
+            stat = os.stat(image_path)
+        except FileNotFoundError:
+            return 'gone since the plan was made'
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return 'changed since the plan was made'
+        if os.path.lexists(self.destination(image_path, designer)):
+            return f'{designer_name(designer)} already has a file of this name'
+        return None
+
+    def resume_run(self, journal, state):
+        """
+        Finish the run recorded in an unfinished journal. Recorded moves are
+        counted from the journal; only the remaining files are classified.
+        """
+        if state.num_designers != self.num_designers:
+            print(f"Resuming the unfinished split into {state.num_designers} designers", file=sys.stderr)
+        self.num_designers = state.num_designers
+        # The moves left were planned with the recorded settings, whatever this run was given
+        for key, value in state.settings.items():
+            if key == 'output_folder':
+                value = value or self.source_folder
+            if value != getattr(self, key):
+                print(f"Resuming the unfinished split with {key} {value}", file=sys.stderr)
+                setattr(self, key, value)
+        with self.metrics.stage('resume'):
+            plan, done = self.restore(state)
+        with ClassificationStage(self.workers, self.cache, metrics=self.metrics,
+                                 executor=self.classify_executor, classifier=self.classifier) as classifier:
+            with self.metrics.stage('classify'):
+                for index, (designer, image_path) in enumerate(plan):
+                    if index not in done:
+                        classifier.submit(self.current_path(image_path, designer))
+            journal.open()
+            self.process(plan, classifier, journal, done)
+
+    def journal_settings(self):
+        """The splitimg.journal.JOURNAL_SETTINGS of this run, for the journal header."""
+        return {'output_folder': self.output_folder if self.output_folder != self.source_folder else None,
+                'balance': self.balance, 'stable': self.stable, 'designer_weights': self.designer_weights}
+
+    def restore(self, state):
+        """Rebuild the plan, stats and workloads of a journal, return the plan and the finished moves."""
+        self.create_designer_folders(duplicates=any(designer == DUPLICATES for designer, _ in state.plan))
+
+        plan = [(designer, os.path.join(self.source_folder, path)) for designer, path in state.plan]
+        self.stats['total_images'] = len(plan)
+        for _, image_path in plan:
+            ext = os.path.splitext(image_path)[1].lower()
+            self.stats['extensions'][ext] = self.stats['extensions'].get(ext, 0) + 1
+        self.scanned = len(plan)
+        self.scan_channel.notify()
+        self.scan_channel.close()
+
+        self.record_plan_workloads(plan)
+
+        # A record whose move then failed leaves the file where it was
+        done = {index: background for index, background in state.done.items()
+                if not os.path.lexists(plan[index][1])}
+        return plan, done
+
+    def record_plan_workloads(self, plan):
+        """Rebuild the groups of a plan to report each designer's workload."""
+        groups = {}
+        designers = {}
+        for designer, image_path in plan:
+            if designer == DUPLICATES:
+                continue
+            file_id = extract_file_id(os.path.basename(image_path))
+            groups.setdefault(file_id, []).append(self.current_path(image_path, designer))
+            designers[file_id] = designer
+        weights = None
+        if self.balance != 'groups':
+            weights = group_weights(groups, self.balance)
+        self.record_workloads([(designers[file_id], file_id, files) for file_id, files in groups.items()], weights)
+
+    def open_cache(self):
+        if not self.use_cache:
+            return
+        try:
+            self.cache = ClassificationCache(self.cache_path, hash_content=self.hash_content,
+                                             classifier=self.classifier.version)
+        except Exception as e:
+            print(f"Error opening classification cache: {str(e)}", file=sys.stderr)
+
+    def close_cache(self):
+        if self.cache is None:
+            return
+        self.stats['cache_hits'] = self.cache.hits
+        self.stats['cache_misses'] = self.cache.misses
+        try:
+            self.cache.close()
+        except Exception as e:
+            print(f"Error closing classification cache: {str(e)}", file=sys.stderr)
+        self.cache = None
+
+    def open_io(self):
+        if self.shared_io is not None:
+            self.io = self.shared_io
+        else:
+            self.io = AsyncIO(io_limit_for([self.source_folder, self.output_folder], self.io_limits))
+            self.io.start()
+        if isinstance(self.tagger, BatchedTagger):
+            self.tagger.io = self.io
+
+    def close_io(self):
+        if self.io is None:
+            return
+        if isinstance(self.tagger, BatchedTagger):
+            self.tagger.io = None
+        if self.io is not self.shared_io:
+            self.io.close()
+        self.io = None
+
+    def create_designer_folders(self, duplicates=False):
+        """Create the Designer folders, and the Duplicates folder with `duplicates`."""
+        designers = list(range(self.num_designers)) + ([DUPLICATES] if duplicates else [])
+        folders = [(designer_folder(self.output_folder, i), 0o777, True) for i in designers]
+        if self.io is not None:
+            for result in self.io.starmap(os.makedirs, folders):
+                if isinstance(result, Exception):
+                    raise result
+        else:
+            for folder in folders:
+                os.makedirs(*folder)
+        for i in designers:
+            self.stats['designer_files'][designer_name(i)] = 0
+
+    def iter_images(self):
+        """Yield (DirEntry, extension) for all supported images that carry a file ID."""
+        return scan_images(self.source_folder, self.supported_formats, self.scan_threads)
+
+    def probe(self, entries, chunk_size=64):
+        """
+        Yield (DirEntry, extension, ImageHeader) for scanned entries, in scan
+        order. Headers are read in chunks on the I/O layer, so on a network
+        share many files are opened at once.
+        """
+        if self.io is None:
+            for entry, ext in entries:
+                yield entry, ext, self.read_headers([entry.path])[0]
+            return
+        pending = deque()
+        chunk = []
+        for item in entries:
+            chunk.append(item)
+            if len(chunk) < chunk_size:
+                continue
+            pending.append((chunk, self.io.submit(self.read_headers, [entry.path for entry, _ in chunk])))
+            chunk = []
+            while len(pending) > self.io.limit * 2:
+                yield from self.probed(*pending.popleft())
+        if chunk:
+            pending.append((chunk, self.io.submit(self.read_headers, [entry.path for entry, _ in chunk])))
+        while pending:
+            yield from self.probed(*pending.popleft())
+
+    def probed(self, chunk, future):
+        for (entry, ext), header in zip(chunk, future.result()):
+            yield entry, ext, header
+
+    def read_headers(self, paths):
+        headers = []
+        for image_path in paths:
+            start = time.perf_counter()
+            headers.append(read_header(image_path))
+            self.metrics.observe('header', time.perf_counter() - start)
+        return headers
+
+    def record_problem(self, image_path, header):
+        """Count a file whose header prepass found a problem and keep it for the report."""
+        image_file = os.path.relpath(image_path, self.source_folder)
+        if header.ok:
+            self.stats['header_warnings'] += 1
+            action = 'Split'
+        else:
+            print(f"Skipping {image_file}: {header.error}", file=sys.stderr)
+            self.stats['unreadable_files'] += 1
+            action = 'Left in place'
+        self.problems.append((image_file, header.format or 'Unknown', header.problem, action))
+
+    def record_scanned(self, ext, count):
+        self.stats['extensions'][ext] = self.stats['extensions'].get(ext, 0) + 1
+        self.scanned = count
+        self.scan_channel.notify()
+
+    def emit_scan(self):
+        if self.scan_callback:
+            self.scan_callback(self.scanned)
+
+    def emit_progress(self):
+        if self.progress_callback:
+            elapsed = format_time(time.time() - (self.start_time or time.time()))
+            self.progress_callback(self.processed, elapsed, snapshot_stats(self.stats))
+
+    def scan(self):
+        """Return a PathTable of all supported images that carry a file ID."""
+        image_files = PathTable(self.spill_folder)
+        for entry, ext in self.iter_images():
+            image_files.add(entry.path)
+            self.record_scanned(ext, len(image_files))
+        return image_files
+
+    def group(self, image_files):
+        """
+        Group image paths, or the rows of a PathTable, by the file ID in
+        their names. Returns a GroupIndex, {file ID: GroupFiles} in file ID
+        order.
+        """
+        if not isinstance(image_files, PathTable):
+            paths, image_files = image_files, PathTable(self.spill_folder)
+            for image_path in paths:
+                image_files.add(image_path)
+        return GroupIndex(image_files)
+
+    def assign(self, image_groups, duplicates=()):
+        """
+        Distribute the groups of a GroupIndex to designers with the engine's
+        balance mode. Returns a list of (designer index, file ID, GroupFiles).
+
+        With dedup 'folder' the `duplicates` are left out, they go to the
+        Duplicates folder. With 'designer' the groups duplicates link
+        are assigned as one, so they land with the same designer.
+        """
+        roots = {}
+        if self.dedup == 'folder' and duplicates:
+            copies = set(image_groups.table.find(image_path for image_path, _, _, _ in duplicates).values())
+            image_groups = {file_id: group_files.without(copies) for file_id, group_files in image_groups.items()}
+            image_groups = {file_id: group_files for file_id, group_files in image_groups.items() if group_files}
+        elif self.dedup == 'designer':
+            roots = linked_groups(duplicates, lambda image_path: extract_file_id(os.path.basename(image_path)))
+
+        weights = None
+        if self.balance != 'groups':
+            weights = {file_id: group_files.weight(self.balance) for file_id, group_files in image_groups.items()}
+        units, unit_weights = image_groups, weights
+        if roots:
+            units = {}
+            unit_weights = {} if weights is not None else None
+            for file_id, group_files in image_groups.items():
+                root = roots.get(file_id, file_id)
+                units.setdefault(root, []).extend(group_files.rows())
+                if weights is not None:
+                    unit_weights[root] = unit_weights.get(root, 0) + weights[file_id]
+        if self.stable:
+            assignments = assign_stable(units, self.num_designers, self.designer_weights)
+        else:
+            assignments = assign_groups(units, self.num_designers, self.balance, unit_weights)
+        if roots:
+            # Back to one assignment per file ID, each with its linked set's designer
+            chosen = {root: designer for designer, root, _ in assignments}
+            assignments = [(chosen[roots.get(file_id, file_id)], file_id, group_files)
+                           for file_id, group_files in sorted(image_groups.items())]
+        self.record_workloads(assignments, weights)
+        return assignments
+
+    def find_duplicates(self, hashes):
+        """
+        Return (path, original path, match, distance) for every duplicate
+        among the hashed images, see splitimg.dedup.find_duplicates. The
+        image with the lowest file ID is kept as the original.
+        """
+        ordered = sorted(hashes.items(), key=lambda item: (extract_file_id(os.path.basename(item[0])), item[0]))
+        duplicates = find_duplicates([(image_path, *hashed) for image_path, hashed in ordered], self.dedup_distance)
+        self.stats['duplicates'] = len(duplicates)
+        return duplicates
+
+    def record_duplicates(self, duplicates, plan):
+        """Keep the Duplicates table rows, with the folder each duplicate is planned into."""
+        if not duplicates:
+            return
+        copies = {image_path for image_path, _, _, _ in duplicates}
+        designers = {image_path: designer for designer, image_path in plan if image_path in copies}
+        for image_path, original, match, distance in duplicates:
+            self.duplicates.append((os.path.relpath(image_path, self.source_folder),
+                                    os.path.relpath(original, self.source_folder), match, distance,
+                                    designer_name(designers[image_path])))
+
+    def record_workloads(self, assignments, weights):
+        totals, imbalance = designer_workloads(assignments, self.num_designers, weights)
+        self.stats['balance_mode'] = self.balance
+        self.stats['workloads'] = {designer_name(i): total for i, total in enumerate(totals)}
+        self.stats['imbalance_ratio'] = imbalance
+
+    def plan(self, assignments, image_files):
+        """Flatten assignments into a MovePlan over `image_files`, the ordered (designer index, path) moves."""
+        plan = MovePlan(image_files, self.spill_folder)
+        for designer, _, group_files in assignments:
+            for row in group_files.rows():
+                plan.append(designer, row)
+        return plan
+
+    def destination(self, image_path, designer):
+        return os.path.join(designer_folder(self.output_folder, designer), os.path.basename(image_path))
+
+    def current_path(self, image_path, designer):
+        """Where a planned file is now, its destination if the move already happened."""
+        if os.path.lexists(image_path):
+            return image_path
+        dest_path = self.destination(image_path, designer)
+        return dest_path if os.path.lexists(dest_path) else image_path
+
+    def move(self, image_path, designer):
+        dest_path = self.destination(image_path, designer)
+        start = time.perf_counter()
+        try:
+            move_file(image_path, dest_path)
+        except FileNotFoundError:
+            # Moved by an interrupted run after its journal record was written
+            if os.path.lexists(image_path) or not os.path.lexists(dest_path):
+                raise
+        finally:
+            self.metrics.observe('move', time.perf_counter() - start)
+        return dest_path
+
+    def process(self, plan, classifier, journal, done=None):
+        self.start_report()
+        try:
+            with self.tagger:
+                with self.metrics.stage('move_and_tag'):
+                    self.move_and_tag(plan, classifier, journal, done)
+                # Batched taggers write what they still hold here
+                with self.metrics.stage('tag_flush'):
+                    self.tagger.flush()
+            journal.finish()
+        finally:
+            journal.close()
+            self.progress_channel.close()
+        return self.processed
+
+    def move_and_tag(self, plan, classifier, journal, done=None):
+        """Move and tag every planned file, `done` holds the moves of a resumed run."""
+        resuming = done is not None
+        done = done or {}
+        # Results of a split are kept by row, see prepare()
+        rows = plan.rows if isinstance(plan, MovePlan) else None
+        # Moves run on the transfer pool, results are taken back in plan order
+        pending = deque()
+        # Moves go through the I/O layer unless a job queue shares its pool
+        executor = self.transfer_executor or self.io
+        workers = self.transfer_workers or (self.io.limit if self.io is not None else None)
+        with TransferPool(workers, executor=executor) as transfers:
+            for index, (designer, image_path) in enumerate(plan):
+                image_file = os.path.basename(image_path)
+                self.stats['designer_files'][designer_name(designer)] += 1
+
+                if index in done:
+                    self.add_report_row(designer, image_file, done[index])
+                    self.count_background(done[index])
+                    self.processed += 1
+                    self.progress_channel.notify()
+                    continue
+
+                if resuming:
+                    background = classifier.result(self.current_path(image_path, designer))
+                elif rows is not None:
+                    background = classifier.result(image_path, rows[index])
+                else:
+                    background = classifier.result(image_path)
+                self.add_report_row(designer, image_file, background)
+                try:
+                    # The record is written before the move so a crash can be resumed
+                    journal.record(index, background)
+                except Exception as e:
+                    print(f"Error processing {image_file}: {str(e)}", file=sys.stderr)
+                    continue
+                pending.append((image_file, background, transfers.submit(self.move, image_path, designer)))
+                while len(pending) > transfers.max_pending:
+                    self.finish_move(*pending.popleft())
+            while pending:
+                self.finish_move(*pending.popleft())
+
+    def finish_move(self, image_file, background, transfer):
+        try:
+            dest_path = transfer.result()
+
+            # Apply tag based on background
+            tag_index = self.count_background(background)
+            start = time.perf_counter()
+            self.tagger.tag(dest_path, tag_index)
+            self.metrics.observe('tag', time.perf_counter() - start)
+
+            self.processed += 1
+            self.progress_channel.notify()
+
+        except Exception as e:
+            print(f"Error processing {image_file}: {str(e)}", file=sys.stderr)
+
+    def start_report(self):
+        try:
+            self.report = open_report(self.output_folder, self.report_format)
+        except Exception as e:
+            print(f"Error creating report: {str(e)}", file=sys.stderr)
+
+    def add_report_row(self, designer, image_file, background):
+        if self.report is None:
+            return
+        start = time.perf_counter()
+        try:
+            self.report.add_file(designer_name(designer), image_file, background)
+            self.metrics.observe('report', time.perf_counter() - start)
+        except Exception as e:
+            print(f"Error writing report: {str(e)}", file=sys.stderr)
+            self.abort_report()
+
+    def close_report(self, start_time):
+        if self.report is None:
+            return
+        try:
+            self.report_path = self.report.close(self.stats, start_time, self.problems, self.duplicates)
+        except Exception as e:
+            print(f"Error creating report: {str(e)}", file=sys.stderr)
+        self.report = None
+
+    def save_metrics(self):
+        if self.metrics_format is None:
+            return
+        try:
+            self.metrics_path = write_metrics(self.output_folder, self.metrics.summary(), self.metrics_format)
+        except Exception as e:
+            print(f"Error writing metrics: {str(e)}", file=sys.stderr)
+
+    def abort_report(self):
+        if self.report is None:
+            return
+        try:
+            self.report.abort()
+        except Exception as e:
+            print(f"Error closing report: {str(e)}", file=sys.stderr)
+        self.report = None
+
+    def count_background(self, background):
+        """Count a classified file and return the Finder label for its background class."""
+        if background == BACKGROUND_WHITE:
+            self.stats['white_background'] += 1
+            return WHITE_TAG
+        if background == BACKGROUND_GRAY:
+            # Gray is a kind of non-white, so the two white counts still add up
+            self.stats['gray_background'] += 1
+            self.stats['non_white_background'] += 1
+            return GRAY_TAG
+        self.stats['non_white_background'] += 1
+        return NON_WHITE_TAG
@@ -0,0 +1,422 @@
+"""
+Header-only metadata prepass.
+
+read_header() identifies a file by its magic bytes and reads its
+dimensions and bit depth from the format header, without decoding pixels.
+It reads the first HEAD_BYTES of the file and its last TAIL_BYTES, plus a
+few small reads for JPEG segments or TIFF directories that lie further in,
+so it stays cheap enough to run on every scanned file. Only a JPEG whose
+end marker is not in its tail is read further back, up to JPEG_EOI_WINDOW.
+
+Problems come in two kinds. An `error` (an empty file, a format SplitImg
+cannot open, a header cut short, zero dimensions) means the file is left
+where it is. A `warning` (PNG data in a .jpg file, a missing end marker
+from a truncated upload) is listed in the report, but the file is still
+split, since it usually opens.
+"""
+import os
+import struct
+
+HEAD_BYTES = 512
+TAIL_BYTES = 32
+# How far from the end a JPEG's end of image marker is looked for. Cameras
+# and editors append padding and trailers (maker data, thumbnails) after it
+JPEG_EOI_WINDOW = 1 << 20
+# Bytes read at a time while searching backwards
+SEARCH_CHUNK = 64 * 1024
+# JPEG segments walked before giving up on finding the frame header
+MAX_JPEG_SEGMENTS = 64
+
+# Detected format -> the extensions it is expected under
+FORMAT_EXTENSIONS = {
+    'PNG': ('.png',),
+    'JPEG': ('.jpg', '.jpeg'),
+    'GIF': ('.gif',),
+    'BMP': ('.bmp',),
+    'TIFF': ('.tiff', '.tif'),
+}
+
+# Formats that are recognised but not split, by their leading bytes
+OTHER_SIGNATURES = (
+    (b'8BPS', 'PSD'),
+    (b'%PDF', 'PDF'),
+    (b'PK\x03\x04', 'ZIP'),
+    (b'\x00\x00\x00\x0cjP  ', 'JPEG 2000'),
+    (b'\xff\x4f\xff\x51', 'JPEG 2000'),
+    (b'\x00\x00\x01\x00', 'ICO'),
+    (b'<?xml', 'XML'),
+    (b'<svg', 'SVG'),
+)
+# ISO base media brands at offset 8 of an 'ftyp' box
+FTYP_BRANDS = {b'heic': 'HEIC', b'heix': 'HEIC', b'mif1': 'HEIF', b'avif': 'AVIF', b'crx ': 'CR3'}
+
+# PNG colour type -> channels
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# JPEG start-of-frame markers, all SOFn except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_PROGRESSIVE_MARKERS = {0xC2, 0xC6, 0xCA, 0xCE}
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+EXIF_THUMBNAIL_OFFSET = 513
+EXIF_THUMBNAIL_LENGTH = 514
+EXIF_THUMBNAIL_TAGS = {EXIF_THUMBNAIL_OFFSET, EXIF_THUMBNAIL_LENGTH}
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_NEW_SUBFILE_TYPE = 254
+TIFF_SUB_IFDS = 330
+TIFF_HEADER_TAGS = {TIFF_IMAGE_WIDTH, TIFF_IMAGE_LENGTH, TIFF_BITS_PER_SAMPLE, TIFF_SAMPLES_PER_PIXEL}
+# Directories read before giving up, against loops and files with thousands of pages
+MAX_TIFF_DIRECTORIES = 32
+# TIFF field type -> struct format of one value. Rationals are two values.
+TIFF_FIELD_FORMATS = {1: 'B', 2: 'B', 3: 'H', 4: 'I', 5: 'II', 6: 'b', 7: 'B', 8: 'h', 9: 'i', 10: 'ii',
+                      11: 'f', 12: 'd', 13: 'I', 16: 'Q', 17: 'q', 18: 'Q'}
+
+
+class HeaderError(Exception):
+    """A header that cannot be parsed."""
+
+
+class ImageHeader:
+    """What the header of one file says: format, dimensions, bit depth and any problem."""
+
+    def __init__(self, file_format=None, width=0, height=0, bit_depth=0, size=0, error=None, warning=None):
+        self.format = file_format
+        self.width = width
+        self.height = height
+        # Bits per pixel over all channels
+        self.bit_depth = bit_depth
+        self.size = size
+        self.error = error
+        self.warning = warning
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+    @property
+    def problem(self):
+        return self.error or self.warning
+
+    def __repr__(self):
+        return (f'ImageHeader({self.format}, {self.width}x{self.height}, {self.bit_depth} bit, '
+                f'{self.size} bytes, error={self.error!r}, warning={self.warning!r})')
+
+
+class HeaderFile:
+    """The head and tail of an open file, with seeks for anything in between."""
+
+    def __init__(self, f):
+        self.f = f
+        self.head = f.read(HEAD_BYTES)
+        self.size = f.seek(0, os.SEEK_END)
+        if self.size > len(self.head):
+            f.seek(max(len(self.head), self.size - TAIL_BYTES))
+            self.tail = f.read(TAIL_BYTES)
+        else:
+            self.tail = self.head[-TAIL_BYTES:]
+
+    def read(self, offset, length):
+        if offset + length <= len(self.head):
+            data = self.head[offset:offset + length]
+        else:
+            self.f.seek(offset)
+            data = self.f.read(length)
+        if len(data) < length:
+            raise HeaderError('header cut short')
+        return data
+
+    def unpack(self, fmt, offset):
+        return struct.unpack(fmt, self.read(offset, struct.calcsize(fmt)))
+
+    def find_near_end(self, marker, window):
+        """Whether `marker` is in the last `window` bytes, searched backwards a chunk at a time."""
+        if marker in self.tail:
+            return True
+        if self.size <= len(self.head):
+            return marker in self.head
+        stop = max(0, self.size - window)
+        end = self.size
+        while end > stop:
+            start = max(stop, end - SEARCH_CHUNK)
+            self.f.seek(start)
+            # Overlapping the previous chunk, so a marker across the boundary is found
+            if marker in self.f.read(end - start + len(marker) - 1):
+                return True
+            end = start
+        return False
+
+
+def sniff_format(head):
+    """Name of the format `head` (the first bytes of a file) starts with, or None."""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head.startswith(b'BM'):
+        return 'BMP'
+    if head[:4] in (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'):
+        return 'TIFF'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if head[4:8] == b'ftyp':
+        return FTYP_BRANDS.get(head[8:12], 'ISO media')
+    for signature, name in OTHER_SIGNATURES:
+        if head.startswith(signature):
+            return name
+    return None
+
+
+def read_header(image_path):
+    """
+    Read the header of `image_path` and return an ImageHeader. Never raises,
+    unreadable files come back with `error` set.
+    """
+    try:
+        with open(image_path, 'rb', buffering=0) as f:
+            header_file = HeaderFile(f)
+            header = parse_header(header_file)
+    except OSError as e:
+        return ImageHeader(error=f'unreadable: {e.strerror or e}')
+    ext = os.path.splitext(image_path)[1].lower()
+    if header.ok and ext not in FORMAT_EXTENSIONS[header.format]:
+        header.warning = f'{header.format} data in a {ext} file'
+    return header
+
+
+def parse_header(header_file):
+    """Parse an open HeaderFile into an ImageHeader."""
+    if not header_file.size:
+        return ImageHeader(error='empty file')
+    file_format = sniff_format(header_file.head)
+    if file_format is None:
+        return ImageHeader(size=header_file.size, error='not an image')
+    if file_format not in FORMAT_EXTENSIONS:
+        return ImageHeader(file_format, size=header_file.size, error=f'{file_format} is not a supported format')
+    header = ImageHeader(file_format, size=header_file.size)
+    try:
+        header.width, header.height, header.bit_depth, header.warning = _PARSERS[file_format](header_file)
+    except (HeaderError, struct.error) as e:
+        header.error = str(e) or 'header cut short'
+        return header
+    if not header.width or not header.height:
+        header.error = f'{header.width}x{header.height} pixels'
+    return header
+
+
+def _png(header_file):
+    length, chunk = header_file.unpack('>I4s', 8)
+    if chunk != b'IHDR' or length < 13:
+        raise HeaderError('no PNG image header')
+    width, height, depth, colour_type = header_file.unpack('>IIBB', 16)
+    return width, height, depth * PNG_CHANNELS.get(colour_type, 1), _missing_end(
+        b'IEND' in header_file.tail, 'IEND chunk')
+
+
+def _jpeg(header_file):
+    frame = read_jpeg_frame(header_file)
+    return frame.width, frame.height, frame.precision * frame.components, _missing_end(
+        header_file.find_near_end(b'\xff\xd9', JPEG_EOI_WINDOW), 'end of image marker')
+
+
+class JpegFrame:
+    """The frame header of a JPEG, and where its EXIF data starts if it has any."""
+
+    def __init__(self, marker, precision, width, height, components, exif_base=None):
+        self.marker = marker
+        self.precision = precision
+        self.width = width
+        self.height = height
+        self.components = components
+        # Offset of the TIFF structure inside the APP1 Exif segment
+        self.exif_base = exif_base
+
+    @property
+    def progressive(self):
+        return self.marker in JPEG_PROGRESSIVE_MARKERS
+
+
+def read_jpeg_frame(header_file):
+    """Walk the JPEG segments up to the frame header and return a JpegFrame."""
+    offset = 2
+    exif_base = None
+    for _ in range(MAX_JPEG_SEGMENTS):
+        prefix, marker = header_file.read(offset, 2)
+        if prefix != 0xFF:
+            raise HeaderError('corrupt JPEG segment')
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise HeaderError('no JPEG frame header')
+        length, = header_file.unpack('>H', offset + 2)
+        if marker == 0xE1 and exif_base is None and header_file.read(offset + 4, 6) == b'Exif\x00\x00':
+            exif_base = offset + 10
+        if marker in JPEG_SOF_MARKERS:
+            precision, height, width, components = header_file.unpack('>BHHB', offset + 4)
+            return JpegFrame(marker, precision, width, height, components, exif_base)
+        offset += 2 + length
+    raise HeaderError('no JPEG frame header')
+
+
+def exif_thumbnail(header_file, frame):
+    """Bytes of the JPEG thumbnail in a JPEG's EXIF data, or None."""
+    if frame.exif_base is None:
+        return None
+    try:
+        # The thumbnail is described by the second directory, IFD1
+        thumbnail = next((directory for directory in read_tiff_directories(
+            header_file, EXIF_THUMBNAIL_TAGS, base=frame.exif_base) if EXIF_THUMBNAIL_OFFSET in directory), None)
+        if thumbnail is None:
+            return None
+        data = header_file.read(frame.exif_base + thumbnail[EXIF_THUMBNAIL_OFFSET][0],
+                                thumbnail[EXIF_THUMBNAIL_LENGTH][0])
+    except (HeaderError, KeyError, struct.error):
+        return None
+    return data if data.startswith(b'\xff\xd8') else None
+
+
+def _gif(header_file):
+    width, height, packed = header_file.unpack('<HHB', 6)
+    # Bits per palette index, from the global colour table size
+    depth = (packed & 0x07) + 1 if packed & 0x80 else 8
+    return width, height, depth, _missing_end(header_file.tail.rstrip(b'\x00').endswith(b';'), 'trailer')
+
+
+def _bmp(header_file):
+    file_size, = header_file.unpack('<I', 2)
+    dib_size, = header_file.unpack('<I', 14)
+    if dib_size == 12:
+        width, height, _, depth = header_file.unpack('<HHHH', 18)
+    else:
+        width, height, _, depth = header_file.unpack('<iiHH', 18)
+    # Negative heights are stored top-down
+    return abs(width), abs(height), depth, _missing_end(header_file.size >= file_size, 'pixel data')
+
+
+def _tiff(header_file):
+    directory = next(read_tiff_directories(header_file, TIFF_HEADER_TAGS, follow=False))
+    bits = directory.get(TIFF_BITS_PER_SAMPLE, (1,))[0]
+    samples = directory.get(TIFF_SAMPLES_PER_PIXEL, (1,))[0]
+    return directory.width, directory.height, bits * samples, None
+
+
+class TiffDirectory:
+    """
+    The tags of one TIFF image file directory that were asked for. Values
+    are tuples (rationals as floats), text and undefined data are bytes.
+    `tagtype` holds the TIFF field type of every tag, named as in Pillow's
+    ImageFileDirectory so either can be passed where tags are read.
+    """
+
+    def __init__(self, offset, tags, tagtype, next_offset, sub_offsets):
+        self.offset = offset
+        self.tags = tags
+        self.tagtype = tagtype
+        self.next_offset = next_offset
+        self.sub_offsets = sub_offsets
+
+    def get(self, tag, default=None):
+        return self.tags.get(tag, default)
+
+    def __contains__(self, tag):
+        return tag in self.tags
+
+    def __getitem__(self, tag):
+        return self.tags[tag]
+
+    @property
+    def width(self):
+        return self.tags.get(TIFF_IMAGE_WIDTH, (0,))[0]
+
+    @property
+    def height(self):
+        return self.tags.get(TIFF_IMAGE_LENGTH, (0,))[0]
+
+    @property
+    def reduced(self):
+        """True for a reduced-resolution copy of another image (a preview)."""
+        return bool(self.tags.get(TIFF_NEW_SUBFILE_TYPE, (0,))[0] & 1)
+
+
+def read_tiff_directories(header_file, wanted, base=0, follow=True):
+    """
+    Yield a TiffDirectory for the TIFF file starting at offset `base` of
+    `header_file`, then with `follow` for every further directory in the
+    chain and their SubIFDs. Only the tags in `wanted` are read, so large
+    private tags such as Photoshop layer data are never loaded.
+    """
+    order = '<' if header_file.read(base, 2) == b'II' else '>'
+    big = header_file.unpack(order + 'H', base + 2)[0] == 43
+    # BigTIFF has 8-byte counts and offsets and 20-byte entries
+    offset_format = 'Q' if big else 'I'
+    offset, = header_file.unpack(order + offset_format, base + (8 if big else 4))
+    wanted = set(wanted) | {TIFF_SUB_IFDS} if follow else wanted
+    pending = [offset]
+    seen = set()
+    while pending and len(seen) < MAX_TIFF_DIRECTORIES:
+        offset = pending.pop(0)
+        if not offset or offset in seen:
+            continue
+        seen.add(offset)
+        directory = _read_tiff_directory(header_file, order, big, base, offset, wanted)
+        yield directory
+        if not follow:
+            return
+        pending.extend(directory.sub_offsets)
+        pending.append(directory.next_offset)
+
+
+def _read_tiff_directory(header_file, order, big, base, offset, wanted):
+    if base + offset >= header_file.size:
+        raise HeaderError('TIFF directory past the end of the file')
+    count_format, values_format, offset_format = ('Q', 'Q', 'Q') if big else ('H', 'I', 'I')
+    field_size = 8 if big else 4
+    entry_size = 4 + 2 * field_size
+    count, = header_file.unpack(order + count_format, base + offset)
+    start = base + offset + struct.calcsize(count_format)
+    entries = header_file.read(start, count * entry_size)
+    tags = {}
+    types = {}
+    for index in range(count):
+        position = index * entry_size
+        tag, field_type = struct.unpack_from(order + 'HH', entries, position)
+        if tag not in wanted or field_type not in TIFF_FIELD_FORMATS:
+            continue
+        values, = struct.unpack_from(order + values_format, entries, position + 4)
+        item_format = TIFF_FIELD_FORMATS[field_type]
+        size = struct.calcsize(item_format) * values
+        position += entry_size - field_size
+        if size <= field_size:
+            # Values are stored in the entry itself when they fit
+            data = entries[position:position + size]
+        else:
+            data = header_file.read(base + struct.unpack_from(order + offset_format, entries, position)[0], size)
+        if field_type in (2, 7):
+            tags[tag] = data
+        else:
+            tags[tag] = struct.unpack(order + item_format * values, data)
+            if field_type in (5, 10):
+                tags[tag] = tuple(numerator / denominator if denominator else 0.0
+                                  for numerator, denominator in zip(tags[tag][::2], tags[tag][1::2]))
+        types[tag] = field_type
+    next_offset, = header_file.unpack(order + offset_format, start + count * entry_size)
+    types.pop(TIFF_SUB_IFDS, None)
+    return TiffDirectory(offset, tags, types, next_offset, tags.pop(TIFF_SUB_IFDS, ()))
+
+
+def _missing_end(present, what):
+    return None if present else f'truncated, no {what}'
+
+
+_PARSERS = {'PNG': _png, 'JPEG': _jpeg, 'GIF': _gif, 'BMP': _bmp, 'TIFF': _tiff}
@@ -0,0 +1,273 @@
+"""
+Job queue for splitting several folders at once.
+
+Each queued folder runs as its own SplitEngine with its own progress,
+journal, report and metrics. Running jobs share one classification process
+pool and one AsyncIO for moves and other file system calls. Each job's
+calls go through the IOView of its mounts, so jobs on the same share stay
+within its I/O limit together. Classification and moves are handed out
+round-robin between jobs (FairExecutor), so a small folder queued behind a
+large one gets an equal share of decoding and I/O and finishes early
+instead of waiting for the large one.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from .aio import DEFAULT_NETWORK_LIMIT, AsyncIO
+
+DEFAULT_MAX_JOBS = 2
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+
+class FairExecutor:
+    """
+    Shares an executor between jobs. At most `slots` tasks are running on
+    it at once; when one finishes, the next task is taken from the job after
+    the one that started last, so every job with queued work takes turns.
+    A job can hand its tasks to another executor than the shared one, as
+    jobs do with the IOView of their mounts.
+    """
+
+    def __init__(self, executor, slots):
+        self.executor = executor
+        self.slots = slots
+        self.running = 0
+        # job -> deque of (future, fn, args), in turn order
+        self.queues = OrderedDict()
+        self.lock = threading.Lock()
+
+    def for_job(self, job, executor=None):
+        """Executor-like view that submits on behalf of `job`, to `executor` when given."""
+        return JobExecutor(self, job, executor or self.executor)
+
+    def submit(self, job, fn, *args):
+        return self.submit_to(self.executor, job, fn, *args)
+
+    def submit_to(self, executor, job, fn, *args):
+        future = Future()
+        with self.lock:
+            self.queues.setdefault(job, deque()).append((future, executor, fn, args))
+        self.dispatch()
+        return future
+
+    def dispatch(self):
+        while True:
+            with self.lock:
+                if self.running >= self.slots or not self.queues:
+                    return
+                job, tasks = self.queues.popitem(last=False)
+                future, executor, fn, args = tasks.popleft()
+                if tasks:
+                    # Back of the line until the other jobs had a turn
+                    self.queues[job] = tasks
+                self.running += 1
+            if not future.set_running_or_notify_cancel():
+                self.release()
+                continue
+            try:
+                inner = executor.submit(fn, *args)
+            except BaseException as e:
+                future.set_exception(e)
+                self.release()
+                continue
+            inner.add_done_callback(lambda inner, future=future: self.finish(future, inner))
+
+    def finish(self, future, inner):
+        try:
+            future.set_result(inner.result())
+        except BaseException as e:
+            future.set_exception(e)
+        self.release()
+        self.dispatch()
+
+    def release(self):
+        with self.lock:
+            self.running -= 1
+
+
+class JobExecutor:
+    """The submit() of a FairExecutor for one job, what ClassificationStage and TransferPool expect."""
+
+    def __init__(self, fair_executor, job, executor):
+        self.fair_executor = fair_executor
+        self.job = job
+        self.executor = executor
+
+    def submit(self, fn, *args):
+        return self.fair_executor.submit_to(self.executor, self.job, fn, *args)
+
+
+class Job:
+    """One queued folder. `options` are passed on to its SplitEngine."""
+
+    def __init__(self, job_id, source_folder, num_designers, priority=0, **options):
+        self.id = job_id
+        self.source_folder = source_folder
+        self.num_designers = num_designers
+        self.priority = priority
+        self.options = options
+        self.state = 'queued'
+        self.engine = None
+        self.stats = None
+        self.error = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def name(self):
+        return os.path.basename(os.path.normpath(self.source_folder))
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'source': self.source_folder,
+            'state': self.state,
+            'error': self.error,
+            'report': self.engine.report_path if self.engine else None,
+            'metrics': self.engine.metrics_path if self.engine else None,
+            'wait_seconds': round((self.started_at or time.time()) - self.queued_at, 3),
+            'run_seconds': round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
+
+
+class JobQueue:
+    """
+    Runs queued folders, up to `max_jobs` at a time, on a shared pool of
+    `workers` classification processes and one AsyncIO. Each job keeps the
+    I/O limit of its mounts, see splitimg.aio.io_limit_for and `io_limits`;
+    `transfer_workers` caps the moves of all jobs together (None leaves
+    them to the I/O limits).
+
+    Jobs start in order of priority (highest first), then in the order they
+    were queued, and more can be added while others run. The callbacks get
+    the Job as their first argument:
+
+        progress_callback(job, processed, elapsed, stats)
+        scan_callback(job, count)
+        job_callback(job)                  on every state change
+    """
+
+    def __init__(self, max_jobs=DEFAULT_MAX_JOBS, workers=None, transfer_workers=None, io_limits=None,
+                 progress_callback=None, scan_callback=None, job_callback=None):
+        self.max_jobs = max(1, max_jobs)
+        self.workers = workers or os.cpu_count() or 1
+        self.transfer_workers = transfer_workers
+        self.io_limits = io_limits
+        self.progress_callback = progress_callback
+        self.scan_callback = scan_callback
+        self.job_callback = job_callback
+        self.jobs = []
+        self.next_id = 1
+        self.process_pool = None
+        self.io = None
+        self.classify_executor = None
+        self.transfer_executor = None
+        self.condition = threading.Condition()
+        self.running = 0
+        self.closed = False
+        self.scheduler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        if self.workers > 1:
+            self.process_pool = ProcessPoolExecutor(max_workers=self.workers)
+            # Two batches per process keep the pool busy between turns
+            self.classify_executor = FairExecutor(self.process_pool, self.workers * 2)
+        # Enough threads for every running job to use the highest limit; each
+        # job's IOView holds it to the limit of its own mounts
+        highest = max([DEFAULT_NETWORK_LIMIT, *(self.io_limits or {}).values()])
+        self.io = AsyncIO(self.max_jobs * highest, self.io_limits)
+        self.io.start()
+        self.transfer_executor = FairExecutor(self.io, self.transfer_workers or self.io.limit)
+        self.scheduler = threading.Thread(target=self.schedule, name='splitimg-jobs', daemon=True)
+        self.scheduler.start()
+
+    def submit(self, source_folder, num_designers, priority=0, **options):
+        """Queue a folder and return its Job."""
+        with self.condition:
+            job = Job(self.next_id, source_folder, num_designers, priority, **options)
+            self.next_id += 1
+            self.jobs.append(job)
+            self.condition.notify_all()
+        self.notify(job)
+        return job
+
+    def join(self):
+        """Wait until every queued job has finished."""
+        with self.condition:
+            self.condition.wait_for(lambda: all(job.finished_at is not None for job in self.jobs))
+
+    def close(self):
+        """Stop taking jobs, wait for the running ones and shut the pools down."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.running == 0)
+        if self.scheduler is not None:
+            self.scheduler.join()
+            self.scheduler = None
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True, cancel_futures=True)
+            self.process_pool = None
+        if self.io is not None:
+            self.io.close()
+            self.io = None
+
+    def schedule(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or (self.running < self.max_jobs and self.queued()))
+                if self.closed:
+                    return
+                job = min(self.queued(), key=lambda job: (-job.priority, job.id))
+                job.state = 'running'
+                job.started_at = time.time()
+                self.running += 1
+            threading.Thread(target=self.run_job, args=(job,), name=f'splitimg-job-{job.id}', daemon=True).start()
+
+    def queued(self):
+        return [job for job in self.jobs if job.state == 'queued']
+
+    def run_job(self, job):
+        # Imported here like everywhere else the engine is, it loads Pillow
+        from .engine import SplitEngine
+
+        self.notify(job)
+        try:
+            io = self.io.view([job.source_folder, job.options.get('output_folder') or job.source_folder])
+            job.engine = SplitEngine(
+                job.source_folder, job.num_designers, workers=self.workers,
+                transfer_workers=self.transfer_workers, shared_io=io,
+                classify_executor=self.classify_executor.for_job(job.id) if self.classify_executor else None,
+                transfer_executor=self.transfer_executor.for_job(job.id, io),
+                progress_callback=self.progress_callback and (
+                    lambda processed, elapsed, stats: self.progress_callback(job, processed, elapsed, stats)),
+                scan_callback=self.scan_callback and (lambda count: self.scan_callback(job, count)),
+                **job.options)
+            job.stats = job.engine.run()
+            job.state = 'done'
+        except Exception as e:
+            print(f"Error processing {job.source_folder}: {str(e)}", file=sys.stderr)
+            job.error = str(e)
+            job.state = 'failed'
+        self.notify(job)
+        # Marked finished only after the callback, so join() does not return while it runs
+        with self.condition:
+            job.finished_at = time.time()
+            self.running -= 1
+            self.condition.notify_all()
+
+    def notify(self, job):
+        if self.job_callback:
+            self.job_callback(job)
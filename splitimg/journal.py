@@ -0,0 +1,122 @@
+"""
+Append-only journal of the moves made by a run.
+
+The journal sits in the source folder as a JSON-lines file. A run first
+writes the whole plan (a header line plus one line per file) and fsyncs
+it, then appends one record before each move. Records are fsynced in
+batches. If the run stops half way, the next run finds the unfinished
+journal and resumes from the plan instead of scanning and classifying
+again.
+"""
+import json
+import os
+
+JOURNAL_NAME = '.splitimg_journal.jsonl'
+JOURNAL_VERSION = 1
+# Engine settings the moves were planned with, kept in the header so a
+# resumed run finishes with them. Journals written before they were
+# recorded lack these keys.
+JOURNAL_SETTINGS = ('output_folder', 'balance', 'stable', 'designer_weights')
+
+
+class JournalState:
+    """An unfinished run read back from a journal."""
+
+    def __init__(self, header, plan, done):
+        self.header = header
+        # List of (designer index, path relative to the source folder)
+        self.plan = plan
+        # Plan index -> background class, for every move that was recorded
+        self.done = done
+
+    @property
+    def num_designers(self):
+        return self.header['num_designers']
+
+    @property
+    def settings(self):
+        """The recorded JOURNAL_SETTINGS, an output_folder of None being the source folder."""
+        return {key: self.header[key] for key in JOURNAL_SETTINGS if key in self.header}
+
+
+class MoveJournal:
+    def __init__(self, source_folder, sync_every=256):
+        self.source_folder = source_folder
+        self.path = os.path.join(source_folder, JOURNAL_NAME)
+        self.sync_every = sync_every
+        self.file = None
+        self.unsynced = 0
+
+    def load(self):
+        """Return the JournalState of an unfinished run, or None."""
+        try:
+            f = open(self.path, encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        header = None
+        plan = []
+        done = {}
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash
+                    break
+                kind = record.get('type')
+                if kind == 'plan':
+                    header = record
+                elif kind == 'entry':
+                    plan.append((record['designer'], record['path']))
+                elif kind == 'move':
+                    done[record['index']] = int(record['background'] if 'background' in record else record['white'])
+                elif kind == 'done':
+                    return None
+        if header is None or header.get('version') != JOURNAL_VERSION or len(plan) != header.get('entries'):
+            return None
+        return JournalState(header, plan, done)
+
+    def start(self, num_designers, plan, settings=None):
+        """
+        Write the plan, a list of (designer index, absolute path), and open
+        the journal for move records. `settings` holds the JOURNAL_SETTINGS
+        of the run. The plan file is written to a temporary name first so a
+        crash never leaves half a plan behind.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'type': 'plan', 'version': JOURNAL_VERSION,
+                                'num_designers': num_designers, 'entries': len(plan), **(settings or {})}) + '\n')
+            for designer, image_path in plan:
+                f.write(json.dumps({'type': 'entry', 'designer': designer,
+                                    'path': os.path.relpath(image_path, self.source_folder)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, index, background):
+        """Record a move before it is made."""
+        self.file.write(json.dumps({'type': 'move', 'index': index, 'background': background}) + '\n')
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def finish(self):
+        """Mark the run complete, a finished journal is never resumed."""
+        self.file.write(json.dumps({'type': 'done'}) + '\n')
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,170 @@
+"""
+Run metrics.
+
+RunMetrics collects the wall time of each run stage, per-file latency
+histograms for header reads, decode, classify, duplicate hashing, move,
+tag and report rows, and the bytes read by the decoders. The summary goes
+into the report's Metrics sheet and into a JSON or Prometheus textfile
+next to the report.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_BASE = 'SplitImg_Metrics'
+METRICS_FORMATS = ('json', 'prometheus')
+METRICS_EXTENSIONS = {'json': '.json', 'prometheus': '.prom'}
+
+# Upper bounds in seconds, from a cached rename to a slow NAS copy or Finder round-trip
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+OPERATIONS = ('header', 'decode', 'classify', 'hash', 'move', 'tag', 'report')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, safe to observe from several threads."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the overflow bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the maximum for the last one)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+            'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+
+class RunMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.latency = {operation: Histogram() for operation in OPERATIONS}
+        self.bytes_read = 0
+        self.files = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall time of the block to stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def observe(self, operation, seconds):
+        self.latency[operation].observe(seconds)
+
+    def add_bytes(self, count):
+        self.bytes_read += count
+
+    def finish(self, files):
+        self.files = files
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        wall = max((self.finished or time.perf_counter()) - self.started, 1e-9)
+        return {
+            'wall_seconds': round(wall, 3),
+            'files': self.files,
+            'files_per_second': round(self.files / wall, 1),
+            'bytes_read': self.bytes_read,
+            'read_mb_per_second': round(self.bytes_read / wall / 2 ** 20, 2),
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            'latency': {operation: histogram.summary() for operation, histogram in self.latency.items()},
+        }
+
+
+def metric_rows(summary):
+    """Rows of (section, metric, value) for a report table."""
+    rows = [['Run', 'Wall Time (s)', summary['wall_seconds']],
+            ['Run', 'Files', summary['files']],
+            ['Run', 'Files per Second', summary['files_per_second']],
+            ['Run', 'Bytes Read', summary['bytes_read']],
+            ['Run', 'Read MB per Second', summary['read_mb_per_second']]]
+    rows += [['Stage Wall Time (s)', name, seconds] for name, seconds in summary['stages'].items()]
+    for operation, latency in summary['latency'].items():
+        section = f'{operation.capitalize()} Latency (s)'
+        rows += [[section, 'Count', latency['count']], [section, 'Total', latency['sum']],
+                 [section, 'Mean', latency['mean']], [section, 'p50', latency['p50']],
+                 [section, 'p95', latency['p95']], [section, 'p99', latency['p99']],
+                 [section, 'Max', latency['max']]]
+    return rows
+
+
+def prometheus_text(summary):
+    """Render a summary in the Prometheus text exposition format."""
+    lines = ['# HELP splitimg_stage_seconds Wall time of each run stage.',
+             '# TYPE splitimg_stage_seconds gauge']
+    lines += [f'splitimg_stage_seconds{{stage="{name}"}} {seconds}' for name, seconds in summary['stages'].items()]
+    for name, key, help_text in (('run_seconds', 'wall_seconds', 'Wall time of the run.'),
+                                 ('files', 'files', 'Files processed.'),
+                                 ('files_per_second', 'files_per_second', 'Files processed per second.'),
+                                 ('read_bytes', 'bytes_read', 'Bytes read by the image decoders.')):
+        lines += [f'# HELP splitimg_{name} {help_text}', f'# TYPE splitimg_{name} gauge',
+                  f'splitimg_{name} {summary[key]}']
+    lines += ['# HELP splitimg_latency_seconds Per-file latency of each operation.',
+              '# TYPE splitimg_latency_seconds histogram']
+    for operation, latency in summary['latency'].items():
+        cumulative = 0
+        for bound, count in latency['buckets'].items():
+            cumulative += count
+            lines.append(f'splitimg_latency_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+        lines.append(f'splitimg_latency_seconds_sum{{operation="{operation}"}} {latency["sum"]}')
+        lines.append(f'splitimg_latency_seconds_count{{operation="{operation}"}} {latency["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(folder, summary, metrics_format='json'):
+    """
+    Write the summary next to the report and return its path. The file is
+    renamed into place so textfile collectors never read half of it.
+    """
+    if metrics_format not in METRICS_FORMATS:
+        raise ValueError(f"Unknown metrics format: {metrics_format}")
+    path = os.path.join(folder, METRICS_BASE + METRICS_EXTENSIONS[metrics_format])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if metrics_format == 'json':
+            json.dump(summary, f, indent=2)
+        else:
+            f.write(prometheus_text(summary))
+    os.replace(tmp_path, path)
+    return path
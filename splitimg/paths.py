@@ -0,0 +1,325 @@
+"""
+Compact tables of the files in a run.
+
+A path kept as a Python string costs around a hundred bytes more than its
+characters, and a run held several lists and dicts of them. PathTable
+keeps every directory once, in a prefix table, and every file as a row of
+array-backed columns: its directory, the end of its name in one buffer of
+UTF-8 names and its file ID, interned in a table of its own. GroupIndex
+sorts the rows by file ID into one array, so a group is a range of it,
+and MovePlan keeps the moves as a designer and a row each. Paths are only
+rebuilt as strings while a stage uses them.
+
+With `spill`, a folder, the per-file columns are written to temporary
+files there and read back through memory maps, so a folder with more
+files than fit in memory can still be split. The directory and file ID
+tables, the group offsets and RowResults, a byte per file, stay in
+memory.
+"""
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from .assign import file_weight
+from .common import extract_file_id
+
+# Values a spilled column buffers in memory before writing them out
+SPILL_CHUNK = 65536
+
+# RowResults value of a row that has no result yet
+PENDING = -1
+
+# Names are stored the way os.fsencode() encodes them
+_ENCODING = sys.getfilesystemencoding()
+_ERRORS = sys.getfilesystemencodeerrors()
+
+
+def column(typecode, spill=None):
+    """
+    An append-only column of numbers of one array typecode, of bytes with
+    'B': an array.array, or a SpilledColumn in the `spill` folder.
+    """
+    return array(typecode) if spill is None else SpilledColumn(typecode, spill)
+
+
+def zeros(typecode, length, spill=None):
+    """A column of `length` zeros, to be filled in with item assignment."""
+    if spill is None:
+        return array(typecode, bytes(length * array(typecode).itemsize))
+    values = SpilledColumn(typecode, spill)
+    values.file.truncate(length * values.tail.itemsize)
+    values.spilled = length
+    return values
+
+
+class SpilledColumn:
+    """
+    The part of the array.array interface the tables use, kept in a
+    temporary file in `spill`. Values are appended SPILL_CHUNK at a time
+    and read through a memory map of the file.
+    """
+
+    def __init__(self, typecode, spill):
+        self.typecode = typecode
+        # Values not written to the file yet
+        self.tail = array(typecode)
+        self.file = tempfile.TemporaryFile(prefix='splitimg-', dir=spill)
+        self.spilled = 0
+        self.mapped = None
+        self.view = None
+
+    def __len__(self):
+        return self.spilled + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self))
+            if start >= self.spilled:
+                return self.tail[start - self.spilled:stop - self.spilled]
+            if stop <= self.spilled:
+                return self.mapping()[start:stop]
+            return array(self.typecode, self.mapping()[start:].tobytes() + self.tail[:stop - self.spilled].tobytes())
+        if index < 0:
+            index += len(self)
+        if index >= self.spilled:
+            return self.tail[index - self.spilled]
+        return self.mapping()[index]
+
+    def __setitem__(self, index, value):
+        if index < 0:
+            index += len(self)
+        if index >= self.spilled:
+            self.tail[index - self.spilled] = value
+        else:
+            self.mapping()[index] = value
+
+    def __iter__(self):
+        if self.spilled:
+            yield from self.mapping()
+        yield from self.tail
+
+    def append(self, value):
+        self.tail.append(value)
+        if len(self.tail) >= SPILL_CHUNK:
+            self.flush()
+
+    def frombytes(self, data):
+        self.tail.frombytes(data)
+        if len(self.tail) >= SPILL_CHUNK:
+            self.flush()
+
+    def flush(self):
+        self.unmap()
+        self.file.seek(0, os.SEEK_END)
+        self.tail.tofile(self.file)
+        self.spilled += len(self.tail)
+        del self.tail[:]
+
+    def mapping(self):
+        if self.view is None:
+            self.file.flush()
+            self.mapped = mmap.mmap(self.file.fileno(), self.spilled * self.tail.itemsize)
+            self.view = memoryview(self.mapped).cast(self.typecode)
+        return self.view
+
+    def unmap(self):
+        if self.view is None:
+            return
+        self.view.release()
+        self.mapped.close()
+        self.view = self.mapped = None
+
+
+class PathTable:
+    """
+    The paths of a run as rows of columns, see the module docstring. With
+    `weights` every row also keeps a number, the size or pixel count the
+    header prepass read for the bytes and pixels balance modes.
+    """
+
+    def __init__(self, spill=None, weights=False):
+        self.spill = spill
+        # Directory prefixes and file IDs, each stored once
+        self.folders = []
+        self.folder_rows = {}
+        self.file_ids = []
+        self.file_id_rows = {}
+        self.folder = column('I', spill)
+        self.name_end = column('Q', spill)
+        self.names = column('B', spill)
+        self.file_id = column('I', spill)
+        self.weights = column('Q', spill) if weights else None
+
+    def __len__(self):
+        return len(self.folder)
+
+    def __iter__(self):
+        return map(self.path, range(len(self)))
+
+    def add(self, image_path, weight=0):
+        """Add a path and return its row."""
+        name = os.path.basename(image_path)
+        # The prefix keeps its separator, so the path is prefix + name again
+        self.folder.append(self.intern(self.folders, self.folder_rows, image_path[:len(image_path) - len(name)]))
+        self.file_id.append(self.intern(self.file_ids, self.file_id_rows, extract_file_id(name)))
+        self.names.frombytes(name.encode(_ENCODING, _ERRORS))
+        self.name_end.append(len(self.names))
+        if self.weights is not None:
+            self.weights.append(weight)
+        return len(self.folder) - 1
+
+    def intern(self, values, rows, value):
+        row = rows.get(value)
+        if row is None:
+            row = rows[value] = len(values)
+            values.append(value)
+        return row
+
+    def name(self, row):
+        start = self.name_end[row - 1] if row else 0
+        return self.names[start:self.name_end[row]].tobytes().decode(_ENCODING, _ERRORS)
+
+    def path(self, row):
+        return self.folders[self.folder[row]] + self.name(row)
+
+    def find(self, image_paths):
+        """Return {path: row} for `image_paths`, reading every row once."""
+        wanted = set(image_paths)
+        return {image_path: row for row, image_path in enumerate(self) if image_path in wanted}
+
+
+class GroupIndex(Mapping):
+    """
+    {file ID: GroupFiles} over a PathTable, in file ID order. The rows are
+    counting-sorted by file ID into one array (in scan order within a
+    group) and each group is the range of it between two offsets.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        file_ids = table.file_ids
+        # Interned file IDs in sorted order, and each one's place in it
+        ranked = sorted(range(len(file_ids)), key=file_ids.__getitem__)
+        self.ids = [file_ids[index] for index in ranked]
+        rank = array('I', bytes(4 * len(ranked)))
+        for position, index in enumerate(ranked):
+            rank[index] = position
+        self.starts = array('Q', bytes(8 * (len(ranked) + 1)))
+        for index in table.file_id:
+            self.starts[rank[index] + 1] += 1
+        for position in range(len(ranked)):
+            self.starts[position + 1] += self.starts[position]
+        self.order = zeros('I', len(table), table.spill)
+        filled = self.starts[:-1]
+        for row, index in enumerate(table.file_id):
+            position = rank[index]
+            self.order[filled[position]] = row
+            filled[position] += 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __getitem__(self, file_id):
+        position = bisect_left(self.ids, file_id)
+        if position == len(self.ids) or self.ids[position] != file_id:
+            raise KeyError(file_id)
+        return self.files(position)
+
+    def items(self):
+        # Walks the groups in order instead of looking each file ID up
+        return ((file_id, self.files(position)) for position, file_id in enumerate(self.ids))
+
+    def files(self, position):
+        return GroupFiles(self.table, self.order, self.starts[position], self.starts[position + 1])
+
+
+class GroupFiles:
+    """The paths of one group, the rows between `start` and `stop` of `order`."""
+
+    __slots__ = ('table', 'order', 'start', 'stop')
+
+    def __init__(self, table, order, start, stop):
+        self.table = table
+        self.order = order
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return map(self.table.path, self.rows())
+
+    def rows(self):
+        return self.order[self.start:self.stop]
+
+    def weight(self, mode):
+        """The group's work estimate for a balance mode, see splitimg.assign.file_weight."""
+        if mode == 'images':
+            return len(self)
+        if self.table.weights is not None:
+            return sum(self.table.weights[row] for row in self.rows())
+        return sum(file_weight(image_path, mode) for image_path in self)
+
+    def without(self, rows):
+        """The group less the given rows."""
+        kept = array('I', (row for row in self.rows() if row not in rows))
+        return GroupFiles(self.table, kept, 0, len(kept))
+
+
+class MovePlan:
+    """
+    The ordered (designer index, path) moves of a run, kept as a designer
+    and a PathTable row per move.
+    """
+
+    def __init__(self, table, spill=None):
+        self.table = table
+        self.designers = column('h', spill)
+        self.rows = column('I', spill)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self.designers[index], self.table.path(self.rows[index])
+
+    def __iter__(self):
+        return zip(self.designers, map(self.table.path, self.rows))
+
+    def append(self, designer, row):
+        self.designers.append(designer)
+        self.rows.append(row)
+
+
+class RowResults:
+    """
+    Background classes by PathTable row, a byte each, for
+    ClassificationStage to keep results in instead of a dict of paths.
+    """
+
+    def __init__(self):
+        self.values = array('b')
+
+    def __contains__(self, row):
+        return row < len(self.values) and self.values[row] != PENDING
+
+    def __setitem__(self, row, background):
+        if row >= len(self.values):
+            # Grown by doubling, rows arrive about in order
+            self.values.extend(array('b', [PENDING]) * max(row + 1 - len(self.values), len(self.values)))
+        self.values[row] = background
+
+    def pop(self, row):
+        if row not in self:
+            raise KeyError(row)
+        background = self.values[row]
+        self.values[row] = PENDING
+        return background
@@ -0,0 +1,195 @@
+"""
+Streaming stages that let classification overlap with the folder scan.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .classify import DEFAULT_CLASSIFIER, classify_timed, measure_batch
+from .dedup import hash_batch
+
+_DONE = object()
+
+
+def stream(iterable, maxsize=1024):
+    """
+    Run `iterable` on a background thread and yield its items through a
+    bounded queue, so a slow producer (a walk over a network share) and the
+    consumer overlap while memory stays bounded.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            items.put(_DONE)
+
+    thread = threading.Thread(target=produce, name='splitimg-scan', daemon=True)
+    thread.start()
+    while True:
+        item = items.get()
+        if item is _DONE:
+            break
+        yield item
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+class ClassificationStage:
+    """
+    Classifies images as soon as they are submitted.
+
+    Cache hits are answered immediately. Misses are sent to a process pool in
+    batches, with at most `max_in_flight` batches outstanding, so submit()
+    blocks (and the scan queue fills up) when decoding falls behind.
+    Decode and classify latencies go to `metrics`, a RunMetrics, if given.
+    `executor` is a shared pool to use instead of starting one, see
+    splitimg.jobs. Results are kept in `results` by path, or by the key
+    given to submit(), such as a splitimg.paths.RowResults by row.
+    """
+
+    def __init__(self, workers=1, cache=None, batch_size=32, max_in_flight=None, metrics=None, executor=None,
+                 classifier=None, results=None):
+        self.workers = workers
+        self.classifier = classifier or DEFAULT_CLASSIFIER
+        self.cache = cache
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight or max(2, workers * 2)
+        self.shared_executor = executor
+        self.executor = None
+        self.results = results if results is not None else {}
+        self.keys = {}
+        self.batch = []
+        self.in_flight = deque()
+
+    def __enter__(self):
+        if self.shared_executor is not None:
+            self.executor = self.shared_executor
+        elif self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is self.shared_executor:
+            # Batches still queued for this stage are dropped, the pool stays up
+            for _, future in self.in_flight:
+                future.cancel()
+            self.in_flight.clear()
+            self.executor = None
+        elif self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def submit(self, image_path, entry=None, key=None):
+        """
+        Queue an image, `entry` is its os.DirEntry when the scan has one.
+        The result is kept under `key`, the path if None.
+        """
+        key = image_path if key is None else key
+        if self.cache is not None:
+            cache_key = self.cache.key(image_path, entry.stat() if entry is not None else None)
+            result = self.cache.get(cache_key)
+            if result is not None:
+                self.results[key] = result
+                return
+            self.keys[image_path] = cache_key
+
+        if self.executor is None:
+            self.store(image_path, key, classify_timed(image_path, self.classifier))
+            return
+
+        self.batch.append((image_path, key))
+        if len(self.batch) >= self.batch_size:
+            self.dispatch()
+
+    def dispatch(self):
+        batch, self.batch = self.batch, []
+        if batch:
+            self.in_flight.append((batch, self.executor.submit(measure_batch, [image_path for image_path, _ in batch],
+                                                               self.classifier)))
+        while len(self.in_flight) > self.max_in_flight:
+            self.collect()
+
+    def collect(self):
+        batch, future = self.in_flight.popleft()
+        for (image_path, key), measured in zip(batch, future.result()):
+            self.store(image_path, key, measured)
+
+    def store(self, image_path, key, measured):
+        """Keep a classify_timed() result and record its measurements."""
+        result, decode_time, classify_time, bytes_read = measured
+        if self.metrics is not None:
+            self.metrics.observe('decode', decode_time)
+            self.metrics.observe('classify', classify_time)
+            self.metrics.add_bytes(bytes_read)
+        self.results[key] = result
+        if self.cache is not None:
+            self.cache.put(self.keys.pop(image_path, None), result)
+
+    def result(self, image_path, key=None):
+        """Return the result for a submitted path (or key), waiting for it if needed."""
+        key = image_path if key is None else key
+        while key not in self.results:
+            if self.batch:
+                self.dispatch()
+            if not self.in_flight:
+                # Never submitted, classify it here
+                self.store(image_path, key, classify_timed(image_path, self.classifier))
+                break
+            self.collect()
+        return self.results.pop(key)
+
+
+class HashStage:
+    """
+    Hashes images for duplicate detection (see splitimg.dedup) as they are
+    submitted, in batches on `executor`, usually the ClassificationStage's
+    pool, or in this process when it is None. Hash latencies go to
+    `metrics` as 'hash'.
+    """
+
+    def __init__(self, executor=None, batch_size=32, metrics=None, classifier=None):
+        self.executor = executor
+        self.batch_size = batch_size
+        self.metrics = metrics
+        # A BackgroundClassifier, its memory limit and preview settings apply to hashing too
+        self.classifier = classifier
+        self.hashes = {}
+        self.batch = []
+        self.in_flight = deque()
+
+    def submit(self, image_path):
+        self.batch.append(image_path)
+        if len(self.batch) >= self.batch_size:
+            self.dispatch()
+
+    def dispatch(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        if self.executor is None:
+            self.store(batch, hash_batch(batch, self.classifier))
+        else:
+            self.in_flight.append((batch, self.executor.submit(hash_batch, batch, self.classifier)))
+
+    def store(self, batch, hashed):
+        for image_path, (digest, dhash, colour, seconds) in zip(batch, hashed):
+            self.hashes[image_path] = (digest, dhash, colour)
+            if self.metrics is not None:
+                self.metrics.observe('hash', seconds)
+
+    def results(self):
+        """Wait for every submitted image and return {path: (digest, dHash, colour)}."""
+        self.dispatch()
+        while self.in_flight:
+            batch, future = self.in_flight.popleft()
+            self.store(batch, future.result())
+        return self.hashes
@@ -0,0 +1,131 @@
+"""
+Plan files for dry runs.
+
+SplitEngine.write_plan() scans, classifies and assigns a folder like a run
+does, but writes the moves to a plan file instead of making them. The plan
+is JSON lines: a header with the settings and totals, one line per file
+with its group, designer, background, destination and the size and
+modification time it had, then the files the header prepass skipped.
+Files are sorted by destination, so two plans of the same folder diff line
+by line. A run given the plan (SplitEngine(plan_file=...)) makes exactly
+those moves later, without scanning or classifying again, and leaves
+files that changed since the plan in place.
+"""
+import json
+import os
+import time
+
+from .common import BACKGROUND_OTHER, DUPLICATES, designer_name, extract_file_id
+from .report import BACKGROUND_NAMES, background_name
+
+PLAN_VERSION = 1
+
+_BACKGROUNDS = {name: background for background, name in BACKGROUND_NAMES.items()}
+
+
+class SplitPlan:
+    """A plan read back from a plan file."""
+
+    def __init__(self, header, entries, problems, duplicates):
+        self.header = header
+        # List of (designer index, path relative to the source folder, background class, size, mtime_ns)
+        self.entries = entries
+        # Errors table rows of the dry run, see splitimg.report.ERROR_COLUMNS
+        self.problems = problems
+        # Duplicates table rows of the dry run, see splitimg.report.DUPLICATE_COLUMNS
+        self.duplicates = duplicates
+
+    @property
+    def num_designers(self):
+        return self.header['num_designers']
+
+    @property
+    def source_folder(self):
+        return self.header['source']
+
+    @property
+    def output_folder(self):
+        """The output folder the plan was made for, None for the source folder."""
+        return self.header.get('output')
+
+
+class PlannedResults:
+    """Stands in for ClassificationStage with the backgrounds a plan recorded."""
+
+    def __init__(self, backgrounds):
+        self.backgrounds = backgrounds
+
+    def result(self, image_path):
+        return self.backgrounds.pop(image_path)
+
+
+def save_plan(path, header, entries, problems=(), duplicates=()):
+    """
+    Write a plan file. `entries` are (designer index, relative path,
+    background class, size, mtime_ns), `problems` and `duplicates` the
+    Errors and Duplicates table rows. The file is written to a temporary
+    name first, so an existing plan is only ever replaced by a whole one.
+    """
+    duplicate_of = {row[0]: row[1:4] for row in duplicates}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'type': 'plan', 'version': PLAN_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                            'entries': len(entries), **header}) + '\n')
+        # Designer_1 to Designer_N, then the Duplicates folder
+        for designer, image_file, background, size, mtime_ns in sorted(
+                entries, key=lambda entry: (entry[0] == DUPLICATES, entry[0], os.path.basename(entry[1]), entry[1])):
+            record = {'type': 'file', 'path': image_file, 'group': extract_file_id(os.path.basename(image_file)),
+                      'designer': designer,
+                      'dest': f'{designer_name(designer)}/{os.path.basename(image_file)}',
+                      'background': background_name(background), 'size': size, 'mtime_ns': mtime_ns}
+            if image_file in duplicate_of:
+                record['duplicate_of'], record['match'], record['distance'] = duplicate_of[image_file]
+            f.write(json.dumps(record) + '\n')
+        for image_file, file_format, problem, action in problems:
+            f.write(json.dumps({'type': 'problem', 'path': image_file, 'format': file_format,
+                                'problem': problem, 'action': action}) + '\n')
+    os.replace(tmp_path, path)
+
+
+def read_plan_header(path):
+    """Return the header of a plan file, raising ValueError when it is not a plan."""
+    with open(path, encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+    if not isinstance(header, dict) or header.get('type') != 'plan' or header.get('version') != PLAN_VERSION:
+        raise ValueError(f"{path} is not a SplitImg plan")
+    return header
+
+
+def check_plan_source(header, source_folder):
+    """Raise ValueError when the plan with `header` was made for another folder than `source_folder`."""
+    planned = os.path.abspath(os.path.normpath(header.get('source') or ''))
+    if planned != os.path.abspath(os.path.normpath(source_folder)):
+        raise ValueError(f"the plan was made for {header.get('source')}, not {source_folder}")
+
+
+def load_plan(path):
+    """Read a plan file into a SplitPlan. Raises ValueError when it is not a complete plan."""
+    header = read_plan_header(path)
+    entries = []
+    problems = []
+    duplicates = []
+    with open(path, encoding='utf-8') as f:
+        f.readline()
+        for line in f:
+            record = json.loads(line)
+            kind = record.get('type')
+            if kind == 'file':
+                designer = record['designer']
+                entries.append((designer, record['path'], _BACKGROUNDS.get(record['background'], BACKGROUND_OTHER),
+                                record['size'], record['mtime_ns']))
+                if 'duplicate_of' in record:
+                    duplicates.append((record['path'], record['duplicate_of'], record['match'], record['distance'],
+                                       designer_name(designer)))
+            elif kind == 'problem':
+                problems.append((record['path'], record['format'], record['problem'], record['action']))
+    if len(entries) != header.get('entries'):
+        raise ValueError(f"{path} is incomplete, expected {header.get('entries')} files and found {len(entries)}")
+    return SplitPlan(header, entries, problems, duplicates)
@@ -0,0 +1,67 @@
+"""
+Rate-limited progress reporting.
+
+The pipeline notifies a ProgressChannel for every file, but the channel
+only builds and delivers a snapshot at a fixed rate (10 Hz by default),
+plus once more when it is closed so the final numbers always arrive.
+"""
+import time
+
+DEFAULT_INTERVAL = 0.1
+
+
+def snapshot_stats(stats):
+    """Return an independent copy of the run stats for delivery to listeners."""
+    snapshot = {key: value for key, value in stats.items() if not isinstance(value, (dict, list))}
+    snapshot['extensions'] = dict(stats['extensions'])
+    snapshot['designer_files'] = dict(stats['designer_files'])
+    return snapshot
+
+
+class ProgressChannel:
+    """
+    Coalesces notifications into at most one `emit()` call per `interval` seconds.
+
+    `emit` takes no arguments and is expected to build the snapshot itself,
+    so nothing is copied for the notifications that are dropped.
+    """
+
+    def __init__(self, emit, interval=DEFAULT_INTERVAL, clock=time.monotonic):
+        self.emit = emit
+        self.interval = interval
+        self.clock = clock
+        self.events = 0
+        self.delivered = 0
+        self.dirty = False
+        self.started = clock()
+        self.finished = None
+        self.next_time = self.started
+
+    def notify(self):
+        self.events += 1
+        self.dirty = True
+        now = self.clock()
+        if now >= self.next_time:
+            self.flush(now)
+
+    def flush(self, now=None):
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.delivered += 1
+        self.next_time = (now or self.clock()) + self.interval
+        self.emit()
+
+    def close(self):
+        self.flush()
+        self.finished = self.clock()
+
+    def summary(self):
+        """Return raw and delivered event counts and rates."""
+        elapsed = max((self.finished or self.clock()) - self.started, 1e-9)
+        return {
+            'events': self.events,
+            'delivered': self.delivered,
+            'events_per_second': round(self.events / elapsed, 1),
+            'delivered_per_second': round(self.delivered / elapsed, 1),
+        }
@@ -0,0 +1,276 @@
+"""
+Run reports.
+
+Report writers take one row per file through add_file() while the run is
+moving files, and the summary, workload, errors and duplicates tables in
+close(). Rows are streamed to disk as they come, so memory does not grow
+with the number of files. The Errors table lists the files the header
+prepass found a problem with, see splitimg.headers, and the Duplicates
+table the copies found by splitimg.dedup. The Excel writer uses
+openpyxl's write-only mode; CSV and Parquet write the same tables to
+sibling files. The Metrics table holds the run's stage times and
+latencies, see splitimg.metrics.
+"""
+import csv
+import os
+import time
+
+from .common import BACKGROUND_GRAY, BACKGROUND_OTHER, BACKGROUND_WHITE, REPORT_NAME, format_time
+from .metrics import metric_rows
+
+REPORT_BASE = os.path.splitext(REPORT_NAME)[0]
+FILE_COLUMNS = ['Designer', 'File', 'Background']
+SUMMARY_COLUMNS = ['Metric', 'Value']
+METRICS_COLUMNS = ['Section', 'Metric', 'Value']
+ERROR_COLUMNS = ['File', 'Format', 'Problem', 'Action']
+DUPLICATE_COLUMNS = ['File', 'Duplicate Of', 'Match', 'Distance', 'Designer']
+BACKGROUND_NAMES = {BACKGROUND_WHITE: 'White', BACKGROUND_GRAY: 'Gray', BACKGROUND_OTHER: 'Non-White'}
+# Data rows per Excel sheet, the format's limit minus the header
+EXCEL_MAX_ROWS = 1048575
+
+
+def background_name(background):
+    return BACKGROUND_NAMES.get(background, 'Non-White')
+
+
+def summary_rows(stats, start_time):
+    # Format extensions count for display
+    extensions_text = ', '.join(f"{ext} ({count})" for ext, count in stats['extensions'].items())
+
+    # Calculate total processing time
+    processing_time = format_time(time.time() - start_time)
+
+    progress = stats.get('progress', {}).get('process', {})
+    progress_text = f"{progress.get('events', 0)} / {progress.get('delivered', 0)}"
+
+    return [
+        ['Total Images Processed', stats['total_images']],
+        ['White Background Images', stats['white_background']],
+        ['Non-White Background Images', stats['non_white_background']],
+        ['Gray Background Images', stats.get('gray_background', 0)],
+        ['Supported Extensions', extensions_text],
+        ['Total Processing Time', processing_time],
+        ['Classification Cache Hits', stats.get('cache_hits', 0)],
+        ['Classification Cache Misses', stats.get('cache_misses', 0)],
+        ['Progress Events (raw / sent)', progress_text],
+        ['Balance Mode', stats.get('balance_mode', 'groups')],
+        ['Imbalance Ratio (max / mean)', stats.get('imbalance_ratio', 1.0)],
+        ['Unreadable Files (left in place)', stats.get('unreadable_files', 0)],
+        ['Files With Header Warnings', stats.get('header_warnings', 0)],
+        ['Duplicate Images', stats.get('duplicates', 0)],
+        ['Plan Conflicts (left in place)', stats.get('plan_conflicts', 0)],
+    ]
+
+
+def workload_columns(stats):
+    return ['Designer', 'Groups', 'Images', f"Weight ({stats.get('balance_mode', 'groups')})"]
+
+
+def workload_rows(stats):
+    return [[designer, total['groups'], total['images'], total['weight']]
+            for designer, total in stats.get('workloads', {}).items()]
+
+
+def metrics_rows(stats):
+    return metric_rows(stats['metrics']) if stats.get('metrics') else []
+
+
+class ReportWriter:
+    """Base class for report formats."""
+
+    name = None
+    extension = None
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, REPORT_BASE + self.extension)
+
+    def sibling(self, table):
+        """Path of an extra table for formats with one table per file."""
+        return os.path.join(self.folder, f"{REPORT_BASE}_{table}{self.extension}")
+
+    def add_file(self, designer, image_file, background):
+        raise NotImplementedError
+
+    def close(self, stats, start_time, problems=(), duplicates=()):
+        """
+        Write the summary tables and return the report path. `problems` are
+        the Errors table rows, see ERROR_COLUMNS, and `duplicates` the
+        Duplicates table rows, see DUPLICATE_COLUMNS.
+        """
+        raise NotImplementedError
+
+    def abort(self):
+        """Drop a report that will not be closed."""
+
+
+class ExcelReportWriter(ReportWriter):
+    name = 'xlsx'
+    extension = '.xlsx'
+
+    def __init__(self, folder):
+        super().__init__(folder)
+        from openpyxl import Workbook
+
+        # Each write-only sheet streams its rows to a temporary file
+        self.workbook = Workbook(write_only=True)
+        self.sheets = 0
+        self.rows = 0
+        self.sheet = None
+        self.new_sheet()
+
+    def new_sheet(self):
+        self.sheets += 1
+        title = 'Designer Files' if self.sheets == 1 else f'Designer Files ({self.sheets})'
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(FILE_COLUMNS)
+        self.rows = 0
+
+    def add_file(self, designer, image_file, background):
+        if self.rows == EXCEL_MAX_ROWS:
+            self.new_sheet()
+        self.sheet.append([designer, image_file, background_name(background)])
+        self.rows += 1
+
+    def close(self, stats, start_time, problems=(), duplicates=()):
+        if problems:
+            errors = self.workbook.create_sheet('Errors')
+            errors.append(ERROR_COLUMNS)
+            for row in problems:
+                errors.append(list(row))
+
+        if duplicates:
+            sheet = self.workbook.create_sheet('Duplicates')
+            sheet.append(DUPLICATE_COLUMNS)
+            for row in duplicates:
+                sheet.append(list(row))
+
+        summary = self.workbook.create_sheet('Summary')
+        summary.append(SUMMARY_COLUMNS)
+        for row in summary_rows(stats, start_time):
+            summary.append(row)
+
+        workloads = workload_rows(stats)
+        if workloads:
+            workload = self.workbook.create_sheet('Workload')
+            workload.append(workload_columns(stats))
+            for row in workloads:
+                workload.append(row)
+
+        metrics = metrics_rows(stats)
+        if metrics:
+            sheet = self.workbook.create_sheet('Metrics')
+            sheet.append(METRICS_COLUMNS)
+            for row in metrics:
+                sheet.append(row)
+        self.workbook.save(self.path)
+        return self.path
+
+    def abort(self):
+        # openpyxl removes the temporary sheet files when the process exits
+        self.workbook = None
+
+
+class CsvReportWriter(ReportWriter):
+    name = 'csv'
+    extension = '.csv'
+
+    def __init__(self, folder):
+        super().__init__(folder)
+        self.file = open(self.path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FILE_COLUMNS)
+
+    def add_file(self, designer, image_file, background):
+        self.writer.writerow((designer, image_file, background_name(background)))
+
+    def write_table(self, path, columns, rows):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+    def close(self, stats, start_time, problems=(), duplicates=()):
+        self.file.close()
+        if problems:
+            self.write_table(self.sibling('Errors'), ERROR_COLUMNS, problems)
+        if duplicates:
+            self.write_table(self.sibling('Duplicates'), DUPLICATE_COLUMNS, duplicates)
+        self.write_table(self.sibling('Summary'), SUMMARY_COLUMNS, summary_rows(stats, start_time))
+        workloads = workload_rows(stats)
+        if workloads:
+            self.write_table(self.sibling('Workload'), workload_columns(stats), workloads)
+        metrics = metrics_rows(stats)
+        if metrics:
+            self.write_table(self.sibling('Metrics'), METRICS_COLUMNS, metrics)
+        return self.path
+
+    def abort(self):
+        self.file.close()
+
+
+class ParquetReportWriter(ReportWriter):
+    """Needs pyarrow. Rows are written in row groups of `batch_size`."""
+
+    name = 'parquet'
+    extension = '.parquet'
+
+    def __init__(self, folder, batch_size=65536):
+        super().__init__(folder)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pq = pq
+        self.schema = pa.schema([(column, pa.string()) for column in FILE_COLUMNS])
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.batch_size = batch_size
+        self.columns = [[] for _ in FILE_COLUMNS]
+
+    def add_file(self, designer, image_file, background):
+        for column, value in zip(self.columns, (designer, image_file, background_name(background))):
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_size:
+            self.write_batch()
+
+    def write_batch(self):
+        if self.columns[0]:
+            self.writer.write_table(self.pa.Table.from_arrays(self.columns, schema=self.schema))
+            self.columns = [[] for _ in FILE_COLUMNS]
+
+    def write_table(self, path, columns, rows):
+        arrays = [list(column) for column in zip(*rows)] or [[] for _ in columns]
+        # Columns that mix types, like the summary's Value, are stored as text
+        arrays = [[str(value) for value in array] if len({type(value) for value in array}) > 1 else array
+                  for array in arrays]
+        self.pq.write_table(self.pa.table(dict(zip(columns, arrays))), path)
+
+    def close(self, stats, start_time, problems=(), duplicates=()):
+        self.write_batch()
+        self.writer.close()
+        if problems:
+            self.write_table(self.sibling('Errors'), ERROR_COLUMNS, problems)
+        if duplicates:
+            self.write_table(self.sibling('Duplicates'), DUPLICATE_COLUMNS, duplicates)
+        self.write_table(self.sibling('Summary'), SUMMARY_COLUMNS, summary_rows(stats, start_time))
+        workloads = workload_rows(stats)
+        if workloads:
+            self.write_table(self.sibling('Workload'), workload_columns(stats), workloads)
+        metrics = metrics_rows(stats)
+        if metrics:
+            self.write_table(self.sibling('Metrics'), METRICS_COLUMNS, metrics)
+        return self.path
+
+    def abort(self):
+        self.writer.close()
+
+
+REPORT_WRITERS = {writer.name: writer for writer in (ExcelReportWriter, CsvReportWriter, ParquetReportWriter)}
+REPORT_FORMATS = tuple(REPORT_WRITERS)
+
+
+def open_report(folder, report_format='xlsx'):
+    """Create the report writer for `report_format` in `folder`."""
+    if report_format not in REPORT_WRITERS:
+        raise ValueError(f"Unknown report format: {report_format}")
+    return REPORT_WRITERS[report_format](folder)
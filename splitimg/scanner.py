@@ -0,0 +1,97 @@
+"""
+Directory scanner built on os.scandir.
+
+Designer_N and Duplicates output folders in the source folder and hidden
+entries (names starting with '.', such as macOS '._' resource files on
+network shares) are skipped, so a second run does not pick up files that
+were already split. For high-latency SMB/NFS mounts subtrees can be
+listed on several threads at once.
+"""
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .common import SUPPORTED_FORMATS, DESIGNER_PREFIX, DUPLICATES_FOLDER, extract_file_id
+
+OUTPUT_FOLDER = re.compile(rf'(?:{re.escape(DESIGNER_PREFIX)}\d+|{re.escape(DUPLICATES_FOLDER)})$')
+
+
+def scan_images(source_folder, supported_formats=SUPPORTED_FORMATS, threads=1):
+    """
+    Yield (DirEntry, extension) for every supported image with a file ID.
+
+    With one thread the order matches a top-down os.walk. With more, whole
+    directories are yielded in the order their listings complete.
+    """
+    if threads > 1:
+        yield from _scan_threaded(source_folder, supported_formats, threads)
+        return
+
+    stack = [source_folder]
+    while stack:
+        images, subdirs = _scan_dir(stack.pop(), supported_formats, source_folder)
+        yield from images
+        stack.extend(reversed(subdirs))
+
+
+def image_extension(name, supported_formats=SUPPORTED_FORMATS):
+    """Return the lower-case extension of a file name the scanner would pick up, else None."""
+    if name.startswith('.'):
+        return None
+    _, dot, ext = name.rpartition('.')
+    if not dot:
+        return None
+    ext = '.' + ext.lower()
+    if ext in supported_formats and extract_file_id(name):
+        return ext
+    return None
+
+
+def is_pruned_dir(path, source_folder):
+    """True for folders the scanner does not descend into."""
+    name = os.path.basename(path)
+    if name.startswith('.'):
+        return True
+    return bool(OUTPUT_FOLDER.match(name)) and os.path.normpath(os.path.dirname(path)) == os.path.normpath(source_folder)
+
+
+def _scan_dir(path, supported_formats, source_folder):
+    """List one directory, returning its matching images and the subfolders to descend into."""
+    images = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (path == source_folder and OUTPUT_FOLDER.match(name)):
+                            subdirs.append(entry.path)
+                        continue
+                except OSError:
+                    continue
+                # Same test as image_extension(), inlined for the hot loop
+                _, dot, ext = name.rpartition('.')
+                if not dot:
+                    continue
+                ext = '.' + ext.lower()
+                if ext in supported_formats and extract_file_id(name):
+                    images.append((entry, ext))
+    except OSError as e:
+        print(f"Error scanning {path}: {str(e)}", file=sys.stderr)
+    return images, subdirs
+
+
+def _scan_threaded(source_folder, supported_formats, threads):
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='splitimg-scandir') as executor:
+        pending = {executor.submit(_scan_dir, source_folder, supported_formats, source_folder)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                images, subdirs = future.result()
+                for subdir in subdirs:
+                    pending.add(executor.submit(_scan_dir, subdir, supported_formats, source_folder))
+                yield from images
@@ -0,0 +1,121 @@
+"""
+File transfer for the move stage.
+
+A move is a rename when source and destination share a file system. When
+they do not (EXDEV, for example NAS source folders with Designer folders
+on a local SSD) the file is copied into a temporary name with
+copy_file_range, sendfile or large buffered reads, its metadata is copied,
+it is renamed into place, and only then is the source removed.
+"""
+import errno
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+PART_SUFFIX = '.splitimg-part'
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 4
+
+# Errors that mean a fast copy path is not available for this pair of files
+_FALLBACK_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EOPNOTSUPP,
+                    getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+
+def move_file(src, dst, buffer_size=DEFAULT_BUFFER_SIZE, sync=True):
+    """Rename `src` to `dst`, copying across file systems when rename cannot."""
+    try:
+        os.rename(src, dst)
+        return 'rename'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copy_file(src, dst, buffer_size, sync)
+    os.unlink(src)
+    return 'copy'
+
+
+def copy_file(src, dst, buffer_size=DEFAULT_BUFFER_SIZE, sync=True):
+    """
+    Copy data and metadata (times, permission bits, extended attributes on
+    Linux) to `dst` through a temporary file, so `dst` only ever appears
+    complete. With `sync` the data is flushed to disk first.
+    """
+    tmp = dst + PART_SUFFIX
+    try:
+        with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+            copy_data(fsrc, fdst, os.fstat(fsrc.fileno()).st_size, buffer_size)
+            if sync:
+                fdst.flush()
+                os.fsync(fdst.fileno())
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def copy_data(fsrc, fdst, size, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Copy `size` bytes with the fastest kernel path available."""
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    offset = 0
+    if hasattr(os, 'copy_file_range'):
+        # Can be a reflink or a server-side copy on NFS 4.2 and SMB3
+        try:
+            while offset < size:
+                copied = os.copy_file_range(infd, outfd, min(size - offset, 1 << 30))
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRORS or offset:
+                raise
+    if offset < size and hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        try:
+            while offset < size:
+                sent = os.sendfile(outfd, infd, offset, min(size - offset, 1 << 30))
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRORS or offset:
+                raise
+    if offset < size:
+        fsrc.seek(offset)
+        fdst.seek(offset)
+        buffer = memoryview(bytearray(buffer_size))
+        while True:
+            count = fsrc.readinto(buffer)
+            if not count:
+                break
+            fdst.write(buffer[:count])
+
+
+class TransferPool:
+    """
+    Runs moves on a bounded thread pool. At most `max_pending` transfers are
+    queued at once, so copies of large files cannot pile up in memory.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=None, executor=None):
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.max_pending = max_pending or self.workers * 4
+        # A pool shared with other jobs, see splitimg.jobs
+        self.shared_executor = executor
+        self.executor = None
+
+    def __enter__(self):
+        self.executor = self.shared_executor or ThreadPoolExecutor(max_workers=self.workers,
+                                                                   thread_name_prefix='splitimg-transfer')
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not self.shared_executor:
+            self.executor.shutdown(wait=True)
+        self.executor = None
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
@@ -0,0 +1,384 @@
+"""
+Watch-folder mode.
+
+A long-running loop that distributes images as they land in the source
+folder instead of splitting it in one go. Changes are picked up with
+inotify on Linux and by polling the folder listing elsewhere. A file is
+only handled once it has been quiet for `settle` seconds and its size and
+modification time stopped changing, so half-copied files are left alone.
+
+Ready files are grouped by file ID. A group whose ID already sits in a
+Designer_N folder joins it; a new ID goes to the least loaded designer
+(or, with `stable`, to its rendezvous-hash designer). The designer folders
+are read once at startup to learn the existing assignments, after that
+nothing is rescanned.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .common import designer_folder, designer_name, extract_file_id
+from .assign import route_group
+from .pipeline import ClassificationStage
+from .scanner import image_extension, is_pruned_dir, scan_images
+
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL_INTERVAL = 2.0
+WATCH_BACKENDS = ('auto', 'inotify', 'poll')
+
+
+class DesignerRouter:
+    """
+    Remembers which designer has each file ID and how many images each
+    designer has, starting from what is already in the Designer folders.
+    """
+
+    def __init__(self, output_folder, num_designers, stable=False, designer_weights=None):
+        self.num_designers = num_designers
+        self.stable = stable
+        self.weights = designer_weights or [1.0] * num_designers
+        self.assigned = {}
+        self.loads = [0] * num_designers
+        for designer in range(num_designers):
+            try:
+                with os.scandir(designer_folder(output_folder, designer)) as entries:
+                    for entry in entries:
+                        file_id = extract_file_id(entry.name)
+                        if file_id and entry.is_file():
+                            self.assigned.setdefault(file_id, designer)
+                            self.loads[designer] += 1
+            except FileNotFoundError:
+                pass
+
+    def route(self, file_id, images=1):
+        """Return the designer for a group of `images` files and count them."""
+        designer = self.assigned.get(file_id)
+        if designer is None:
+            if self.stable:
+                designer = route_group(file_id, self.num_designers, self.weights)
+            else:
+                designer = min(range(self.num_designers),
+                               key=lambda designer: (self.loads[designer] / self.weights[designer], designer))
+            self.assigned[file_id] = designer
+        self.loads[designer] += images
+        return designer
+
+
+class Debouncer:
+    """Holds changed paths until they have been quiet and unchanged for `settle` seconds."""
+
+    def __init__(self, settle=DEFAULT_SETTLE, clock=time.monotonic):
+        self.settle = settle
+        self.clock = clock
+        # path -> (time of the last event or change, (size, mtime) when last checked)
+        self.pending = {}
+
+    def touch(self, path):
+        self.pending[path] = (self.clock(), None)
+
+    def ready(self):
+        """Return the paths whose writes look complete, in arrival order."""
+        now = self.clock()
+        ready = []
+        for path, (last_change, signature) in list(self.pending.items()):
+            if now - last_change < self.settle:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted or moved away before it settled
+                del self.pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == signature:
+                del self.pending[path]
+                ready.append(path)
+            else:
+                self.pending[path] = (now if signature is not None else last_change, current)
+        return ready
+
+    def timeout(self):
+        """Seconds until the next pending path could be ready, None when nothing is pending."""
+        if not self.pending:
+            return None
+        return max(0.0, min(last + self.settle for last, _ in self.pending.values()) - self.clock())
+
+
+class FolderWatcher:
+    """Base class for change sources. poll() returns paths that may have new content."""
+
+    name = None
+
+    def __init__(self, source_folder, supported_formats):
+        self.source_folder = os.path.abspath(os.path.normpath(source_folder))
+        self.supported_formats = supported_formats
+
+    def poll(self, timeout):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(FolderWatcher):
+    """Lists the source folder every `interval` seconds and reports new or changed files."""
+
+    name = 'poll'
+
+    def __init__(self, source_folder, supported_formats, interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(source_folder, supported_formats)
+        self.interval = interval
+        self.known = {}
+
+    def poll(self, timeout):
+        time.sleep(min(self.interval, timeout) if timeout is not None else self.interval)
+        changed = []
+        known = {}
+        for entry, _ in scan_images(self.source_folder, self.supported_formats):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            known[entry.path] = signature
+            if self.known.get(entry.path) != signature:
+                changed.append(entry.path)
+        self.known = known
+        return changed
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher(FolderWatcher):
+    """
+    Linux inotify through libc. Every folder except the pruned ones gets a
+    watch; files are reported when they are closed after writing or moved
+    in. New subfolders are watched and listed, since files can land in them
+    before the watch exists.
+    """
+
+    name = 'inotify'
+
+    def __init__(self, source_folder, supported_formats):
+        super().__init__(source_folder, supported_formats)
+        self.libc = _inotify_libc()
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}
+        self.add_tree(self.source_folder)
+
+    def add_tree(self, folder):
+        """Watch `folder` and its subfolders, returning the images already in them."""
+        images = []
+        stack = [folder]
+        while stack:
+            path = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+            if wd < 0:
+                print(f"Error watching {path}: {os.strerror(ctypes.get_errno())}", file=sys.stderr)
+                continue
+            self.folders[wd] = path
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not is_pruned_dir(entry.path, self.source_folder):
+                                stack.append(entry.path)
+                        elif image_extension(entry.name, self.supported_formats):
+                            images.append(entry.path)
+            except OSError as e:
+                print(f"Error scanning {path}: {str(e)}", file=sys.stderr)
+        return images
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, list everything once to catch up
+                changed.extend(entry.path for entry, _ in scan_images(self.source_folder, self.supported_formats))
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.folders[wd]
+                continue
+            if not name:
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not is_pruned_dir(path, self.source_folder):
+                    changed.extend(self.add_tree(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and image_extension(os.path.basename(path),
+                                                                          self.supported_formats):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _inotify_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def open_watcher(source_folder, supported_formats, backend='auto', poll_interval=DEFAULT_POLL_INTERVAL):
+    """Create the change source for `backend`, 'auto' prefers inotify and falls back to polling."""
+    if backend not in WATCH_BACKENDS:
+        raise ValueError(f"Unknown watch backend: {backend}")
+    if backend != 'poll':
+        try:
+            return InotifyWatcher(source_folder, supported_formats)
+        except OSError as e:
+            if backend == 'inotify':
+                raise
+            print(f"inotify unavailable ({str(e)}), polling every {poll_interval} s", file=sys.stderr)
+    return PollingWatcher(source_folder, supported_formats, poll_interval)
+
+
+class FolderWatch:
+    """
+    Runs a SplitEngine's classify, move and tag steps on files as they land.
+
+    `file_callback(path, designer name, background)` is called for every file
+    handled. Metrics are written after each batch when the engine has a
+    metrics format, so a Prometheus textfile stays current.
+    """
+
+    def __init__(self, engine, settle=DEFAULT_SETTLE, backend='auto', poll_interval=DEFAULT_POLL_INTERVAL,
+                 file_callback=None):
+        self.engine = engine
+        self.settle = settle
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.file_callback = file_callback
+        self.stop_event = threading.Event()
+        self.router = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        engine = self.engine
+        engine.start_time = time.time()
+        engine.create_designer_folders()
+        self.router = DesignerRouter(engine.output_folder, engine.num_designers, engine.stable,
+                                     engine.designer_weights)
+        debouncer = Debouncer(self.settle)
+        watcher = open_watcher(engine.source_folder, engine.supported_formats, self.backend, self.poll_interval)
+        engine.open_cache()
+        engine.open_io()
+        try:
+            # Files that landed while nothing was watching
+            for entry, _ in scan_images(engine.source_folder, engine.supported_formats):
+                debouncer.touch(entry.path)
+            with ClassificationStage(engine.workers, engine.cache, metrics=engine.metrics,
+                                     classifier=engine.classifier) as classifier, engine.tagger:
+                while not self.stop_event.is_set():
+                    timeout = debouncer.timeout()
+                    timeout = 1.0 if timeout is None else min(max(timeout, 0.05), 1.0)
+                    for path in watcher.poll(timeout):
+                        debouncer.touch(path)
+                    ready = debouncer.ready()
+                    if ready:
+                        self.distribute(ready, classifier)
+        finally:
+            watcher.close()
+            engine.close_io()
+            engine.close_cache()
+            engine.progress_channel.close()
+        return engine.stats
+
+    def distribute(self, paths, classifier):
+        """Route, classify, move and tag one batch of settled files."""
+        engine = self.engine
+        with engine.metrics.stage('watch_batch'):
+            # Files that are not images, or are cut short, stay where they landed
+            paths = [image_path for image_path, header in zip(paths, engine.read_headers(paths))
+                     if self.check(image_path, header)]
+            for image_path in paths:
+                classifier.submit(image_path)
+            for file_id, group_files in sorted(engine.group(paths).items()):
+                designer = self.router.route(file_id, len(group_files))
+                for image_path in group_files:
+                    self.handle(image_path, designer, classifier.result(image_path))
+            engine.tagger.flush()
+        engine.metrics.finish(engine.processed)
+        engine.save_metrics()
+
+    def check(self, image_path, header):
+        """Count and print a header problem, return whether the file can be split."""
+        if header.ok and not header.warning:
+            return True
+        image_file = os.path.basename(image_path)
+        if header.ok:
+            self.engine.stats['header_warnings'] += 1
+            print(f"Warning for {image_file}: {header.warning}", file=sys.stderr)
+            return True
+        self.engine.stats['unreadable_files'] += 1
+        print(f"Skipping {image_file}: {header.error}", file=sys.stderr)
+        return False
+
+    def handle(self, image_path, designer, background):
+        engine = self.engine
+        image_file = os.path.basename(image_path)
+        try:
+            dest_path = engine.move(image_path, designer)
+            tag_index = engine.count_background(background)
+            start = time.perf_counter()
+            engine.tagger.tag(dest_path, tag_index)
+            engine.metrics.observe('tag', time.perf_counter() - start)
+        except Exception as e:
+            print(f"Error processing {image_file}: {str(e)}", file=sys.stderr)
+            return
+        ext = os.path.splitext(image_file)[1].lower()
+        engine.stats['total_images'] += 1
+        engine.stats['extensions'][ext] = engine.stats['extensions'].get(ext, 0) + 1
+        engine.stats['designer_files'][designer_name(designer)] += 1
+        engine.processed += 1
+        engine.progress_channel.notify()
+        if self.file_callback:
+            self.file_callback(dest_path, designer_name(designer), background)
@@ -0,0 +1,75 @@
+"""
+The original ImageProcessor logic from main.py, without Qt, moves and tags.
+
+The engine is checked against these: which designer each file goes to and
+whether its background is white.
+"""
+import os
+
+from PIL import Image
+
+SUPPORTED_FORMATS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
+
+
+def extract_file_id(filename):
+    if len(filename) >= 13 and filename[:13].isdigit():
+        return filename[:13]
+    elif len(filename) >= 12:
+        return filename[:12]
+    return None
+
+
+def assign_designers(source_folder, num_designers):
+    """Return {path: designer index} the way ImageProcessor.run() distributed a folder."""
+    image_groups = {}
+    for root, _, files in os.walk(source_folder):
+        for file in files:
+            ext = os.path.splitext(file)[1].lower()
+            if ext in SUPPORTED_FORMATS:
+                file_id = extract_file_id(file)
+                if file_id:
+                    image_groups.setdefault(file_id, []).append(os.path.join(root, file))
+
+    sorted_groups = sorted(image_groups.items())
+    total_groups = len(sorted_groups)
+    groups_per_designer = total_groups // num_designers
+    extra_groups = total_groups % num_designers
+
+    designers = {}
+    for i, (file_id, group_files) in enumerate(sorted_groups):
+        if i < (groups_per_designer + 1) * extra_groups:
+            current_designer = i // (groups_per_designer + 1)
+        else:
+            current_designer = (i - extra_groups) // groups_per_designer
+        for image_path in group_files:
+            designers[image_path] = current_designer
+    return designers
+
+
+def is_white_background(image_path):
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            pixels = img.load()
+
+            is_left_white = True
+            for x in range(5):
+                for y in range(5):
+                    if pixels[x, y][:3] != (255, 255, 255):
+                        is_left_white = False
+                        break
+                if not is_left_white:
+                    break
+
+            is_right_white = True
+            for x in range(width - 5, width):
+                for y in range(5):
+                    if pixels[x, y][:3] != (255, 255, 255):
+                        is_right_white = False
+                        break
+                if not is_right_white:
+                    break
+
+            return is_left_white or is_right_white
+    except Exception:
+        return False
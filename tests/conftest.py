@@ -0,0 +1,79 @@
+import os
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from splitimg.common import DESIGNER_PREFIX, DUPLICATES_FOLDER
+from splitimg.engine import SplitEngine
+
+WHITE = (255, 255, 255)
+PIL_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.gif': 'GIF', '.tiff': 'TIFF'}
+
+
+def make_image(path, size=(64, 48), background=WHITE, product=(200, 30, 40), mode='RGB', **save_options):
+    """Write a product shot: a box in the middle of a plain background."""
+    width, height = size
+    img = Image.new('RGB', size, background)
+    ImageDraw.Draw(img).rectangle((width // 4, height // 4, width * 3 // 4, height * 3 // 4), fill=product)
+    if mode != 'RGB':
+        img = img.convert(mode)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ext = os.path.splitext(path)[1].lower()
+    img.save(path, PIL_FORMATS[ext], **save_options)
+    return path
+
+
+def make_shoot(folder, groups=30, seed=1):
+    """
+    A source folder of file-ID groups of one to four shots, with both ID
+    patterns, in two subfolders, as JPEG and PNG on white and grey.
+    Returns the paths.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for group in range(groups):
+        if group % 3:
+            file_id = str(4000000000000 + rng.randrange(10 ** 9))
+        else:
+            file_id = ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ23456789') for _ in range(12))
+        shoot = os.path.join(folder, f'shoot_{group % 2}')
+        for shot in range(rng.randint(1, 4)):
+            ext = rng.choice(['.jpg', '.png'])
+            background = WHITE if rng.random() < 0.6 else (120, 120, 120)
+            paths.append(make_image(os.path.join(shoot, f'{file_id}_{shot}{ext}'), background=background,
+                                    product=(rng.randrange(256), rng.randrange(256), rng.randrange(256))))
+    return paths
+
+
+def split_engine(folder, num_designers, **options):
+    """A SplitEngine with the test defaults: no tags, one process, CSV report, no metrics file."""
+    options = {'apply_tags': False, 'workers': 1, 'report_format': 'csv', 'metrics_format': None, **options}
+    return SplitEngine(str(folder), num_designers, **options)
+
+
+def placement(folder):
+    """{file name: output folder name} for every file in the Designer and Duplicates folders."""
+    placed = {}
+    for name in os.listdir(folder):
+        if name.startswith(DESIGNER_PREFIX) or name == DUPLICATES_FOLDER:
+            for image_file in os.listdir(os.path.join(folder, name)):
+                placed[image_file] = name
+    return placed
+
+
+def source_files(folder):
+    """Relative paths of the files left outside the output folders."""
+    files = []
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = [name for name in dirs if not name.startswith(DESIGNER_PREFIX) and name != DUPLICATES_FOLDER]
+        files.extend(os.path.relpath(os.path.join(root, name), folder) for name in names
+                     if os.path.splitext(name)[1].lower() in PIL_FORMATS)
+    return sorted(files)
+
+
+@pytest.fixture
+def shoot(tmp_path):
+    folder = tmp_path / 'shoot'
+    make_shoot(str(folder))
+    return folder
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from splitimg.assign import assign_contiguous, assign_stable, designer_workloads
+from splitimg.common import designer_name
+
+from . import baseline
+from .conftest import make_shoot, placement, split_engine
+
+
+@pytest.mark.parametrize('num_designers', [1, 3, 7, 40])
+def test_plan_matches_baseline(tmp_path, num_designers):
+    folder = tmp_path / 'shoot'
+    make_shoot(str(folder), groups=25)
+    expected = baseline.assign_designers(str(folder), num_designers)
+
+    engine = split_engine(folder, num_designers)
+    image_files = engine.scan()
+    plan = engine.plan(engine.assign(engine.group(image_files)), image_files)
+
+    assert dict((image_path, designer) for designer, image_path in plan) == expected
+
+
+def test_run_moves_files_where_baseline_assigns_them(shoot):
+    expected = {os.path.basename(image_path): designer_name(designer)
+                for image_path, designer in baseline.assign_designers(str(shoot), 4).items()}
+
+    stats = split_engine(shoot, 4).run()
+
+    assert placement(shoot) == expected
+    assert stats['total_images'] == len(expected)
+    assert sum(stats['designer_files'].values()) == len(expected)
+
+
+def test_contiguous_blocks_of_sorted_ids():
+    groups = {f'{4000000000000 + i}': [f'{4000000000000 + i}_0.jpg'] for i in (5, 1, 4, 2, 3, 0, 6)}
+
+    assignments = assign_contiguous(groups, 3)
+
+    assert [file_id for _, file_id, _ in assignments] == sorted(groups)
+    assert [designer for designer, _, _ in assignments] == [0, 0, 0, 1, 1, 2, 2]
+    totals, _ = designer_workloads(assignments, 3)
+    assert [total['groups'] for total in totals] == [3, 2, 2]
+
+
+def test_stable_assignment_keeps_existing_groups():
+    groups = {f'ID{i:010d}': [f'ID{i:010d}_0.jpg'] for i in range(200)}
+    before = {file_id: designer for designer, file_id, _ in assign_stable(groups, 5)}
+
+    groups.update({f'NEW{i:09d}': [f'NEW{i:09d}_0.jpg'] for i in range(50)})
+    after = {file_id: designer for designer, file_id, _ in assign_stable(groups, 5)}
+
+    assert all(after[file_id] == designer for file_id, designer in before.items())
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+from PIL import Image
+
+from splitimg.classify import BackgroundClassifier, classify_timed, is_white_background
+from splitimg.common import BACKGROUND_GRAY, BACKGROUND_OTHER, BACKGROUND_WHITE
+from splitimg.pipeline import ClassificationStage
+
+from . import baseline
+from .conftest import WHITE, make_image
+
+SIZES = [(5, 5), (64, 48), (333, 517), (1200, 40)]
+BACKGROUNDS = [WHITE, (254, 255, 255), (250, 250, 250), (0, 0, 0), (128, 128, 128)]
+FORMATS = [('.jpg', 'RGB'), ('.png', 'RGB'), ('.png', 'RGBA')]
+
+
+def corner_image(path, size, left, right, mode='RGB', noise=False):
+    """An image whose top-left and top-right 5x5 corners have the given colours over a busy middle."""
+    width, height = size
+    img = Image.new('RGB', size, (90, 140, 200))
+    if noise:
+        rng = random.Random(size[0] * size[1])
+        img.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(width * height)])
+    img.paste(left, (0, 0, min(5, width), min(5, height)))
+    img.paste(right, (max(0, width - 5), 0, width, min(5, height)))
+    if mode == 'RGBA':
+        img = img.convert('RGBA')
+        # Fully transparent white still counts as white, only RGB is compared
+        img.putpixel((0, 0), (255, 255, 255, 0))
+    img.save(path, 'JPEG' if path.endswith('.jpg') else 'PNG', **({'quality': 95} if path.endswith('.jpg') else {}))
+    return path
+
+
+@pytest.mark.parametrize('ext,mode', FORMATS)
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('left,right', [(WHITE, WHITE), (WHITE, (10, 20, 30)), ((10, 20, 30), WHITE),
+                                        ((10, 20, 30), (10, 20, 30)), ((254, 254, 254), (255, 255, 254))])
+def test_matches_baseline(tmp_path, ext, mode, size, left, right):
+    path = corner_image(str(tmp_path / f'1234567890123_0{ext}'), size, left, right, mode, noise=size[0] > 5)
+
+    expected = baseline.is_white_background(path)
+
+    assert is_white_background(path) == expected
+    assert (classify_timed(path)[0] == BACKGROUND_WHITE) == expected
+
+
+@pytest.mark.parametrize('ext,mode', FORMATS)
+@pytest.mark.parametrize('background', BACKGROUNDS)
+def test_product_shots_match_baseline(tmp_path, ext, mode, background):
+    path = make_image(str(tmp_path / f'1234567890123_0{ext}'), size=(800, 600), background=background, mode=mode)
+
+    assert is_white_background(path) == baseline.is_white_background(path)
+
+
+def test_stage_matches_baseline_in_batches(tmp_path):
+    paths = [make_image(str(tmp_path / f'{4000000000000 + i}_0{ext}'), background=background, mode=mode)
+             for i, ((ext, mode), background) in enumerate((fmt, background) for fmt in FORMATS
+                                                           for background in BACKGROUNDS)]
+
+    with ClassificationStage(workers=1, batch_size=4) as classifier:
+        for image_path in paths:
+            classifier.submit(image_path)
+        results = [classifier.result(image_path) for image_path in paths]
+
+    assert [result == BACKGROUND_WHITE for result in results] == [baseline.is_white_background(p) for p in paths]
+
+
+def test_unreadable_file_is_not_white(tmp_path):
+    path = tmp_path / '1234567890123_0.jpg'
+    path.write_bytes(b'not an image')
+
+    assert classify_timed(str(path))[0] == BACKGROUND_OTHER
+    assert not baseline.is_white_background(str(path))
+
+
+def test_tolerance_and_gray(tmp_path):
+    near_white = make_image(str(tmp_path / '1234567890123_0.png'), background=(250, 250, 250))
+    gray = make_image(str(tmp_path / '1234567890123_1.png'), background=(130, 126, 128))
+
+    assert classify_timed(near_white)[0] == BACKGROUND_OTHER
+    assert classify_timed(near_white, BackgroundClassifier(tolerance=8))[0] == BACKGROUND_WHITE
+    assert classify_timed(gray)[0] == BACKGROUND_OTHER
+    assert classify_timed(gray, BackgroundClassifier(gray=True))[0] == BACKGROUND_GRAY
@@ -0,0 +1,65 @@
+import shutil
+
+from PIL import Image, ImageDraw, TiffImagePlugin
+
+from splitimg.classify import BackgroundClassifier
+from splitimg.dedup import find_duplicates, hash_batch, image_hashes
+
+from .conftest import make_image, placement, split_engine
+
+
+def hashed(paths, classifier=None):
+    return [(image_path, digest, dhash, colour)
+            for image_path, (digest, dhash, colour, _) in zip(paths, hash_batch(paths, classifier))]
+
+
+def save_with_preview(path, img, preview_size):
+    """A TIFF holding `img` and a reduced-resolution copy of it, as cameras and Photoshop write them."""
+    with TiffImagePlugin.AppendingTiffWriter(path, new=True) as tf:
+        img.save(tf, 'TIFF')
+        tf.newFrame()
+        img.resize(preview_size, Image.Resampling.BOX).save(tf, 'TIFF', tiffinfo={254: 1})
+    return path
+
+
+def test_shots_of_one_file_id_are_not_duplicates(tmp_path):
+    first = make_image(str(tmp_path / '1234567890123_0.jpg'))
+    same_id = str(tmp_path / '1234567890123_1.jpg')
+    other_id = str(tmp_path / '1234567890124_0.jpg')
+    similar_same_id = make_image(str(tmp_path / '1234567890123_2.png'))
+    shutil.copy(first, same_id)
+    shutil.copy(first, other_id)
+
+    duplicates = find_duplicates(hashed([first, same_id, similar_same_id, other_id]))
+
+    assert duplicates == [(other_id, first, 'Identical', 0)]
+
+
+def test_angles_of_one_product_stay_out_of_the_duplicates_folder(tmp_path):
+    for shot in range(3):
+        make_image(str(tmp_path / f'1234567890123_{shot}.jpg'), size=(90, 80))
+    make_image(str(tmp_path / '1234567890124_0.png'), size=(90, 80), background=(20, 90, 20), product=(250, 250, 0))
+
+    stats = split_engine(tmp_path, 2, dedup='folder').run()
+
+    assert stats['duplicates'] == 0
+    assert sorted(placement(tmp_path).values()) == ['Designer_1'] * 3 + ['Designer_2']
+
+
+def test_tiff_is_hashed_from_its_preview_within_the_memory_limit(tmp_path):
+    img = Image.new('RGB', (1200, 900), (255, 255, 255))
+    ImageDraw.Draw(img).rectangle((300, 200, 800, 700), fill=(200, 30, 40))
+    full = str(tmp_path / '1234567890123_0.tiff')
+    img.save(full, 'TIFF')
+    with_preview = save_with_preview(str(tmp_path / '1234567890124_0.tiff'), img, (120, 90))
+    small_limit = BackgroundClassifier(memory_limit=2 ** 20)
+
+    _, expected, colour = image_hashes(full)
+    _, over_limit, _ = image_hashes(full, small_limit)
+    _, from_preview, preview_colour = image_hashes(with_preview, small_limit)
+
+    assert over_limit is None
+    assert from_preview is not None
+    assert bin(from_preview ^ expected).count('1') <= 4
+    assert max(abs(a - b) for a, b in zip(colour, preview_colour)) <= 2
+    assert image_hashes(with_preview, BackgroundClassifier(memory_limit=2 ** 20, previews=False))[1] is None
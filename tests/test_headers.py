@@ -0,0 +1,45 @@
+import pytest
+
+from splitimg.headers import JPEG_EOI_WINDOW, SEARCH_CHUNK, read_header
+
+from .conftest import make_image
+
+
+@pytest.fixture
+def jpeg(tmp_path):
+    path = make_image(str(tmp_path / '1234567890123_0.jpg'), size=(200, 150))
+    with open(path, 'rb') as f:
+        return path, f.read()
+
+
+@pytest.mark.parametrize('trailer', [b'', b'\x00' * 100, b'\x00' * (SEARCH_CHUNK - 1), b'EXIF trailer' * 20000],
+                         ids=['none', 'padding', 'across-chunks', 'large'])
+def test_trailers_after_the_end_marker_are_not_truncation(jpeg, trailer):
+    path, data = jpeg
+    with open(path, 'wb') as f:
+        f.write(data + trailer)
+
+    header = read_header(path)
+
+    assert header.ok
+    assert header.warning is None
+
+
+def test_cut_short_jpeg_is_flagged(jpeg):
+    path, data = jpeg
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    header = read_header(path)
+
+    assert header.ok
+    assert header.warning == 'truncated, no end of image marker'
+    assert (header.width, header.height) == (200, 150)
+
+
+def test_end_marker_beyond_the_window_is_not_searched_for(jpeg):
+    path, data = jpeg
+    with open(path, 'wb') as f:
+        f.write(data + b'\x00' * (JPEG_EOI_WINDOW + 1))
+
+    assert read_header(path).warning == 'truncated, no end of image marker'
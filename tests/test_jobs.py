@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+
+from splitimg import cli
+from splitimg.aio import AsyncIO
+from splitimg.jobs import JobQueue
+
+from .conftest import make_shoot, placement, source_files
+
+
+def test_views_on_the_same_mount_share_its_limit(tmp_path):
+    io_limits = {str(tmp_path): 3}
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    with AsyncIO(64, io_limits) as io:
+        first = io.view([str(tmp_path / 'monday')])
+        second = io.view([str(tmp_path / 'tuesday'), str(tmp_path / 'out')])
+        futures = [view.submit(call) for _ in range(20) for view in (first, second)]
+        for future in futures:
+            future.result()
+
+    assert first is second
+    assert first.limit == 3
+    assert max(peak) == 3
+
+
+def test_jobs_share_one_io_layer_and_start_by_priority(tmp_path):
+    folders = [tmp_path / name for name in ('monday', 'urgent', 'tuesday')]
+    for seed, folder in enumerate(folders):
+        make_shoot(str(folder), groups=8, seed=seed)
+
+    queue = JobQueue(max_jobs=1, workers=1, io_limits={str(tmp_path): 2})
+    # Queued before the queue starts, so the priority decides the order alone
+    jobs = [queue.submit(str(folder), 2, priority, apply_tags=False, report_format='csv', metrics_format=None)
+            for folder, priority in zip(folders, (0, 5, 0))]
+    with queue:
+        queue.join()
+
+    assert [job.state for job in jobs] == ['done'] * 3
+    assert sorted(jobs, key=lambda job: job.started_at) == [jobs[1], jobs[0], jobs[2]]
+    assert jobs[0].engine.shared_io is jobs[1].engine.shared_io
+    assert jobs[0].engine.shared_io.limit == 2
+    for folder, job in zip(folders, jobs):
+        assert source_files(folder) == []
+        assert len(placement(folder)) == job.stats['total_images']
+
+
+def test_events_from_job_threads_stay_on_their_own_lines(capsys):
+    fields = {'stats': {f'key_{i}': 'x' * 200 for i in range(50)}}
+    threads = [threading.Thread(target=lambda job=job: [cli.emit('progress', job=job, **fields) for _ in range(20)])
+               for job in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert len(lines) == 160
+    assert all(json.loads(line)['stats'] == fields['stats'] for line in lines)
@@ -0,0 +1,144 @@
+import json
+import os
+
+import pytest
+
+from splitimg.journal import JOURNAL_NAME, MoveJournal
+
+from .conftest import make_shoot, placement, source_files, split_engine
+
+
+class Crash(Exception):
+    pass
+
+
+def crash_after(engine, moves):
+    """Make the engine stop as if it crashed once `moves` files were moved."""
+    finish_move = engine.finish_move
+    finished = []
+
+    def crashing_finish_move(*args):
+        if len(finished) == moves:
+            raise Crash()
+        finished.append(args)
+        return finish_move(*args)
+
+    engine.finish_move = crashing_finish_move
+
+
+def test_resume_finishes_the_recorded_plan(tmp_path):
+    expected_folder = tmp_path / 'expected'
+    folder = tmp_path / 'shoot'
+    make_shoot(str(expected_folder))
+    make_shoot(str(folder))
+    expected_stats = split_engine(expected_folder, 3).run()
+
+    engine = split_engine(folder, 3)
+    crash_after(engine, 10)
+    with pytest.raises(Crash):
+        engine.run()
+
+    state = MoveJournal(str(folder)).load()
+    assert state is not None
+    assert state.num_designers == 3
+    assert len(state.plan) == expected_stats['total_images']
+    assert len(state.done) >= 10
+    assert source_files(folder)
+
+    # The designer count of the journal wins over the one given
+    stats = split_engine(folder, 5).run()
+
+    assert source_files(folder) == []
+    assert placement(folder) == placement(expected_folder)
+    for key in ('total_images', 'white_background', 'non_white_background', 'designer_files', 'workloads'):
+        assert stats[key] == expected_stats[key]
+    assert MoveJournal(str(folder)).load() is None
+
+
+def test_resume_does_not_rescan(tmp_path, shoot):
+    engine = split_engine(shoot, 2)
+    crash_after(engine, 3)
+    with pytest.raises(Crash):
+        engine.run()
+    # Files that land after the crash wait for the next split
+    late = shoot / 'shoot_0' / '9999999999999_0.png'
+    late.write_bytes((shoot / 'shoot_0' / os.listdir(shoot / 'shoot_0')[0]).read_bytes())
+
+    split_engine(shoot, 2).run()
+
+    assert source_files(shoot) == [os.path.join('shoot_0', late.name)]
+
+
+def test_torn_last_record_is_ignored(tmp_path, shoot):
+    engine = split_engine(shoot, 2)
+    crash_after(engine, 5)
+    with pytest.raises(Crash):
+        engine.run()
+    journal_path = shoot / JOURNAL_NAME
+    done = len(MoveJournal(str(shoot)).load().done)
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "move", "ind')
+
+    state = MoveJournal(str(shoot)).load()
+
+    assert state is not None
+    assert len(state.done) == done
+
+
+def test_finished_or_broken_journals_are_not_resumed(tmp_path):
+    journal = MoveJournal(str(tmp_path))
+    image_path = str(tmp_path / '1234567890123_0.jpg')
+    journal.start(2, [(1, image_path)])
+    journal.record(0, 1)
+    journal.close()
+    assert MoveJournal(str(tmp_path)).load().done == {0: 1}
+
+    journal.open()
+    journal.finish()
+    assert MoveJournal(str(tmp_path)).load() is None
+
+    with open(journal.path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'type': 'plan', 'version': 1, 'num_designers': 2, 'entries': 2}) + '\n')
+        f.write(json.dumps({'type': 'entry', 'designer': 0, 'path': '1234567890123_0.jpg'}) + '\n')
+    assert MoveJournal(str(tmp_path)).load() is None
+
+
+def test_no_resume_starts_over(tmp_path, shoot):
+    engine = split_engine(shoot, 2)
+    crash_after(engine, 4)
+    with pytest.raises(Crash):
+        engine.run()
+    # Moves run ahead of finish_move(), so count what actually moved
+    left = len(source_files(shoot))
+
+    stats = split_engine(shoot, 3, resume=False).run()
+
+    assert stats['total_images'] == left
+    assert set(placement(shoot).values()) <= {'Designer_1', 'Designer_2', 'Designer_3'}
+    assert source_files(shoot) == []
+
+
+def test_resume_keeps_the_recorded_settings(tmp_path):
+    expected_folder = tmp_path / 'expected'
+    folder = tmp_path / 'shoot'
+    output = tmp_path / 'out'
+    make_shoot(str(expected_folder))
+    make_shoot(str(folder))
+    settings = dict(balance='bytes', stable=True, designer_weights=[1.0, 2.0, 1.0])
+    expected_stats = split_engine(expected_folder, 3, **settings).run()
+
+    engine = split_engine(folder, 3, output_folder=str(output), **settings)
+    crash_after(engine, 6)
+    with pytest.raises(Crash):
+        engine.run()
+    state = MoveJournal(str(folder)).load()
+    assert state.settings == dict(output_folder=str(output), **settings)
+
+    # Resumed with the defaults: the source folder as output and group balance
+    stats = split_engine(folder, 3).run()
+
+    assert source_files(folder) == []
+    assert placement(output) == placement(expected_folder)
+    assert stats['balance_mode'] == 'bytes'
+    assert stats['workloads'] == expected_stats['workloads']
+    assert stats['imbalance_ratio'] == expected_stats['imbalance_ratio']
@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from splitimg import cli
+from splitimg.plan import load_plan, read_plan_header
+
+from .conftest import make_shoot, placement, source_files, split_engine
+
+
+def plan_lines(path):
+    """The plan's records with the header's creation time left out."""
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    records[0].pop('created')
+    return records
+
+
+def test_plan_then_apply_matches_a_run(tmp_path):
+    expected_folder = tmp_path / 'expected'
+    folder = tmp_path / 'shoot'
+    make_shoot(str(expected_folder))
+    make_shoot(str(folder))
+    expected_stats = split_engine(expected_folder, 3).run()
+    plan_path = str(tmp_path / 'split.plan')
+    before = source_files(folder)
+
+    plan_stats = split_engine(folder, 3).write_plan(plan_path)
+
+    # A dry run leaves the folder as it was
+    assert source_files(folder) == before
+    assert sorted(os.listdir(folder)) == ['shoot_0', 'shoot_1']
+    assert plan_stats['total_images'] == expected_stats['total_images']
+    assert plan_stats['designer_files'] == expected_stats['designer_files']
+
+    stats = split_engine(folder, 3, plan_file=plan_path).run()
+
+    assert source_files(folder) == []
+    assert placement(folder) == placement(expected_folder)
+    for key in ('total_images', 'white_background', 'non_white_background', 'designer_files'):
+        assert stats[key] == expected_stats[key]
+    assert stats['plan_conflicts'] == 0
+
+
+def test_changed_and_gone_files_are_left_in_place(tmp_path, shoot):
+    plan_path = str(tmp_path / 'split.plan')
+    split_engine(shoot, 2).write_plan(plan_path)
+    entries = load_plan(plan_path).entries
+    changed = shoot / entries[0][1]
+    gone = shoot / entries[1][1]
+    with open(changed, 'ab') as f:
+        f.write(b'\0')
+    os.remove(gone)
+
+    stats = split_engine(shoot, 2, plan_file=plan_path).run()
+
+    assert stats['plan_conflicts'] == 2
+    assert stats['total_images'] == len(entries) - 2
+    assert source_files(shoot) == [entries[0][1]]
+
+
+def test_plans_of_the_same_folder_are_identical(tmp_path, shoot):
+    first = str(tmp_path / 'first.plan')
+    second = str(tmp_path / 'second.plan')
+
+    split_engine(shoot, 4).write_plan(first)
+    split_engine(shoot, 4).write_plan(second)
+
+    assert plan_lines(first) == plan_lines(second)
+
+
+def test_read_plan_header_rejects_other_files(tmp_path):
+    not_json = tmp_path / 'notes.txt'
+    not_json.write_text('designer notes\n', encoding='utf-8')
+    journal_like = tmp_path / 'journal.plan'
+    journal_like.write_text(json.dumps({'type': 'plan', 'version': 99}) + '\n', encoding='utf-8')
+
+    for path in (not_json, journal_like):
+        with pytest.raises(ValueError):
+            read_plan_header(str(path))
+
+
+def test_plan_of_another_folder_is_refused(tmp_path, shoot, capsys):
+    plan_path = str(tmp_path / 'split.plan')
+    split_engine(shoot, 2).write_plan(plan_path)
+    other = tmp_path / 'other'
+    make_shoot(str(other))
+    before = source_files(other)
+
+    with pytest.raises(ValueError, match='the plan was made for'):
+        split_engine(other, 2, plan_file=plan_path).run()
+    # A trailing slash is still the folder the plan was made for
+    split_engine(str(shoot) + os.sep, 2, plan_file=plan_path).run()
+
+    assert source_files(other) == before
+    assert not os.path.exists(other / 'Designer_1')
+    assert source_files(shoot) == []
+    assert cli.main([str(other), '2', '--apply', plan_path]) == 2
+    assert 'the plan was made for' in capsys.readouterr().err
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from splitimg.common import SUPPORTED_FORMATS
+from splitimg.scanner import is_pruned_dir
+from splitimg.watch import InotifyWatcher, PollingWatcher
+
+from .conftest import make_image, placement, source_files, split_engine
+
+
+@pytest.mark.parametrize('suffix', ['', '/', '//', '/.'])
+def test_output_folders_are_pruned_however_the_source_is_written(tmp_path, suffix):
+    source_folder = str(tmp_path) + suffix
+
+    assert is_pruned_dir(os.path.join(str(tmp_path), 'Designer_1'), source_folder)
+    assert is_pruned_dir(os.path.join(str(tmp_path), 'Duplicates'), source_folder)
+    assert is_pruned_dir(os.path.join(str(tmp_path), 'shoot', '.thumbs'), source_folder)
+    assert not is_pruned_dir(os.path.join(str(tmp_path), 'shoot'), source_folder)
+    assert not is_pruned_dir(os.path.join(str(tmp_path), 'shoot', 'Designer_1'), source_folder)
+
+
+def test_second_run_with_trailing_slash_finds_nothing(shoot):
+    stats = split_engine(str(shoot) + os.sep, 3).run()
+    placed = placement(shoot)
+
+    again = split_engine(str(shoot) + os.sep, 3).run()
+
+    assert stats['total_images'] == len(placed)
+    assert again['total_images'] == 0
+    assert placement(shoot) == placed
+    assert source_files(shoot) == []
+
+
+def test_watchers_ignore_designer_folders_with_trailing_slash(tmp_path):
+    try:
+        watcher = InotifyWatcher(str(tmp_path) + os.sep, SUPPORTED_FORMATS)
+    except OSError:
+        pytest.skip("inotify is not available")
+    try:
+        assert watcher.source_folder == str(tmp_path)
+        os.mkdir(tmp_path / 'Designer_1')
+        os.mkdir(tmp_path / 'shoot')
+        assert watcher.poll(1.0) == []
+        make_image(str(tmp_path / 'Designer_1' / '1234567890123_0.jpg'))
+        landed = make_image(str(tmp_path / 'shoot' / '1234567890124_0.jpg'))
+        changed = []
+        for _ in range(5):
+            changed.extend(watcher.poll(0.2))
+    finally:
+        watcher.close()
+
+    assert changed == [landed]
+    assert sorted(watcher.folders.values()) == [str(tmp_path), str(tmp_path / 'shoot')]
+    assert PollingWatcher(str(tmp_path) + os.sep, SUPPORTED_FORMATS).source_folder == str(tmp_path)